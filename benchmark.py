@@ -0,0 +1,490 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+from telegram.request import BaseRequest
+
+try:
+    import resource
+except ImportError:
+    # Windows: пиковый RSS не сообщается
+    resource = None
+
+# Воспроизводимые замеры бота: рендеринг (каждый метод create_*), расчет
+# схем и поиск цвета, размер и время каждого кодировщика изображений,
+# а также полный путь обработки обновлений через
+# Application с Bot API в том же процессе (без сети). Результаты
+# сохраняются в JSON, два файла можно сравнить и найти регрессии.
+
+# Цвета и схемы замеров фиксированы - результаты разных запусков сравнимы
+BENCH_COLOR = 'blue'
+BENCH_SCHEME = 'square'
+
+# Регрессия: ops/s упали или p99 вырос больше чем на эту долю
+REGRESSION_THRESHOLD = 0.10
+# Рост p99 меньше этого (мс) - шум таймера, а не регрессия
+LATENCY_NOISE_MS = 0.05
+
+
+def peak_rss():
+    """Пиковый RSS процесса в байтах (None, если платформа его не сообщает)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(sorted_values, q):
+    """Процентиль q (0..1) отсортированного списка (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, elapsed, produced=0, **extra):
+    """Итог замера: ops/s, p50/p99 в мс, произведенные байты и пиковый RSS"""
+    latencies = sorted(latencies)
+    return {
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'bytes': produced,
+        'peak_rss': peak_rss(),
+        **extra,
+    }
+
+
+def _size(result):
+    # Методы create_* возвращают bytes, create_palette_batch - их список
+    if isinstance(result, bytes):
+        return len(result)
+    if isinstance(result, list):
+        return sum(_size(item) for item in result)
+    return 0
+
+
+def measure(func, iterations, circle=None):
+    """Вызвать func iterations раз: итог замера (байты - суммарный размер изображений)
+
+    Для circle дополнительно разделяется время отрисовки и кодирования
+    (мс на вызов) и записываются кодировщики, которыми сжимались изображения.
+    """
+    # Первый вызов не замеряется: импорты, ленивые таблицы, кэш шрифтов
+    func()
+
+    stages = {'draw': 0.0, 'encode': 0.0}
+    encoders = set()
+
+    def observe(renderer, draw_seconds, encode_seconds):
+        stages['draw'] += draw_seconds
+        stages['encode'] += encode_seconds
+        encoders.add(circle.encoders.spec(renderer))
+
+    if circle is not None:
+        circle.observe = observe
+
+    latencies = []
+    produced = 0
+    start = time.perf_counter()
+    try:
+        for _ in range(iterations):
+            call_start = time.perf_counter()
+            result = func()
+            latencies.append(time.perf_counter() - call_start)
+            produced += _size(result)
+    finally:
+        if circle is not None:
+            circle.observe = None
+
+    if circle is None:
+        return summarize(latencies, time.perf_counter() - start, produced)
+    return summarize(
+        latencies, time.perf_counter() - start, produced,
+        encoder=','.join(sorted(encoders)) or None,
+        draw_ms=stages['draw'] * 1000 / iterations if iterations else 0.0,
+        encode_ms=stages['encode'] * 1000 / iterations if iterations else 0.0,
+    )
+
+
+def render_cases(circle):
+    """Замеры рендеринга: {имя: функция}. Кэш у circle выключен - каждый вызов рисует и кодирует"""
+    scheme = circle.get_scheme(BENCH_COLOR, BENCH_SCHEME)
+    scheme_name = circle.schemes[BENCH_SCHEME]
+    palettes = list(circle.get_all_schemes(BENCH_COLOR).values())
+    return {
+        'create_itten_circle_image': lambda: circle.create_itten_circle_image(),
+        'create_itten_circle_image[2048]': lambda: circle.create_itten_circle_image(2048),
+        'create_extended_palette_image': lambda: circle.create_extended_palette_image(),
+        'create_extended_palette_image[numpy]': lambda: circle.create_extended_palette_image('numpy'),
+        'create_color_palette_image': lambda: circle.create_color_palette_image(scheme, scheme_name),
+        'create_color_palette_image[numpy]': lambda: circle.create_color_palette_image(scheme, scheme_name, 'numpy'),
+        'create_shades_palette': lambda: circle.create_shades_palette(BENCH_COLOR),
+        'create_shades_palette[numpy]': lambda: circle.create_shades_palette(BENCH_COLOR, 'numpy'),
+        'create_palette_batch': lambda: circle.create_palette_batch(palettes),
+        'create_scheme_sheet': lambda: circle.create_scheme_sheet(BENCH_COLOR),
+    }
+
+
+def lookup_cases(circle):
+    """Замеры расчета схем и поиска цвета: {имя: функция}"""
+    names = list(circle.colors)
+    scheme_types = list(circle.schemes)
+    state = {'i': 0}
+
+    def next_index():
+        state['i'] += 1
+        return state['i']
+
+    def get_scheme():
+        i = next_index()
+        return circle.get_scheme(names[i % len(names)], scheme_types[i % len(scheme_types)])
+
+    def get_color_info():
+        return circle.get_color_info(names[next_index() % len(names)])
+
+    return {
+        'get_scheme': get_scheme,
+        'get_all_schemes': lambda: circle.get_all_schemes(names[next_index() % len(names)]),
+        'get_exact_schemes': lambda: circle.get_exact_schemes((next_index() % 256, 90, 200)),
+        'get_color_info': get_color_info,
+        'get_color_info[miss]': lambda: circle.get_color_info('not_a_color'),
+    }
+
+
+def run_micro(render_iterations, lookup_iterations, cached=False):
+    """Замеры методов IttenColorCircle: {имя: итог}"""
+    from color_circle import IttenColorCircle
+    from render_cache import RenderCache
+
+    # max_bytes=0 - кэш ничего не хранит, замеряется сам рендеринг
+    circle = IttenColorCircle(render_cache=RenderCache() if cached else RenderCache(max_bytes=0))
+    results = {}
+    for name, func in render_cases(circle).items():
+        results[name] = measure(func, render_iterations, circle)
+    for name, func in lookup_cases(circle).items():
+        results[name] = measure(func, lookup_iterations)
+    return results
+
+
+def run_encoders(repeat, specs=None):
+    """Каждый кодировщик на изображении каждого рендерера: {рендерер[кодировщик]: байт и мс}"""
+    from color_circle import IttenColorCircle
+    from image_encoders import ENCODERS, benchmark, sample_images
+    from render_cache import RenderCache
+
+    circle = IttenColorCircle(render_cache=RenderCache(max_bytes=0))
+    results = benchmark(sample_images(circle, BENCH_COLOR, BENCH_SCHEME), specs or list(ENCODERS), repeat)
+    return {
+        f"{renderer}[{spec}]": {'encoder': spec, 'bytes': size, 'encode_ms': elapsed}
+        for (renderer, spec), (size, elapsed) in results.items()
+    }
+
+
+# Обновления одного пользователя: полный сценарий построения схемы и
+# прочие частые действия. Поля - как в JSON от Telegram (getUpdates, webhook)
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': 'User', 'language_code': 'ru'}
+
+
+def message_update(update_id, user_id, text):
+    """Обновление с текстовым сообщением (команды размечаются как в Telegram)"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': 'User'},
+        'from': _user(user_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id, user_id, data, message=None):
+    """Обновление с нажатием кнопки под сообщением бота (message - сообщение с кнопкой)"""
+    if message is None:
+        message = {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': 'User'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Fake'},
+            'text': '🎨',
+        }
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': message,
+        },
+    }
+
+
+def session_updates(codec, user_id, first_update_id, color_name, scheme_type):
+    """Сценарий пользователя: /start, /scheme, выбор цвета, выбор схемы"""
+    from callback_codec import PICK_COLOR, SHOW_SCHEME
+
+    return [
+        message_update(first_update_id, user_id, '/start'),
+        message_update(first_update_id + 1, user_id, '/scheme'),
+        callback_update(first_update_id + 2, user_id, codec.encode(PICK_COLOR, color_name)),
+        callback_update(first_update_id + 3, user_id, codec.encode(SHOW_SCHEME, color_name, scheme_type)),
+    ]
+
+
+def synthetic_updates(codec, circle, users):
+    """Синтетический поток обновлений: сценарии users пользователей и ввод цвета текстом"""
+    names = list(circle.colors)
+    scheme_types = list(circle.schemes)
+    updates = []
+    update_id = 1
+    for i in range(users):
+        user_id = 100000 + i
+        updates += session_updates(
+            codec, user_id, update_id, names[i % len(names)], scheme_types[i % len(scheme_types)]
+        )
+        updates.append(message_update(update_id + 4, user_id, ('синий', '#3a7bd5', 'rgb(200, 40, 90)', 'blu')[i % 4]))
+        update_id += 5
+    return updates
+
+
+def load_updates(path):
+    """Записанные обновления из файла: по JSON-объекту Update в строке"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class InProcessRequest(BaseRequest):
+    """Запросы бота к FakeBotApi в том же процессе, без сети; считает загруженные байты"""
+
+    def __init__(self, api):
+        self.api = api
+        self.uploaded_bytes = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        body = b''
+        if request_data is not None:
+            body = request_data.json_payload
+            if request_data.contains_files:
+                self.uploaded_bytes += sum(len(content) for _, content, _ in request_data.multipart_data.values())
+        status, payload = await self.api.call(url.rsplit('/', 1)[-1], body)
+        return status, json.dumps(payload).encode('utf-8')
+
+
+def prepare_bot_env():
+    """Настройки для импорта bot.py в замерах: состояние в памяти, без файлов на диске и метрик
+
+    Значения задаются всегда - окружение (.env) не должно менять условия замера
+    """
+    os.environ['USER_STATE_BACKEND'] = 'memory'
+    os.environ['FILE_ID_REGISTRY'] = ''
+    os.environ['RENDER_CACHE_DIR'] = ''
+    os.environ.pop('METRICS_PORT', None)
+
+
+async def run_handlers(raw_updates, concurrency=8, passes=2, cold=False):
+    """Прогнать обновления через Application с Bot API в том же процессе
+
+    Первый проход прогревает кэши и не замеряется (если passes > 1).
+    cold=True - перед каждым проходом забыть file_id: каждое изображение загружается заново.
+    Возвращает итог последнего прохода: ops/s, p50/p99 по обновлениям, загруженные байты, ошибки
+    """
+    prepare_bot_env()
+    import bot
+    from fake_bot_api import FakeBotApi
+    from file_id_registry import FileIdRegistry
+    from telegram import Update
+    from telegram.ext import Application
+    from user_state import MemoryStateBackend, UserStateStore
+
+    # Хранилища - свои для замера, а не созданные при импорте bot.py
+    bot.file_id_registry = FileIdRegistry(None)
+    bot.user_state = UserStateStore(MemoryStateBackend())
+
+    api = FakeBotApi()
+    request = InProcessRequest(api)
+    application = (
+        Application.builder().token('1:benchmark').request(request)
+        .get_updates_request(InProcessRequest(api)).updater(None).build()
+    )
+    bot.add_handlers(application)
+
+    errors = []
+
+    async def count_error(update, context):
+        errors.append(context.error)
+    application.add_error_handler(count_error)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    result = None
+    async with application:
+        await bot.user_state.start()
+        try:
+            for run in range(passes):
+                if cold:
+                    bot.file_id_registry.clear()
+                updates = [Update.de_json(data, application.bot) for data in raw_updates]
+                latencies = []
+                errors.clear()
+                uploaded = request.uploaded_bytes
+
+                async def process(update):
+                    async with semaphore:
+                        start = time.perf_counter()
+                        await application.process_update(update)
+                        latencies.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                await asyncio.gather(*(process(update) for update in updates))
+                elapsed = time.perf_counter() - start
+                # Ошибки обработчиков передаются в error handler отдельными задачами
+                await asyncio.sleep(0)
+
+                result = summarize(
+                    latencies, elapsed, request.uploaded_bytes - uploaded,
+                    errors=len(errors), api_calls=sum(api.calls.values()),
+                    render_cache=bot.render_cache.stats(),
+                )
+        finally:
+            await bot.user_state.stop()
+            bot.render_executor.shutdown()
+    return result
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Регрессии относительно baseline: [(замер, метрика, было, стало)]"""
+    regressions = []
+    for section in ('micro', 'handlers'):
+        before_section = baseline.get(section) or {}
+        after_section = current.get(section) or {}
+        for name, after in after_section.items():
+            before = before_section.get(name)
+            if not before:
+                continue
+            if after['ops_per_sec'] < before['ops_per_sec'] * (1 - threshold):
+                regressions.append((name, 'ops_per_sec', before['ops_per_sec'], after['ops_per_sec']))
+            if after['p99_ms'] - before['p99_ms'] > max(before['p99_ms'] * threshold, LATENCY_NOISE_MS):
+                regressions.append((name, 'p99_ms', before['p99_ms'], after['p99_ms']))
+    return regressions
+
+
+def environment():
+    """Окружение замера - без него результаты разных машин не сравнить"""
+    import numpy
+    import PIL
+    import telegram
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pillow': PIL.__version__,
+        'numpy': numpy.__version__,
+        'python_telegram_bot': telegram.__version__,
+        'render_pool_mode': os.getenv('RENDER_POOL_MODE', 'thread'),
+        'image_encoder_default': os.getenv('IMAGE_ENCODER_DEFAULT'),
+    }
+
+
+def print_results(title, results):
+    print(f"\n{title}")
+    print(f"{'замер':<40} {'ops/s':>10} {'p50, мс':>9} {'p99, мс':>9} {'байт':>11} "
+          f"{'кодировщик':<16} {'рис., мс':>9} {'кодир., мс':>10}")
+    for name, result in results.items():
+        # Колонки кодирования есть только у замеров рендеринга
+        encoding = ''
+        if result.get('encoder'):
+            encoding = f" {result['encoder']:<16} {result['draw_ms']:>9.2f} {result['encode_ms']:>10.2f}"
+        print(f"{name:<40} {result['ops_per_sec']:>10.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['bytes']:>11}{encoding}")
+
+
+def print_encoders(title, results):
+    print(f"\n{title}")
+    print(f"{'замер':<40} {'байт':>11} {'мс':>9}")
+    for name, result in results.items():
+        print(f"{name:<40} {result['bytes']:>11} {result['encode_ms']:>9.2f}")
+
+
+def main():
+    """Замеры из командной строки с сохранением в JSON и сравнением с прошлым запуском"""
+    parser = argparse.ArgumentParser(description="Замеры рендеринга и обработки обновлений бота")
+    parser.add_argument('--only', choices=('micro', 'encoders', 'handlers'), help="Только один набор замеров")
+    parser.add_argument('--render-iterations', type=int, default=20, help="Вызовов на замер рендеринга")
+    parser.add_argument('--lookup-iterations', type=int, default=20000, help="Вызовов на замер схем и поиска")
+    parser.add_argument('--cached', action='store_true', help="Рендеринг с кэшем (замер попаданий)")
+    parser.add_argument('--encoder-repeat', type=int, default=5, help="Повторов на замер кодировщика (берется лучший)")
+    parser.add_argument('--users', type=int, default=200, help="Пользователей в синтетическом потоке обновлений")
+    parser.add_argument('--updates', help="Файл с записанными обновлениями (JSON Update в строке)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Одновременно обрабатываемых обновлений")
+    parser.add_argument('--passes', type=int, default=2, help="Проходов по обновлениям (первый - прогрев)")
+    parser.add_argument('--cold', action='store_true', help="Без file_id: каждое изображение загружается")
+    parser.add_argument('--out', default='benchmark_results.json', help="Куда сохранить результаты")
+    parser.add_argument('--baseline', help="JSON прошлого запуска для поиска регрессий")
+    args = parser.parse_args()
+
+    report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'environment': environment()}
+
+    if args.only in (None, 'micro'):
+        report['micro'] = run_micro(args.render_iterations, args.lookup_iterations, args.cached)
+        print_results("Методы IttenColorCircle", report['micro'])
+
+    if args.only in (None, 'encoders'):
+        report['encoders'] = run_encoders(args.encoder_repeat)
+        print_encoders("Кодировщики изображений", report['encoders'])
+
+    if args.only in (None, 'handlers'):
+        if args.updates:
+            raw_updates = load_updates(args.updates)
+        else:
+            from callback_codec import CallbackCodec
+            from color_circle import IttenColorCircle
+
+            circle = IttenColorCircle()
+            raw_updates = synthetic_updates(CallbackCodec(circle), circle, args.users)
+        name = f"updates[concurrency={args.concurrency}{',cold' if args.cold else ''}]"
+        report['handlers'] = {
+            name: asyncio.run(run_handlers(raw_updates, args.concurrency, args.passes, args.cold))
+        }
+        print_results("Обработка обновлений", report['handlers'])
+        print(f"Ошибок обработчиков: {report['handlers'][name]['errors']}")
+
+    rss = peak_rss()
+    if rss is not None:
+        print(f"\nПиковый RSS: {rss / 1024 / 1024:.1f} МБ")
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(json.load(f), report)
+        for name, metric, before, after in regressions:
+            print(f"Регрессия: {name} {metric} {before:.2f} -> {after:.2f}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
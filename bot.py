@@ -1,12 +1,37 @@
+import io
 import os
+import signal
+import asyncio
 import logging
 import colorsys
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
+import httpx
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand,
+    InlineQueryResultCachedPhoto, InlineQueryResultArticle, InputTextMessageContent, InputMediaPhoto
+)
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, 
-    CallbackQueryHandler, ContextTypes, filters
+    CallbackQueryHandler, InlineQueryHandler, ContextTypes, filters
 )
 from color_circle import IttenColorCircle
+from render_cache import RenderCache
+from image_encoders import ImageEncoders, DEFAULT_ENCODER
+from file_id_registry import FileIdRegistry
+from render_executor import RenderExecutor, RenderQueueFull
+from warmup import load_bundle, warm_up
+from webhook_server import WebhookServer
+from update_processor import ChatOrderedUpdateProcessor
+from rate_limiter import OutboundRateLimiter
+from bot_api_client import RoutedRequest, build_requests
+from user_state import UserStateStore, SqliteStateBackend, MemoryStateBackend
+from callback_codec import CallbackCodec, PICK_COLOR, SHOW_SCHEME, SHOW_SHADES, SHOW_ALL
+from inline_index import InlineIndex
+from color_search import ColorSearchIndex
+from color_match import NearestColorIndex, parse_color
+from photo_palette import MAX_SOURCE_PIXELS, PhotoTimeout, PhotoTooLarge, download_limited, extract_palette
+from input_files import as_input_file
+from metrics import Metrics, MetricsServer
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
@@ -19,8 +44,237 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация цветового круга
-color_circle = IttenColorCircle()
+# Метрики в формате Prometheus на http://METRICS_LISTEN:METRICS_PORT/metrics (без METRICS_PORT выключены)
+METRICS_PORT = os.getenv('METRICS_PORT')
+metrics = Metrics(enabled=METRICS_PORT is not None)
+metrics_server = None
+
+# Инициализация цветового круга (с кэшем готовых изображений)
+render_cache = RenderCache(
+    max_bytes=int(os.getenv('RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    disk_dir=os.getenv('RENDER_CACHE_DIR') or None
+)
+# Кодировщики по типу изображения, например IMAGE_ENCODERS="itten_circle=webp,color_palette=png:9"
+image_encoders = ImageEncoders.from_string(
+    os.getenv('IMAGE_ENCODERS'),
+    default=os.getenv('IMAGE_ENCODER_DEFAULT', DEFAULT_ENCODER)
+)
+color_circle = IttenColorCircle(render_cache=render_cache, encoders=image_encoders)
+if metrics.enabled:
+    # В режиме процессов рендеринг идет в дочерних процессах - замеряется только этап render
+    color_circle.observe = metrics.observe_render
+
+# Кнопки несут цвет и схему в callback_data - обработка не зависит от сессии
+callback_codec = CallbackCodec(color_circle)
+
+# Поиск цветов по имени (префиксы, русские названия, опечатки)
+color_search = ColorSearchIndex(color_circle)
+
+# Ближайший цвет палитры для произвольных HEX/RGB/HSV (в пространстве CIELAB)
+color_matcher = NearestColorIndex.from_circle(color_circle)
+
+# Все схемы цвета сразу: 'sheet' - одно изображение, 'album' - группа из 7 фото
+# (в альбоме каждая палитра кодируется и загружается отдельно)
+ALL_SCHEMES_MODE = os.getenv('ALL_SCHEMES_MODE', 'sheet')
+
+# Ограничения на анализ фотографий пользователей
+PHOTO_MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', 10 * 1024 * 1024))
+PHOTO_TIMEOUT = float(os.getenv('PHOTO_TIMEOUT', 15))
+PHOTO_COLORS = int(os.getenv('PHOTO_COLORS', 5))
+PHOTO_MAX_PIXELS = int(os.getenv('PHOTO_MAX_PIXELS', MAX_SOURCE_PIXELS))
+
+# HTTP-клиент для скачивания фото (создается в post_init, соединения переиспользуются)
+http_client = None
+
+# Результаты inline-запросов рассчитываются при загрузке
+inline_index = InlineIndex(color_circle, color_search)
+INLINE_PAGE_SIZE = 20
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 24 * 60 * 60))
+# Ответ с текстовыми заменами изображений кэшируется недолго - после загрузки
+# изображений Telegram должен запросить ответ с фото
+INLINE_FALLBACK_CACHE_TIME = int(os.getenv('INLINE_FALLBACK_CACHE_TIME', 60))
+
+# Версии для печати (/circle 2048) отправляются документом с этим DPI
+PRINT_DPI = int(os.getenv('PRINT_DPI', 300))
+
+# Пул рендеринга: Pillow работает вне цикла событий.
+# Запрос ждет места в очереди не дольше RENDER_QUEUE_TIMEOUT секунд (0 - без ограничения)
+queue_timeout = float(os.getenv('RENDER_QUEUE_TIMEOUT', 5))
+render_executor = RenderExecutor(
+    color_circle,
+    mode=os.getenv('RENDER_POOL_MODE', 'thread'),
+    workers=int(os.getenv('RENDER_WORKERS', 2)),
+    max_queue=int(os.getenv('RENDER_MAX_QUEUE', 32)),
+    queue_timeout=queue_timeout or None
+)
+
+# Реестр file_id уже загруженных в Telegram изображений
+file_id_registry = FileIdRegistry(
+    os.getenv('FILE_ID_REGISTRY', 'file_ids.json'),
+    save_interval=float(os.getenv('FILE_ID_SAVE_INTERVAL', 5.0))
+)
+
+# Ошибки BadRequest, означающие, что сохраненный file_id больше не годится
+STALE_FILE_ID_ERRORS = ('wrong file identifier', 'file reference expired')
+
+def is_stale_file_id(error):
+    """Ошибка Telegram из-за устаревшего file_id (а не из-за подписи, разметки и т.п.)"""
+    message = str(error).lower()
+    return any(text in message for text in STALE_FILE_ID_ERRORS)
+
+# Состояние пользователей (выбранный цвет) - общее для всех процессов бота.
+# Хранилище открывается в post_init, а не при импорте модуля
+user_state = None
+
+def create_user_state():
+    """Хранилище состояния пользователей по настройкам из окружения"""
+    if os.getenv('USER_STATE_BACKEND', 'sqlite') == 'memory':
+        backend = MemoryStateBackend()
+    else:
+        backend = SqliteStateBackend(os.getenv('USER_STATE_DB', 'user_state.sqlite3'))
+    return UserStateStore(
+        backend,
+        flush_interval=float(os.getenv('USER_STATE_FLUSH_INTERVAL', 1.0)),
+        ttl=float(os.getenv('USER_STATE_TTL', 24 * 60 * 60))
+    )
+
+async def get_base_color(update, default='red'):
+    """Выбранный пользователем базовый цвет"""
+    return await user_state.get(update.effective_user.id, 'base_color', default)
+
+async def set_base_color(update, color_name):
+    """Запомнить выбранный пользователем базовый цвет"""
+    await user_state.set(update.effective_user.id, 'base_color', color_name)
+
+def nearest_color(text):
+    """Ближайший цвет палитры для ввода HEX/RGB/HSV: (имя, RGB ввода, пояснение) или None"""
+    rgb = parse_color(text)
+    if rgb is None:
+        return None
+    
+    with metrics.stage('lookup'):
+        name, distance = color_matcher.nearest(rgb)[0]
+    hex_code = color_circle.rgb_to_hex(rgb).upper()
+    return name, rgb, f"Ближайший цвет палитры к `{hex_code}` (ΔE2000 = {distance:.1f})"
+
+def exact_scheme_previews(rgb):
+    """Превью точных схем для произвольного цвета (без привязки к 12 секторам)"""
+    lines = []
+    with metrics.stage('scheme'):
+        schemes = color_circle.get_exact_schemes(rgb)
+    for scheme_type, scheme_colors in schemes.items():
+        codes = ' '.join(f"`{info.hex.upper()}`" for info in scheme_colors)
+        lines.append(f"• {color_circle.schemes[scheme_type]}: {codes}")
+    return '\n'.join(lines)
+
+async def send_cached_photo(send, image_key, render_args, field='photo', **kwargs):
+    """Отправить изображение по сохраненному file_id, а при его отсутствии - загрузить
+    
+    field - параметр метода send с файлом ('photo' или 'document')
+    """
+    file_id = file_id_registry.get(image_key)
+    if file_id:
+        try:
+            with metrics.stage('upload'):
+                return await send(**{field: file_id}, **kwargs)
+        except BadRequest as e:
+            # Прочие ошибки (подпись, разметка) повторная загрузка не исправит
+            if not is_stale_file_id(e):
+                raise
+            # file_id устарел - забываем его и загружаем изображение заново
+            logger.warning(f"Stale file_id for {image_key}: {e}")
+            file_id_registry.forget(image_key)
+    
+    # render_args - имя метода create_* и его аргументы
+    try:
+        with metrics.stage('render'):
+            photo = await render_executor.render(*render_args, key=image_key)
+    except RenderQueueFull:
+        # Очередь рендеринга переполнена - вызывающий ответит текстом
+        logger.warning(f"Render queue full, {image_key} sent as text")
+        return None
+    if not photo:
+        return None
+    
+    with metrics.stage('upload'):
+        message = await send(**{field: as_input_file(photo, filename=kwargs.get('filename'))}, **kwargs)
+    if message and message.photo:
+        file_id_registry.set(image_key, message.photo[-1].file_id)
+    elif message and message.document:
+        file_id_registry.set(image_key, message.document.file_id)
+    return message
+
+def requested_size(context):
+    """Размер изображения из аргумента команды (/circle 2048) или None"""
+    if not context.args:
+        return None
+    return int(context.args[0].lower().removesuffix('px'))
+
+async def send_print_version(update: Update, renderer, render_args, size):
+    """Отправить изображение размера size документом - Telegram не пережимает документы"""
+    try:
+        width, height = color_circle.image_size(renderer, size)
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return
+    
+    # Большие версии рендерятся по запросу и кэшируются отдельно от базовых
+    message = await send_cached_photo(
+        update.message.reply_document,
+        color_circle.image_key(renderer, size=size, dpi=PRINT_DPI),
+        (*render_args, size, PRINT_DPI),
+        field='document',
+        filename=f"{renderer}_{width}x{height}.{image_encoders.extension(renderer)}",
+        caption=f"🖨 {width}×{height} px, {PRINT_DPI} DPI"
+    )
+    if not message:
+        await update.message.reply_text("Не удалось создать изображение.")
+
+async def send_cached_album(bot, chat_id, keys, palettes, captions):
+    """Отправить палитры одной группой: по сохраненным file_id или отрендерив их одной пачкой"""
+    file_ids = [file_id_registry.get(key) for key in keys]
+    if all(file_ids):
+        try:
+            with metrics.stage('upload'):
+                return await bot.send_media_group(chat_id=chat_id, media=[
+                    InputMediaPhoto(file_id, caption=caption, parse_mode='Markdown')
+                    for file_id, caption in zip(file_ids, captions)
+                ])
+        except BadRequest as e:
+            if not is_stale_file_id(e):
+                raise
+            logger.warning(f"Stale file_id in album: {e}")
+            for key in keys:
+                file_id_registry.forget(key)
+    
+    try:
+        with metrics.stage('render'):
+            photos = await render_executor.render_batch('create_palette_batch', palettes, keys=keys)
+    except RenderQueueFull:
+        logger.warning("Render queue full, album sent as text")
+        return None
+    if not all(photos):
+        return None
+    
+    with metrics.stage('upload'):
+        messages = await bot.send_media_group(chat_id=chat_id, media=[
+            InputMediaPhoto(as_input_file(photo, attach=True), caption=caption, parse_mode='Markdown')
+            for photo, caption in zip(photos, captions)
+        ])
+    for key, message in zip(keys, messages):
+        if message.photo:
+            file_id_registry.set(key, message.photo[-1].file_id)
+    return messages
+
+def scheme_previews(color_name):
+    """Превью всех схем для цвета (HEX-коды) - из заранее рассчитанной таблицы"""
+    lines = []
+    with metrics.stage('scheme'):
+        schemes = color_circle.get_all_schemes(color_name)
+    for scheme_type, scheme_colors in schemes.items():
+        codes = ' '.join(f"`{info.hex.upper()}`" for info in scheme_colors)
+        lines.append(f"• {color_circle.schemes[scheme_type]}: {codes}")
+    return '\n'.join(lines)
 
 # Команды для меню
 async def set_commands(application: Application):
@@ -129,6 +383,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
    - `/colors` - список всех цветов
    - `/circle` - цветовой круг
    - `/palette` - сетка 60 цветов
+   - `/circle 2048`, `/palette 2048` - файл для печати (до 4096 px)
 
 4. *Типы цветовых схем:*
    • Комплементарная - противоположные цвета
@@ -166,7 +421,7 @@ async def show_shades(update: Update, context: ContextTypes.DEFAULT_TYPE):
         row = []
         for i, color in enumerate(main_colors):
             color_display = color.replace('_', ' ').title()
-            row.append(InlineKeyboardButton(color_display, callback_data=f"shades_{color}"))
+            row.append(InlineKeyboardButton(color_display, callback_data=callback_codec.encode(SHOW_SHADES, color)))
             
             if len(row) == 2 or i == len(main_colors) - 1:
                 keyboard.append(row)
@@ -188,6 +443,7 @@ async def show_shades(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     color_name = ' '.join(context.args).lower().replace(' ', '_')
+    color_name = color_search.lookup(color_name) or color_name
     await show_color_shades(update, context, color_name)
 
 async def show_color_shades(update: Update, context: ContextTypes.DEFAULT_TYPE, color_name):
@@ -195,12 +451,6 @@ async def show_color_shades(update: Update, context: ContextTypes.DEFAULT_TYPE,
     # Проверяем, существует ли цвет
     color_info = color_circle.get_color_info(color_name)
     
-    if not color_info:
-        # Пробуем найти основной цвет
-        base_color = color_name.split('_')[0] if '_' in color_name else color_name
-        if base_color in color_circle.main_colors:
-            color_info = color_circle.get_color_info(base_color)
-    
     if not color_info:
         await update.message.reply_text(
             f"Цвет '{color_name}' не найден.\n"
@@ -208,11 +458,8 @@ async def show_color_shades(update: Update, context: ContextTypes.DEFAULT_TYPE,
         )
         return
     
-    # Определяем основной цвет
-    if '_' in color_name and color_name.split('_')[-1].isdigit():
-        base_color = '_'.join(color_name.split('_')[:-1])
-    else:
-        base_color = color_name
+    # Основной цвет берем из индекса
+    base_color = color_info.base
     
     # Получаем все оттенки
     shades = color_circle.get_all_shades(base_color)
@@ -226,21 +473,19 @@ async def show_color_shades(update: Update, context: ContextTypes.DEFAULT_TYPE,
     
     # Создаем изображение с оттенками
     try:
-        shades_img = color_circle.create_shades_palette(base_color)
-        
         color_display = base_color.replace('_', ' ').title()
         caption = f"🎨 *5 оттенков цвета {color_display}:*\n\n"
         
         for i, shade_info in enumerate(shades, 1):
-            shade_name = shade_info['name'].replace('_', ' ').title()
-            hex_code = shade_info['hex'].upper()
-            rgb = shade_info['rgb']
+            shade_name = shade_info.name.replace('_', ' ').title()
+            hex_code = shade_info.hex.upper()
+            rgb = shade_info.rgb
             caption += f"{i}. *{shade_name}*\n"
             caption += f"   HEX: `{hex_code}`\n"
             caption += f"   RGB: `{rgb[0]}, {rgb[1]}, {rgb[2]}`\n\n"
         
         keyboard = [[
-            InlineKeyboardButton("🎨 Создать схему с этим цветом", callback_data=f"scheme_color_{base_color}"),
+            InlineKeyboardButton("🎨 Создать схему с этим цветом", callback_data=callback_codec.encode(PICK_COLOR, base_color)),
             InlineKeyboardButton("🔙 Выбрать другой цвет", callback_data="main_shades")
         ], [
             InlineKeyboardButton("🏠 В меню", callback_data="main_menu"),
@@ -249,14 +494,15 @@ async def show_color_shades(update: Update, context: ContextTypes.DEFAULT_TYPE,
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        if shades_img:
-            await update.message.reply_photo(
-                photo=shades_img,
-                caption=caption,
-                parse_mode='Markdown',
-                reply_markup=reply_markup
-            )
-        else:
+        message = await send_cached_photo(
+            update.message.reply_photo,
+            color_circle.image_key('shades_palette', shades),
+            ('create_shades_palette', base_color),
+            caption=caption,
+            parse_mode='Markdown',
+            reply_markup=reply_markup
+        )
+        if not message:
             await update.message.reply_text(caption, parse_mode='Markdown', reply_markup=reply_markup)
         
     except Exception as e:
@@ -311,11 +557,18 @@ async def show_colors(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(response, parse_mode='Markdown', reply_markup=reply_markup)
 
 async def show_itten_circle(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать цветовой круг Иттена"""
+    """Показать цветовой круг Иттена (/circle 2048 - версия для печати)"""
+    try:
+        size = requested_size(context)
+    except ValueError:
+        await update.message.reply_text("Укажите размер числом, например: /circle 2048")
+        return
+    if size is not None:
+        await send_print_version(update, 'itten_circle', ('create_itten_circle_image',), size)
+        return
+    
     try:
-        circle_img = color_circle.create_itten_circle_image()
-        if circle_img:
-            caption = """
+        caption = """
 🎨 *Цветовой круг Иттена (12 основных цветов)*
 
 1. Красный (Red) - 0°
@@ -332,25 +585,27 @@ async def show_itten_circle(update: Update, context: ContextTypes.DEFAULT_TYPE):
 12. Красно-фиолетовый (Red-Violet) - 330°
 
 Каждый цвет имеет 5 оттенков от светлого к темному.
-            """
-            
-            keyboard = [[
-                InlineKeyboardButton("🎨 Создать схему", callback_data="main_scheme"),
-                InlineKeyboardButton("🔄 Показать оттенки", callback_data="main_shades")
-            ], [
-                InlineKeyboardButton("🌈 Полная палитра", callback_data="main_palette"),
-                InlineKeyboardButton("🏠 В меню", callback_data="main_menu")
-            ]]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await update.message.reply_photo(
-                photo=circle_img,
-                caption=caption,
-                parse_mode='Markdown',
-                reply_markup=reply_markup
-            )
-        else:
+        """
+        
+        keyboard = [[
+            InlineKeyboardButton("🎨 Создать схему", callback_data="main_scheme"),
+            InlineKeyboardButton("🔄 Показать оттенки", callback_data="main_shades")
+        ], [
+            InlineKeyboardButton("🌈 Полная палитра", callback_data="main_palette"),
+            InlineKeyboardButton("🏠 В меню", callback_data="main_menu")
+        ]]
+        
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        message = await send_cached_photo(
+            update.message.reply_photo,
+            color_circle.image_key('itten_circle'),
+            ('create_itten_circle_image',),
+            caption=caption,
+            parse_mode='Markdown',
+            reply_markup=reply_markup
+        )
+        if not message:
             await update.message.reply_text(
                 "Не удалось создать изображение круга.\n"
                 "Но вы можете использовать команды:\n"
@@ -362,11 +617,18 @@ async def show_itten_circle(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Не удалось создать изображение круга.")
 
 async def show_full_palette(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать полную палитру (60 цветов)"""
+    """Показать полную палитру (60 цветов, /palette 2048 - версия для печати)"""
+    try:
+        size = requested_size(context)
+    except ValueError:
+        await update.message.reply_text("Укажите размер числом, например: /palette 2048")
+        return
+    if size is not None:
+        await send_print_version(update, 'extended_palette', ('create_extended_palette_image', 'pil'), size)
+        return
+    
     try:
-        palette_img = color_circle.create_extended_palette_image()
-        if palette_img:
-            caption = """
+        caption = """
 🎨 *Полная палитра цветов (60 цветов)*
 
 Сетка 12×5 цветов:
@@ -378,25 +640,27 @@ async def show_full_palette(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Вертикальные столбцы - разные цвета на круге
 
 Используйте эти цвета для создания гармоничных схем!
-            """
-            
-            keyboard = [[
-                InlineKeyboardButton("🎨 Создать схему", callback_data="main_scheme"),
-                InlineKeyboardButton("🔄 Показать оттенки", callback_data="main_shades")
-            ], [
-                InlineKeyboardButton("🔵 Цветовой круг", callback_data="main_circle"),
-                InlineKeyboardButton("🏠 В меню", callback_data="main_menu")
-            ]]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await update.message.reply_photo(
-                photo=palette_img,
-                caption=caption,
-                parse_mode='Markdown',
-                reply_markup=reply_markup
-            )
-        else:
+        """
+        
+        keyboard = [[
+            InlineKeyboardButton("🎨 Создать схему", callback_data="main_scheme"),
+            InlineKeyboardButton("🔄 Показать оттенки", callback_data="main_shades")
+        ], [
+            InlineKeyboardButton("🔵 Цветовой круг", callback_data="main_circle"),
+            InlineKeyboardButton("🏠 В меню", callback_data="main_menu")
+        ]]
+        
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        message = await send_cached_photo(
+            update.message.reply_photo,
+            color_circle.image_key('extended_palette'),
+            ('create_extended_palette_image',),
+            caption=caption,
+            parse_mode='Markdown',
+            reply_markup=reply_markup
+        )
+        if not message:
             await update.message.reply_text(
                 "Не удалось создать изображение палитры.\n"
                 "Но вы можете использовать /colors чтобы увидеть список всех цветов."
@@ -426,6 +690,16 @@ async def show_color_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     color_name = ' '.join(context.args).lower().replace(' ', '_')
+    color_name = color_search.lookup(color_name) or color_name
+    
+    # HEX/RGB/HSV - показываем ближайший цвет палитры
+    nearest_note = ""
+    if not color_circle.get_color_info(color_name):
+        match = nearest_color(' '.join(context.args))
+        if match:
+            color_name, _, nearest_note = match
+            nearest_note += "\n"
+    
     color_info = color_circle.get_color_info(color_name)
     
     if not color_info:
@@ -448,8 +722,8 @@ async def show_color_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         color_img = color_circle.create_color_preview(color_name)
         
         color_display = color_name.replace('_', ' ').title()
-        hex_code = color_info['hex'].upper()
-        rgb = color_info['rgb']
+        hex_code = color_info.hex.upper()
+        rgb = color_info.rgb
         
         # Конвертация в HSV
         h, s, v = colorsys.rgb_to_hsv(rgb[0]/255, rgb[1]/255, rgb[2]/255)
@@ -461,9 +735,10 @@ async def show_color_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
 HEX: `{hex_code}`
 RGB: `{rgb[0]}, {rgb[1]}, {rgb[2]}`
 HSV: `{int(h*360)}°, {int(s*100)}%, {int(v*100)}%`
-"""
+
+{nearest_note}"""
         keyboard = [[
-            InlineKeyboardButton("🎨 Создать схемы", callback_data=f"scheme_color_{color_name}"),
+            InlineKeyboardButton("🎨 Создать схемы", callback_data=callback_codec.encode(PICK_COLOR, color_name)),
             InlineKeyboardButton("🔙 Назад в меню", callback_data="main_menu")
         ]]
         
@@ -483,11 +758,11 @@ HSV: `{int(h*360)}°, {int(s*100)}%, {int(v*100)}%`
         logger.error(f"Error creating color preview: {e}")
         
         color_display = color_name.replace('_', ' ').title()
-        hex_code = color_info['hex'].upper()
-        rgb = color_info['rgb']
+        hex_code = color_info.hex.upper()
+        rgb = color_info.rgb
         
         keyboard = [[
-            InlineKeyboardButton("🎨 Создать схемы", callback_data=f"scheme_color_{color_name}"),
+            InlineKeyboardButton("🎨 Создать схемы", callback_data=callback_codec.encode(PICK_COLOR, color_name)),
             InlineKeyboardButton("🔙 Назад в меню", callback_data="main_menu")
         ]]
         
@@ -497,6 +772,7 @@ HSV: `{int(h*360)}°, {int(s*100)}%, {int(v*100)}%`
             f"*{color_display}*\n\n"
             f"HEX: `{hex_code}`\n"
             f"RGB: `{rgb[0]}, {rgb[1]}, {rgb[2]}`\n\n"
+            f"{nearest_note}"
             "Для создания схем используйте /scheme",
             parse_mode='Markdown',
             reply_markup=reply_markup
@@ -556,7 +832,7 @@ async def choose_color(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     for i, color in enumerate(main_colors):
         color_display = color.replace('_', ' ').title()
-        row.append(InlineKeyboardButton(color_display, callback_data=f"color_{color}"))
+        row.append(InlineKeyboardButton(color_display, callback_data=callback_codec.encode(PICK_COLOR, color)))
         
         if len(row) == 2:
             keyboard.append(row)
@@ -592,16 +868,27 @@ async def choose_scheme(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     # Извлекаем выбранный цвет
-    color_name = query.data.split('_')[1]
-    context.user_data['base_color'] = color_name
+    data = callback_codec.decode(query.data)
+    if data is not None:
+        color_name = data.color_name
+    elif query.data.startswith("new_scheme_"):
+        color_name = query.data[len("new_scheme_"):]
+    else:
+        # Кнопка старого формата: color_<цвет>
+        color_name = query.data.split('_', 1)[1]
+    await set_base_color(update, color_name)
     
     # Создаем клавиатуру с типами схем
     keyboard = []
     for scheme_type, scheme_name in color_circle.schemes.items():
         keyboard.append([
-            InlineKeyboardButton(scheme_name, callback_data=f"scheme_{scheme_type}")
+            InlineKeyboardButton(scheme_name, callback_data=callback_codec.encode(SHOW_SCHEME, color_name, scheme_type))
         ])
     
+    keyboard.append([
+        InlineKeyboardButton("🖼 Все схемы сразу", callback_data=callback_codec.encode(SHOW_ALL, color_name))
+    ])
+    
     # Кнопки навигации
     keyboard.append([
         InlineKeyboardButton("🔙 Выбрать другой цвет", callback_data="main_scheme"),
@@ -611,23 +898,78 @@ async def choose_scheme(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     color_display = color_name.replace('_', ' ').title()
-    await query.edit_message_text(
+    text = (
         f"Выбран цвет: *{color_display}*\n\n"
-        "🎨 Выберите тип цветовой схемы:",
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
+        f"🎨 Выберите тип цветовой схемы:\n\n{scheme_previews(color_name)}"
     )
+    await edit_or_reply(query, text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def edit_or_reply(query, text, **kwargs):
+    """Заменить текст сообщения с кнопкой, а под фото - ответить новым сообщением"""
+    # Сообщение с фото (схема, палитра фотографии) текстом не редактируется
+    if query.message and query.message.photo:
+        await query.message.reply_text(text, **kwargs)
+    else:
+        await query.edit_message_text(text, **kwargs)
+
+async def show_all_schemes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать все схемы цвета одним сообщением (группа фото или один лист)"""
+    query = update.callback_query
+    await query.answer()
+    
+    data = callback_codec.decode(query.data)
+    if data is None:
+        return
+    
+    color_name = data.color_name
+    color_display = color_name.replace('_', ' ').title()
+    chat_id = query.message.chat_id
+    
+    try:
+        if ALL_SCHEMES_MODE == 'sheet':
+            message = await send_cached_photo(
+                context.bot.send_photo,
+                color_circle.scheme_sheet_key(color_name),
+                ('create_scheme_sheet', color_name),
+                chat_id=chat_id,
+                caption=f"🎨 *Все схемы для цвета {color_display}:*\n\n{scheme_previews(color_name)}",
+                parse_mode='Markdown'
+            )
+        else:
+            schemes = color_circle.get_all_schemes(color_name)
+            palettes = list(schemes.values())
+            keys = [color_circle.image_key('color_palette', colors) for colors in palettes]
+            captions = [
+                f"*{color_circle.schemes[scheme_type]}*\n" + ' '.join(f"`{info.hex.upper()}`" for info in colors)
+                for scheme_type, colors in schemes.items()
+            ]
+            message = await send_cached_album(context.bot, chat_id, keys, palettes, captions)
+    except Exception as e:
+        logger.error(f"Error sending all schemes: {e}")
+        message = None
+    
+    if not message:
+        await query.message.reply_text(
+            f"🎨 *Все схемы для цвета {color_display}:*\n\n{scheme_previews(color_name)}",
+            parse_mode='Markdown'
+        )
 
 async def show_scheme(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать выбранную цветовую схему"""
     query = update.callback_query
     await query.answer()
     
-    scheme_type = query.data.split('_')[1]
-    base_color = context.user_data.get('base_color', 'red')
+    data = callback_codec.decode(query.data)
+    if data is not None:
+        scheme_type, base_color = data.scheme_type, data.color_name
+    else:
+        # Кнопка старого формата scheme_<тип> не несет цвет - берем его из сессии
+        scheme_type = query.data[len("scheme_"):]
+        base_color = await get_base_color(update)
     
     # Получаем схему
-    scheme_colors = color_circle.get_scheme(base_color, scheme_type)
+    with metrics.stage('scheme'):
+        scheme_colors = color_circle.get_scheme(base_color, scheme_type)
     
     if not scheme_colors:
         await query.edit_message_text("Ошибка при создании схемы. Попробуйте еще раз.")
@@ -642,36 +984,36 @@ async def show_scheme(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += "*Цвета в схеме:*\n"
     
     for i, color_info in enumerate(scheme_colors, 1):
-        color_name = color_info['name'].replace('_', ' ').title()
-        text += f"{i}. *{color_name}*: `{color_info['hex'].upper()}`\n"
-        rgb = color_info['rgb']
+        color_name = color_info.name.replace('_', ' ').title()
+        text += f"{i}. *{color_name}*: `{color_info.hex.upper()}`\n"
+        rgb = color_info.rgb
         text += f"   RGB: {rgb[0]}, {rgb[1]}, {rgb[2]}\n"
     
     # Создаем изображение палитры
     try:
-        img_bytes = color_circle.create_color_palette_image(scheme_colors, scheme_name)
+        # Кнопки для навигации
+        keyboard = [[
+            InlineKeyboardButton("🎨 Новая схема", callback_data=callback_codec.encode(PICK_COLOR, base_color)),
+            InlineKeyboardButton("🔄 Другой цвет", callback_data="new_color")
+        ], [
+            InlineKeyboardButton("🏠 В меню", callback_data="main_menu"),
+            InlineKeyboardButton("📋 Все цвета", callback_data="main_colors")
+        ]]
         
-        if img_bytes:
-            # Кнопки для навигации
-            keyboard = [[
-                InlineKeyboardButton("🎨 Новая схема", callback_data=f"new_scheme_{base_color}"),
-                InlineKeyboardButton("🔄 Другой цвет", callback_data="new_color")
-            ], [
-                InlineKeyboardButton("🏠 В меню", callback_data="main_menu"),
-                InlineKeyboardButton("📋 Все цвета", callback_data="main_colors")
-            ]]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            # Отправляем изображение и текст
-            await context.bot.send_photo(
-                chat_id=query.message.chat_id,
-                photo=img_bytes,
-                caption=text,
-                parse_mode='Markdown',
-                reply_markup=reply_markup
-            )
-            
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        # Отправляем изображение и текст
+        message = await send_cached_photo(
+            context.bot.send_photo,
+            color_circle.image_key('color_palette', scheme_colors),
+            ('create_color_palette_image', scheme_colors, scheme_name),
+            chat_id=query.message.chat_id,
+            caption=text,
+            parse_mode='Markdown',
+            reply_markup=reply_markup
+        )
+        
+        if message:
             # Удаляем предыдущее сообщение с выбором схемы
             await query.delete_message()
         else:
@@ -751,27 +1093,29 @@ async def handle_special_commands(update: Update, context: ContextTypes.DEFAULT_
     if query.data == "show_circle":
         # Показываем цветовой круг
         try:
-            circle_img = color_circle.create_itten_circle_image()
-            if circle_img:
-                await context.bot.send_photo(
-                    chat_id=query.message.chat_id,
-                    photo=circle_img,
-                    caption="Цветовой круг Иттена"
-                )
+            message = await send_cached_photo(
+                context.bot.send_photo,
+                color_circle.image_key('itten_circle'),
+                ('create_itten_circle_image',),
+                chat_id=query.message.chat_id,
+                caption="Цветовой круг Иттена"
+            )
         except Exception as e:
             logger.error(f"Error creating circle: {e}")
+            message = None
+        if not message:
             await query.edit_message_text("Не удалось создать изображение круга.")
     
     elif query.data.startswith("scheme_color_"):
         # Создание схемы с определенным цветом
-        color_name = query.data.split('_')[2]
-        context.user_data['base_color'] = color_name
+        color_name = query.data[len("scheme_color_"):]
+        await set_base_color(update, color_name)
         
         # Создаем клавиатуру с типами схем
         keyboard = []
         for scheme_type, scheme_name in color_circle.schemes.items():
             keyboard.append([
-                InlineKeyboardButton(scheme_name, callback_data=f"scheme_{scheme_type}")
+                InlineKeyboardButton(scheme_name, callback_data=callback_codec.encode(SHOW_SCHEME, color_name, scheme_type))
             ])
         
         # Кнопки навигации
@@ -785,7 +1129,7 @@ async def handle_special_commands(update: Update, context: ContextTypes.DEFAULT_
         color_display = color_name.replace('_', ' ').title()
         await query.edit_message_text(
             f"Создание схемы с цветом: *{color_display}*\n\n"
-            "🎨 Выберите тип цветовой схемы:",
+            f"🎨 Выберите тип цветовой схемы:\n\n{scheme_previews(color_name)}",
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
@@ -797,26 +1141,45 @@ async def handle_new_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "new_color":
         await choose_color(update, context)
-    elif query.data.startswith("new_scheme"):
-        base_color = query.data.split('_')[2]
-        context.user_data['base_color'] = base_color
+    elif query.data.startswith("new_scheme_"):
         await choose_scheme(update, context)
 
+async def handle_shades_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать оттенки цвета по кнопке"""
+    query = update.callback_query
+    await query.answer()
+    
+    data = callback_codec.decode(query.data)
+    color_name = data.color_name if data is not None else query.data.split('_', 1)[1]
+    await show_color_shades(query, context, color_name)
+
 async def handle_color_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка текстового ввода цвета"""
     user_input = update.message.text.strip().lower().replace(' ', '_')
     
+    # Русские названия и другие варианты написания приводим к имени из colors.json
+    with metrics.stage('lookup'):
+        user_input = color_search.lookup(user_input) or user_input
+    
+    # HEX/RGB/HSV - берем ближайший цвет палитры
+    nearest_note = ""
+    if not color_circle.get_color_info(user_input):
+        match = nearest_color(update.message.text)
+        if match:
+            user_input, rgb, nearest_note = match
+            nearest_note += f"\n\n*Точные схемы для исходного цвета:*\n{exact_scheme_previews(rgb)}\n\n"
+    
     # Проверяем, есть ли такой цвет
     color_info = color_circle.get_color_info(user_input)
     
     if color_info:
-        context.user_data['base_color'] = user_input
+        await set_base_color(update, user_input)
         
         # Создаем клавиатуру с типами схем
         keyboard = []
         for scheme_type, scheme_name in color_circle.schemes.items():
             keyboard.append([
-                InlineKeyboardButton(scheme_name, callback_data=f"scheme_{scheme_type}")
+                InlineKeyboardButton(scheme_name, callback_data=callback_codec.encode(SHOW_SCHEME, user_input, scheme_type))
             ])
         
         # Кнопки навигации
@@ -830,24 +1193,25 @@ async def handle_color_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         color_display = user_input.replace('_', ' ').title()
         await update.message.reply_text(
             f"Выбран цвет: *{color_display}*\n\n"
-            "🎨 Выберите тип цветовой схемы:",
+            f"{nearest_note}"
+            f"🎨 Выберите тип цветовой схемы:\n\n{scheme_previews(user_input)}",
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
     else:
         # Проверяем, может это основной цвет без оттенка
         if user_input in color_circle.main_colors:
-            context.user_data['base_color'] = user_input
+            await set_base_color(update, user_input)
             
             keyboard = []
             for scheme_type, scheme_name in color_circle.schemes.items():
                 keyboard.append([
-                    InlineKeyboardButton(scheme_name, callback_data=f"scheme_{scheme_type}")
+                    InlineKeyboardButton(scheme_name, callback_data=callback_codec.encode(SHOW_SCHEME, user_input, scheme_type))
                 ])
             
             keyboard.append([
                 InlineKeyboardButton("🔄 Показать оттенки этого цвета", 
-                                   callback_data=f"shades_{user_input}"),
+                                   callback_data=callback_codec.encode(SHOW_SHADES, user_input)),
                 InlineKeyboardButton("🏠 В меню", callback_data="main_menu")
             ])
             
@@ -856,13 +1220,28 @@ async def handle_color_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             color_display = user_input.replace('_', ' ').title()
             await update.message.reply_text(
                 f"Выбран цвет: *{color_display}*\n\n"
-                "🎨 Выберите тип цветовой схемы:",
+                f"🎨 Выберите тип цветовой схемы:\n\n{scheme_previews(user_input)}",
                 reply_markup=reply_markup,
                 parse_mode='Markdown'
             )
         else:
-            # Цвет не найден
-            keyboard = [[
+            # Цвет не найден - предлагаем похожие (по префиксу или с опечаткой)
+            keyboard = []
+            row = []
+            with metrics.stage('lookup'):
+                suggestions = color_search.search(user_input, limit=6)
+            for name in suggestions:
+                row.append(InlineKeyboardButton(
+                    name.replace('_', ' ').title(),
+                    callback_data=callback_codec.encode(PICK_COLOR, name)
+                ))
+                if len(row) == 2:
+                    keyboard.append(row)
+                    row = []
+            if row:
+                keyboard.append(row)
+            
+            keyboard += [[
                 InlineKeyboardButton("🎨 Выбрать цвет из списка", callback_data="main_scheme"),
                 InlineKeyboardButton("🌈 Посмотреть все цвета", callback_data="main_colors")
             ], [
@@ -872,8 +1251,10 @@ async def handle_color_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             
+            suggestions = "Возможно, вы имели в виду один из цветов ниже.\n\n" if len(keyboard) > 2 else ""
             await update.message.reply_text(
                 f"Цвет '{user_input}' не найден.\n\n"
+                f"{suggestions}"
                 "Доступные форматы:\n"
                 "• Основной цвет: `red`, `blue`, `green`\n"
                 "• Оттенок: `red_1`, `red_2`, `red_3`, `red_4`, `red_5`\n\n"
@@ -881,10 +1262,138 @@ async def handle_color_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 reply_markup=reply_markup
             )
 
+async def download_photo(attachment):
+    """Скачать фото или изображение-документ (не больше PHOTO_MAX_BYTES)"""
+    if attachment.file_size and attachment.file_size > PHOTO_MAX_BYTES:
+        raise PhotoTooLarge(f"Файл больше {PHOTO_MAX_BYTES} байт")
+    
+    file = await attachment.get_file()
+    if file.file_path.startswith(('http://', 'https://')):
+        return await download_limited(http_client, file.file_path, PHOTO_MAX_BYTES)
+    
+    # Локальный сервер Bot API отдает путь к файлу на диске
+    buffer = io.BytesIO()
+    await file.download_to_memory(buffer)
+    if buffer.tell() > PHOTO_MAX_BYTES:
+        raise PhotoTooLarge(f"Файл больше {PHOTO_MAX_BYTES} байт")
+    return buffer.getvalue()
+
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Основные цвета фотографии и схемы на их основе"""
+    message = update.message
+    if message.photo:
+        # Telegram присылает несколько размеров - берем самый большой в пределах лимита
+        sizes = [size for size in message.photo if (size.file_size or 0) <= PHOTO_MAX_BYTES]
+        attachment = sizes[-1] if sizes else message.photo[0]
+    else:
+        attachment = message.document
+    
+    try:
+        data = await download_photo(attachment)
+        # Декодирование и кластеризация - в пуле; лимит времени проверяет сам воркер
+        colors = await render_executor.run(
+            extract_palette, data, PHOTO_COLORS, PHOTO_MAX_PIXELS, PHOTO_TIMEOUT
+        )
+    except PhotoTooLarge as e:
+        await message.reply_text(f"Изображение слишком большое: {e}")
+        return
+    except PhotoTimeout:
+        await message.reply_text("Не удалось разобрать изображение за отведенное время.")
+        return
+    except RenderQueueFull:
+        await message.reply_text("Бот сейчас занят. Попробуйте отправить фото чуть позже.")
+        return
+    except Exception as e:
+        logger.error(f"Error extracting photo palette: {e}")
+        await message.reply_text("Не удалось разобрать изображение.")
+        return
+    
+    if not colors:
+        await message.reply_text("Не удалось найти цвета на изображении.")
+        return
+    
+    # Каждый основной цвет фото привязываем к ближайшему цвету круга Иттена
+    caption = "🖼 *Основные цвета фотографии:*\n\n"
+    keyboard = []
+    matched = []
+    for i, (rgb, share) in enumerate(colors, 1):
+        name, distance = color_matcher.nearest(rgb)[0]
+        color_display = name.replace('_', ' ').title()
+        caption += f"{i}. `{color_circle.rgb_to_hex(rgb).upper()}` - {share:.0%} → *{color_display}*\n"
+        if name not in matched:
+            matched.append(name)
+            keyboard.append([InlineKeyboardButton(
+                f"🎨 Схемы для {color_display}",
+                callback_data=callback_codec.encode(PICK_COLOR, name)
+            )])
+    
+    caption += "\nВыберите цвет, чтобы построить схему по кругу Иттена."
+    keyboard.append([InlineKeyboardButton("🏠 В меню", callback_data="main_menu")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    palette = [color_circle.record_for_rgb(rgb) for rgb, _ in colors]
+    try:
+        with metrics.stage('render'):
+            photo = await render_executor.render(
+                'create_color_palette_image', palette, "Фото",
+                key=color_circle.image_key('color_palette', palette)
+            )
+    except RenderQueueFull:
+        photo = None
+    
+    if photo:
+        with metrics.stage('upload'):
+            await message.reply_photo(photo=as_input_file(photo), caption=caption, parse_mode='Markdown', reply_markup=reply_markup)
+    else:
+        await message.reply_text(caption, parse_mode='Markdown', reply_markup=reply_markup)
+
+def inline_result(entry):
+    """Результат inline-запроса: уже загруженное изображение или текст с HEX-кодами"""
+    file_id = file_id_registry.get(entry.image_key)
+    if file_id:
+        return InlineQueryResultCachedPhoto(
+            id=entry.id,
+            photo_file_id=file_id,
+            title=entry.title,
+            description=entry.description,
+            caption=entry.caption,
+            parse_mode='Markdown'
+        )
+    
+    # Изображение еще ни разу не загружалось - на запросе ничего не рендерим
+    return InlineQueryResultArticle(
+        id=entry.id,
+        title=entry.title,
+        description=entry.description,
+        input_message_content=InputTextMessageContent(entry.caption, parse_mode='Markdown')
+    )
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик inline-запросов (@bot red triad)"""
+    query = update.inline_query
+    with metrics.stage('lookup'):
+        entries = inline_index.search(query.query.strip().lower())
+    
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    page = entries[offset:offset + INLINE_PAGE_SIZE]
+    next_offset = str(offset + len(page)) if offset + len(page) < len(entries) else ''
+    
+    results = [inline_result(entry) for entry in page]
+    has_fallback = any(isinstance(result, InlineQueryResultArticle) for result in results)
+    await query.answer(
+        results,
+        cache_time=INLINE_FALLBACK_CACHE_TIME if has_fallback else INLINE_CACHE_TIME,
+        next_offset=next_offset
+    )
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
     logger.error(f"Update {update} caused error {context.error}")
     
+    # После исчерпанных повторов на 429 еще одно сообщение только усугубит флуд-контроль
+    if isinstance(context.error, RetryAfter):
+        return
+    
     if update and update.effective_message:
         keyboard = [[
             InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu"),
@@ -901,18 +1410,107 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def post_init(application: Application):
     """Функция для инициализации после запуска"""
     await set_commands(application)
+    
+    global http_client
+    http_client = httpx.AsyncClient(timeout=30)
+    await file_id_registry.start()
+    
+    global user_state
+    user_state = await asyncio.to_thread(create_user_state)
+    await user_state.start()
+    if metrics.enabled:
+        metrics.add_collector('user_state', user_state.stats)
+    
+    # Прогрев кэша изображений: запросы пользователей не должны рендерить "с нуля"
+    if os.getenv('RENDER_WARMUP', '1') == '1':
+        bundle_dir = os.getenv('RENDER_BUNDLE_DIR')
+        if bundle_dir:
+            loaded = load_bundle(render_cache, bundle_dir, color_circle.colors_digest)
+            logger.info(f"Загружено изображений из набора: {loaded}")
+        
+        total, rendered = await warm_up(render_executor, color_circle)
+        logger.info(f"Кэш изображений прогрет: всего {total}, отрендерено {rendered}")
+    
+    if metrics.enabled:
+        global metrics_server
+        metrics_server = MetricsServer(metrics, listen=os.getenv('METRICS_LISTEN', '127.0.0.1'), port=int(METRICS_PORT))
+        await metrics_server.start()
+        logger.info(f"Метрики: http://{metrics_server.listen}:{metrics_server.port}/metrics")
 
-def main():
-    """Запуск бота"""
-    # Получаем токен бота
-    TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-    if not TOKEN:
-        logger.error("Не найден TELEGRAM_BOT_TOKEN в переменных окружения!")
-        return
+async def post_shutdown(application: Application):
+    """Функция для освобождения ресурсов после остановки"""
+    if metrics_server is not None:
+        await metrics_server.stop()
+    render_executor.shutdown()
+    if http_client is not None:
+        await http_client.aclose()
+    await file_id_registry.stop()
+    if user_state is not None:
+        await user_state.stop()
+    
+    processor = application.update_processor
+    if isinstance(processor, ChatOrderedUpdateProcessor):
+        logger.info(f"Статистика обработки обновлений: {processor.stats()}")
+    
+    rate_limiter = application.bot.rate_limiter
+    if isinstance(rate_limiter, OutboundRateLimiter):
+        logger.info(f"Статистика исходящих запросов: {rate_limiter.stats()}")
+    
+    request = application.bot.request
+    if isinstance(request, RoutedRequest):
+        logger.info(f"Статистика пулов соединений: {request.stats()}")
+
+async def serve_webhook(application: Application, secret_token):
+    """Работа в режиме webhook: обновления принимает встроенный HTTP-сервер
     
-    # Создаем приложение
-    application = Application.builder().token(TOKEN).build()
+    secret_token - общий для всех реплик WEBHOOK_SECRET: запросы без него отклоняются
+    """
+    # Без WEBHOOK_URL вебхук в Telegram не регистрируется (например, при проверке
+    # записанными обновлениями или если его регистрирует другая реплика)
+    webhook_url = os.getenv('WEBHOOK_URL')
+    
+    server = WebhookServer(
+        application,
+        listen=os.getenv('WEBHOOK_LISTEN', '127.0.0.1'),
+        port=int(os.getenv('WEBHOOK_PORT', 8080)),
+        url_path=os.getenv('WEBHOOK_PATH', 'webhook'),
+        secret_token=secret_token
+    )
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
     
+    await application.initialize()
+    try:
+        await post_init(application)
+        await application.start()
+        await server.start()
+        
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+        
+        logger.info(f"Webhook слушает {server.listen}:{server.port}{server.url_path}")
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+    finally:
+        # Как в run_polling: post_shutdown - после остановки приложения
+        await application.shutdown()
+        await post_shutdown(application)
+
+def add_handlers(application: Application):
+    """Зарегистрировать обработчики бота"""
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -925,21 +1523,112 @@ def main():
     application.add_handler(CommandHandler("scheme", choose_color))
     
     # Регистрируем обработчики callback-запросов
-    application.add_handler(CallbackQueryHandler(choose_scheme, pattern="^color_"))
-    application.add_handler(CallbackQueryHandler(show_scheme, pattern="^scheme_"))
+    application.add_handler(CallbackQueryHandler(choose_scheme, pattern=CallbackCodec.pattern(PICK_COLOR)))
+    application.add_handler(CallbackQueryHandler(show_scheme, pattern=CallbackCodec.pattern(SHOW_SCHEME)))
+    application.add_handler(CallbackQueryHandler(handle_shades_callback, pattern=CallbackCodec.pattern(SHOW_SHADES)))
+    application.add_handler(CallbackQueryHandler(show_all_schemes, pattern=CallbackCodec.pattern(SHOW_ALL)))
     application.add_handler(CallbackQueryHandler(handle_main_menu, pattern="^main_"))
-    application.add_handler(CallbackQueryHandler(handle_special_commands, pattern="^scheme_color_"))
     application.add_handler(CallbackQueryHandler(handle_new_choice, pattern="^new_"))
-    application.add_handler(CallbackQueryHandler(show_color_shades, pattern="^shades_"))
+    
+    # Кнопки старого формата из уже отправленных сообщений
+    application.add_handler(CallbackQueryHandler(choose_scheme, pattern="^color_"))
+    application.add_handler(CallbackQueryHandler(handle_special_commands, pattern="^scheme_color_"))
+    application.add_handler(CallbackQueryHandler(show_scheme, pattern="^scheme_"))
+    application.add_handler(CallbackQueryHandler(handle_shades_callback, pattern="^shades_"))
+    
+    # Регистрируем обработчик inline-запросов
+    application.add_handler(InlineQueryHandler(handle_inline_query))
+    
+    # Регистрируем обработчик фотографий и изображений, отправленных файлом
+    application.add_handler(MessageHandler(filters.PHOTO | filters.Document.IMAGE, handle_photo))
     
     # Регистрируем обработчик текстовых сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_color_input))
     
     # Регистрируем обработчик ошибок
     application.add_error_handler(error_handler)
+
+def build_application(token):
+    """Приложение бота с настройками из окружения"""
+    # Создаем приложение: обновления разных чатов обрабатываются параллельно
+    # (до BOT_CONCURRENT_UPDATES штук), обновления одного чата - строго по порядку
+    builder = Application.builder().token(token)
+    concurrent_updates = int(os.getenv('BOT_CONCURRENT_UPDATES', 1))
+    if concurrent_updates > 1:
+        builder.concurrent_updates(ChatOrderedUpdateProcessor(concurrent_updates))
+    
+    # Отдельные пулы соединений: getUpdates, загрузка изображений и JSON-вызовы
+    request, updates_request = build_requests(
+        json_pool=int(os.getenv('BOT_POOL_JSON', 8)),
+        media_pool=int(os.getenv('BOT_POOL_MEDIA', 4)),
+        keepalive_expiry=float(os.getenv('BOT_KEEPALIVE_EXPIRY', 30)),
+        connect_timeout=float(os.getenv('BOT_CONNECT_TIMEOUT', 5)),
+        read_timeout=float(os.getenv('BOT_READ_TIMEOUT', 5)),
+        write_timeout=float(os.getenv('BOT_WRITE_TIMEOUT', 20)),
+        pool_timeout=float(os.getenv('BOT_POOL_TIMEOUT', 5)),
+        http_version=os.getenv('BOT_HTTP_VERSION', '1.1')
+    )
+    builder.request(request).get_updates_request(updates_request)
+    
+    # Свой сервер Bot API (локальный или тестовый вместо api.telegram.org)
+    api_base_url = os.getenv('BOT_API_BASE_URL')
+    if api_base_url:
+        builder.base_url(f"{api_base_url.rstrip('/')}/bot")
+        builder.base_file_url(f"{api_base_url.rstrip('/')}/file/bot")
+    
+    # Исходящие запросы проходят через очередь с лимитами Telegram:
+    # ~30 сообщений в секунду всего, ~1 в секунду в чат, 20 в минуту в группу
+    if os.getenv('RATE_LIMIT', '1') == '1':
+        builder.rate_limiter(OutboundRateLimiter(
+            global_rate=float(os.getenv('RATE_GLOBAL', 30)),
+            global_burst=int(os.getenv('RATE_GLOBAL_BURST', 30)),
+            chat_rate=float(os.getenv('RATE_CHAT', 1)),
+            chat_burst=int(os.getenv('RATE_CHAT_BURST', 3)),
+            group_rate=float(os.getenv('RATE_GROUP_PER_MINUTE', 20)) / 60,
+            max_retries=int(os.getenv('RATE_MAX_RETRIES', 3))
+        ))
+    application = builder.build()
+    
+    add_handlers(application)
+    
+    # Время обработки и этапов по обработчикам, состояние компонентов
+    if metrics.enabled:
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = metrics.instrument(handler.callback)
+        
+        metrics.add_collector('render_cache', render_cache.stats)
+        metrics.add_collector('render_executor', render_executor.stats)
+        if isinstance(application.update_processor, ChatOrderedUpdateProcessor):
+            metrics.add_collector('updates', application.update_processor.stats)
+        if isinstance(application.bot.rate_limiter, OutboundRateLimiter):
+            metrics.add_collector('outbound', application.bot.rate_limiter.stats, labels={'queued': ('lane',)})
+        if isinstance(application.bot.request, RoutedRequest):
+            metrics.add_collector('bot_api', application.bot.request.stats, labels={'errors': ('method', 'status')})
     
     # Устанавливаем команды меню при запуске
     application.post_init = post_init
+    application.post_shutdown = post_shutdown
+    
+    return application
+
+def main():
+    """Запуск бота"""
+    # Получаем токен бота
+    TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not TOKEN:
+        logger.error("Не найден TELEGRAM_BOT_TOKEN в переменных окружения!")
+        return
+    
+    # Секрет вебхука общий для всех реплик: случайный у каждой реплики ломал бы
+    # прием у всех, кроме зарегистрировавшей вебхук последней
+    webhook_mode = os.getenv('BOT_MODE', 'polling') == 'webhook'
+    webhook_secret = os.getenv('WEBHOOK_SECRET')
+    if webhook_mode and not webhook_secret:
+        logger.error("Не найден WEBHOOK_SECRET в переменных окружения - без него вебхук не запускается!")
+        return
+    
+    application = build_application(TOKEN)
     
     # Запускаем бота
     print("=" * 50)
@@ -957,7 +1646,11 @@ def main():
     print("/shades [цвет] - Показать оттенки цвета")
     print("\n" + "=" * 50)
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # BOT_MODE=webhook - для продакшена за балансировщиком, polling - для разработки
+    if webhook_mode:
+        asyncio.run(serve_webhook(application, webhook_secret))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
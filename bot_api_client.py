@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+from telegram.ext import ExtBot
+from telegram.request import BaseRequest, HTTPXRequest
+
+# Сетевой слой клиента Bot API: отдельные пулы соединений для getUpdates,
+# загрузки изображений и небольших JSON-вызовов. Долгие загрузки фото не
+# занимают соединения, нужные для ответов на кнопки, а getUpdates
+# (long polling) всегда имеет собственное соединение.
+
+
+class PooledHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest с настройкой keep-alive: число и время жизни простаивающих соединений"""
+
+    def __init__(self, connection_pool_size=1, keepalive_connections=None, keepalive_expiry=5.0, **kwargs):
+        # Лимиты задаются до вызова базового конструктора - он сразу создает клиент
+        self._limits = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=keepalive_connections or connection_pool_size,
+            keepalive_expiry=keepalive_expiry,
+        )
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+    def _build_client(self):
+        return httpx.AsyncClient(**{**self._client_kwargs, 'limits': self._limits})
+
+
+class RoutedRequest(BaseRequest):
+    """Запросы с файлами идут через пул для загрузок, остальные - через пул для JSON"""
+
+    def __init__(self, json_request, media_request):
+        self.json_request = json_request
+        self.media_request = media_request
+
+        # Статистика запросов по пулам и ошибок Bot API: метод -> {HTTP-статус или тип ошибки: число}
+        self.json_requests = 0
+        self.media_requests = 0
+        self.errors = {}
+
+    @property
+    def read_timeout(self):
+        return self.json_request.read_timeout
+
+    async def initialize(self):
+        await self.json_request.initialize()
+        await self.media_request.initialize()
+
+    async def shutdown(self):
+        await self.json_request.shutdown()
+        await self.media_request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        """Передать запрос в пул по его содержимому"""
+        if request_data is not None and request_data.contains_files:
+            self.media_requests += 1
+            pool = self.media_request
+        else:
+            self.json_requests += 1
+            pool = self.json_request
+
+        try:
+            status, payload = await pool.do_request(url, method, request_data, **timeouts)
+        except Exception as e:
+            # Сетевые ошибки и таймауты
+            self._count_error(url, type(e).__name__)
+            raise
+        if status != 200:
+            self._count_error(url, status)
+        return status, payload
+
+    def _count_error(self, url, error):
+        endpoint = self.errors.setdefault(url.rsplit('/', 1)[-1], {})
+        endpoint[error] = endpoint.get(error, 0) + 1
+
+    def stats(self):
+        """Статистика запросов по пулам"""
+        return {
+            'json_requests': self.json_requests,
+            'media_requests': self.media_requests,
+            'errors': {endpoint: dict(errors) for endpoint, errors in self.errors.items()},
+        }
+
+
+def build_requests(json_pool=8, media_pool=4, updates_pool=1, keepalive_expiry=30.0,
+                   connect_timeout=5.0, read_timeout=5.0, write_timeout=20.0, pool_timeout=5.0,
+                   http_version='1.1'):
+    """Запросы для Application.builder(): (request для вызовов бота, request для getUpdates)"""
+    common = {
+        'keepalive_expiry': keepalive_expiry,
+        'connect_timeout': connect_timeout,
+        'pool_timeout': pool_timeout,
+        'http_version': http_version,
+    }
+    request = RoutedRequest(
+        PooledHTTPXRequest(json_pool, read_timeout=read_timeout, write_timeout=read_timeout, **common),
+        # Загрузка изображений: больше времени на запись тела запроса
+        PooledHTTPXRequest(media_pool, read_timeout=read_timeout, write_timeout=write_timeout, **common),
+    )
+    # Таймаут long polling добавляется к read_timeout самой библиотекой
+    updates_request = PooledHTTPXRequest(updates_pool, read_timeout=read_timeout, **common)
+    return request, updates_request
+
+
+async def benchmark(pool_sizes, requests=200, photos=0.5, latency=0.02, http_version='1.1'):
+    """Пропускная способность вызовов бота против локального сервера Bot API при разных размерах пула
+
+    Возвращает {размер пула: (запросов в секунду, p99 задержки в мс)}
+    """
+    from fake_bot_api import FakeBotApi
+
+    server = FakeBotApi(latency=latency)
+    await server.start()
+    photo = bytes(20 * 1024)
+    media_every = round(1 / photos) if photos else 0
+    results = {}
+    try:
+        for pool_size in pool_sizes:
+            # Без таймаута ожидания соединения: очередь к пулу - как раз то, что измеряется
+            request, _ = build_requests(
+                json_pool=pool_size, media_pool=pool_size, pool_timeout=None, http_version=http_version
+            )
+            bot = ExtBot('1:fake', base_url=f"{server.base_url}/bot", request=request)
+            async with bot:
+                latencies = []
+
+                async def call(i):
+                    start = time.perf_counter()
+                    if media_every and i % media_every == 0:
+                        await bot.send_photo(chat_id=i, photo=photo)
+                    else:
+                        await bot.send_message(chat_id=i, text='benchmark')
+                    latencies.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                await asyncio.gather(*(call(i) for i in range(requests)))
+                elapsed = time.perf_counter() - start
+
+            latencies.sort()
+            results[pool_size] = (requests / elapsed, latencies[int(len(latencies) * 0.99) - 1] * 1000)
+    finally:
+        await server.stop()
+    return results
+
+
+def main():
+    """Замер пропускной способности при разных размерах пула соединений"""
+    parser = argparse.ArgumentParser(description="Пропускная способность клиента Bot API против локального сервера")
+    parser.add_argument('--pools', default='1,2,4,8,16', help="Размеры пула через запятую")
+    parser.add_argument('--requests', type=int, default=200, help="Число одновременных вызовов")
+    parser.add_argument('--photos', type=float, default=0.5, help="Доля вызовов sendPhoto")
+    parser.add_argument('--latency', type=float, default=0.02, help="Задержка ответа сервера, с")
+    parser.add_argument('--http-version', default='1.1', help="1.1 или 2 (нужен пакет h2)")
+    args = parser.parse_args()
+
+    pool_sizes = [int(size) for size in args.pools.split(',')]
+    results = asyncio.run(benchmark(pool_sizes, args.requests, args.photos, args.latency, args.http_version))
+    print(f"{'пул':>5} {'запросов/с':>12} {'p99, мс':>10}")
+    for pool_size, (throughput, p99) in results.items():
+        print(f"{pool_size:>5} {throughput:>12.1f} {p99:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
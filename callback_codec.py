@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+# Версия формата callback_data: кнопки старых сообщений с другой версией не декодируются
+CALLBACK_VERSION = '1'
+
+# Действия кнопок
+PICK_COLOR = 'c'     # выбран базовый цвет -> выбор типа схемы
+SHOW_SCHEME = 's'    # выбран тип схемы -> изображение схемы
+SHOW_SHADES = 'h'    # показать оттенки цвета
+SHOW_ALL = 'a'       # все схемы цвета одним сообщением
+
+ACTIONS = (PICK_COLOR, SHOW_SCHEME, SHOW_SHADES, SHOW_ALL)
+
+# Лимит Telegram на длину callback_data
+MAX_CALLBACK_BYTES = 64
+
+# Разобранная кнопка: действие, имя цвета и тип схемы (None, если не нужен)
+CallbackData = namedtuple('CallbackData', ['action', 'color_name', 'scheme_type'])
+
+
+class CallbackCodec:
+    """Компактная запись действия, цвета и схемы в callback_data (без состояния на сервере)
+
+    Формат: <версия><действие>:<номер основы>.<оттенок>[.<номер схемы>], например
+    "1s:8.3.1" - триада для blue_3. Номера берутся из порядка цветов и схем
+    в IttenColorCircle, оттенок 0 означает цвет без номера (red, white).
+    """
+
+    def __init__(self, circle):
+        self.circle = circle
+        self.bases = list(circle.main_colors) + list(circle.neutral_colors)
+        self.scheme_types = list(circle.schemes)
+        self._base_index = {name: i for i, name in enumerate(self.bases)}
+        self._scheme_index = {name: i for i, name in enumerate(self.scheme_types)}
+
+    @staticmethod
+    def pattern(action):
+        """Регулярное выражение для CallbackQueryHandler"""
+        return f"^{CALLBACK_VERSION}{action}:"
+
+    def encode(self, action, color_name, scheme_type=None):
+        """Записать действие в callback_data"""
+        if action not in ACTIONS:
+            raise ValueError(f"Неизвестное действие кнопки: {action}")
+
+        record = self.circle.get_color_info(color_name)
+        if record is None or record.base not in self._base_index:
+            raise ValueError(f"Неизвестный цвет: {color_name}")
+
+        shade = 0 if record.name == record.base else record.shade
+        fields = [self._base_index[record.base], shade]
+        if scheme_type is not None:
+            fields.append(self._scheme_index[scheme_type])
+
+        data = f"{CALLBACK_VERSION}{action}:" + '.'.join(str(field) for field in fields)
+        if len(data.encode('utf-8')) > MAX_CALLBACK_BYTES:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data}")
+        return data
+
+    def decode(self, data):
+        """Разобрать callback_data (None, если это не кнопка текущей версии или данные неверны)"""
+        prefix, sep, payload = data.partition(':')
+        if not sep or len(prefix) != 2 or prefix[0] != CALLBACK_VERSION or prefix[1] not in ACTIONS:
+            return None
+
+        parts = payload.split('.')
+        if not all(part.isdigit() for part in parts):
+            return None
+
+        try:
+            fields = [int(part) for part in parts]
+            base = self.bases[fields[0]]
+            shade = fields[1]
+            scheme_type = self.scheme_types[fields[2]] if len(fields) > 2 else None
+        except (ValueError, IndexError):
+            return None
+
+        color_name = base if shade == 0 else f"{base}_{shade}"
+        if self.circle.get_color_info(color_name) is None:
+            return None
+        return CallbackData(prefix[1], color_name, scheme_type)
@@ -1,13 +1,45 @@
+import io
 import json
+import time
 import colorsys
+import hashlib
 from PIL import Image, ImageDraw
-import io
 import math
+from collections import namedtuple
+from types import MappingProxyType
+from render_cache import RenderCache
+from image_encoders import ImageEncoders
+import numpy_render
+import hue_schemes
+
+# Запись о цвете: имя, HEX, RGB, основной цвет, номер оттенка (None у нейтральных)
+# и позиция на круге в градусах (None у нейтральных)
+ColorRecord = namedtuple('ColorRecord', ['name', 'hex', 'rgb', 'base', 'shade', 'position'])
+
+# Базовые размеры изображений (size=None). Остальные размеры задаются длинной
+# стороной в пикселях, вся геометрия масштабируется пропорционально
+BASE_SIZES = {
+    'itten_circle': (600, 600),
+    'extended_palette': (800, 600),
+    'color_palette': (500, 200),
+    'shades_palette': (400, 200),
+}
+MIN_IMAGE_SIZE = 64
+MAX_IMAGE_SIZE = 4096
 
 class IttenColorCircle:
-    def __init__(self):
-        with open('colors.json', 'r', encoding='utf-8') as f:
-            self.colors = json.load(f)
+    def __init__(self, render_cache=None, encoders=None):
+        with open('colors.json', 'rb') as f:
+            raw = f.read()
+        self.colors = json.loads(raw.decode('utf-8'))
+        
+        # Хэш данных цветов - входит в ключ кэша изображений
+        self.colors_digest = hashlib.sha256(raw).hexdigest()
+        self.render_cache = render_cache if render_cache is not None else RenderCache()
+        # Кодировщик выбирается по типу изображения
+        self.encoders = encoders if encoders is not None else ImageEncoders()
+        # Необязательный обработчик времени рендеринга: observe(рендерер, отрисовка, кодирование)
+        self.observe = None
         
         # Основные 12 цветов круга Иттена (средние тона)
         self.main_colors = [
@@ -34,42 +66,54 @@ class IttenColorCircle:
         self.color_shades = {}
         for color in self.main_colors:
             self.color_shades[color] = [f"{color}_{i}" for i in range(1, 6)]
+        
+        # Индекс цветов: любое допустимое имя -> запись о цвете
+        self.color_index = self._build_color_index()
+        self._shade_records = MappingProxyType({
+            base: tuple(self.color_index[name] for name in names if name in self.color_index)
+            for base, names in self.color_shades.items()
+        })
+        
+        # Таблица всех схем (7 типов x 65 цветов) считается один раз
+        self._scheme_table = self._build_scheme_table()
+    
+    def _build_color_index(self):
+        """Построить неизменяемый индекс цветов из colors.json"""
+        index = {}
+        main_positions = {color: i * 30 for i, color in enumerate(self.main_colors)}
+        
+        for name, hex_color in self.colors.items():
+            base, _, shade = name.rpartition('_')
+            if base in main_positions and shade.isdigit():
+                shade = int(shade)
+            elif name in main_positions:
+                # Основной цвет без номера - это средний тон
+                base, shade = name, 3
+            else:
+                base, shade = name, None
+            
+            record = ColorRecord(
+                name=name,
+                hex=hex_color,
+                rgb=self.hex_to_rgb(hex_color),
+                base=base,
+                shade=shade,
+                position=main_positions.get(base)
+            )
+            
+            # Допустимые варианты написания: red_orange_2, red-orange-2, red orange 2
+            for alias in (name, name.replace('_', '-'), name.replace('_', ' ')):
+                index.setdefault(alias, record)
+        
+        return MappingProxyType(index)
     
     def get_color_info(self, color_name):
         """Получить информацию о цвете"""
-        color_name = color_name.lower()
-        if color_name in self.colors:
-            return {
-                'name': color_name,
-                'hex': self.colors[color_name],
-                'rgb': self.hex_to_rgb(self.colors[color_name])
-            }
-        
-        # Проверяем, может это оттенок основного цвета
-        if '_' in color_name:
-            base_color = '_'.join(color_name.split('_')[:-1])
-            shade_num = color_name.split('_')[-1]
-            if base_color in self.main_colors and shade_num.isdigit():
-                actual_name = f"{base_color}_{shade_num}"
-                if actual_name in self.colors:
-                    return {
-                        'name': actual_name,
-                        'hex': self.colors[actual_name],
-                        'rgb': self.hex_to_rgb(self.colors[actual_name])
-                    }
-        
-        return None
+        return self.color_index.get(color_name.strip().lower())
     
     def get_all_shades(self, base_color):
         """Получить все 5 оттенков для основного цвета"""
-        if base_color in self.color_shades:
-            shades = []
-            for shade_name in self.color_shades[base_color]:
-                info = self.get_color_info(shade_name)
-                if info:
-                    shades.append(info)
-            return shades
-        return []
+        return list(self._shade_records.get(base_color, ()))
     
     def hex_to_rgb(self, hex_color):
         """Конвертация HEX в RGB"""
@@ -82,29 +126,40 @@ class IttenColorCircle:
     
     def find_position(self, color_name):
         """Найти позицию цвета в круге"""
-        # Если это оттенок, берем основной цвет
-        if '_' in color_name and color_name.split('_')[-1].isdigit():
-            base_color = '_'.join(color_name.split('_')[:-1])
-        else:
-            base_color = color_name
-        
-        if base_color in self.main_colors:
-            return self.main_colors.index(base_color) * 30
-        return None
+        record = self.get_color_info(color_name)
+        return record.position if record else None
+    
+    def _build_scheme_table(self):
+        """Заранее рассчитать все схемы для всех цветов: (цвет, тип схемы) -> кортеж записей"""
+        table = {}
+        for color_name in self.colors:
+            base_info = self.color_index[color_name]
+            for scheme_type in self.schemes:
+                table[(color_name, scheme_type)] = tuple(self._compute_scheme(base_info, scheme_type))
+        return MappingProxyType(table)
     
     def get_scheme(self, base_color, scheme_type):
-        """Получить цветовую схему"""
+        """Получить цветовую схему (неизменяемый кортеж записей о цветах)"""
         base_info = self.get_color_info(base_color)
         if not base_info:
             return None
-        
-        # Определяем основной цвет для расчета схемы
-        if '_' in base_color and base_color.split('_')[-1].isdigit():
-            main_color = '_'.join(base_color.split('_')[:-1])
-        else:
-            main_color = base_color
-        
-        position = self.find_position(main_color)
+        return self._scheme_table.get((base_info.name, scheme_type))
+    
+    def get_all_schemes(self, base_color):
+        """Получить все схемы для цвета за один вызов: {тип схемы: кортеж записей}"""
+        base_info = self.get_color_info(base_color)
+        if not base_info:
+            return {}
+        return {
+            scheme_type: self._scheme_table[(base_info.name, scheme_type)]
+            for scheme_type in self.schemes
+        }
+    
+    def _compute_scheme(self, base_info, scheme_type):
+        """Рассчитать цветовую схему"""
+        # Основной цвет для расчета схемы
+        main_color = base_info.base
+        position = base_info.position
         if position is None:
             position = 0
         
@@ -178,160 +233,343 @@ class IttenColorCircle:
         
         return result
     
+    def get_exact_schemes(self, rgb):
+        """Точные схемы для произвольного цвета (тон не привязан к 12 секторам): {тип схемы: кортеж записей}"""
+        return {
+            scheme_type: tuple(self.record_for_rgb(color) for color in colors[0])
+            for scheme_type, colors in hue_schemes.generate_all_schemes([rgb]).items()
+        }
+    
+    def record_for_rgb(self, rgb):
+        """Запись о цвете вне палитры (имя - HEX-код)"""
+        rgb = tuple(int(channel) for channel in rgb)
+        hex_color = self.rgb_to_hex(rgb)
+        return ColorRecord(name=hex_color, hex=hex_color, rgb=rgb, base=None, shade=None, position=None)
+    
     def get_color_at_angle(self, angle):
         """Получить цвет по углу в круге"""
         index = round(angle / 30) % 12
         return self.main_colors[index]
     
-    def create_color_palette_image(self, colors, scheme_name):
-        """Создать изображение палитры"""
-        try:
-            width = 500
-            height = 200
-            color_width = width // len(colors)
-            
-            img = Image.new('RGB', (width, height), 'white')
-            draw = ImageDraw.Draw(img)
-            
-            # Рисуем цветные прямоугольники
-            for i, color_info in enumerate(colors):
-                x0 = i * color_width
-                x1 = (i + 1) * color_width
-                draw.rectangle([x0, 0, x1, height], fill=color_info['rgb'])
-            
-            # Добавляем рамку
-            draw.rectangle([0, 0, width-1, height-1], outline='black', width=3)
+    def image_size(self, renderer, size=None):
+        """Ширина и высота изображения, у которого длинная сторона равна size (None - базовый размер)"""
+        base_width, base_height = BASE_SIZES[renderer]
+        if size is None:
+            return base_width, base_height
+        if not MIN_IMAGE_SIZE <= size <= MAX_IMAGE_SIZE:
+            raise ValueError(f"Размер изображения должен быть от {MIN_IMAGE_SIZE} до {MAX_IMAGE_SIZE}")
+        scale = size / max(base_width, base_height)
+        return self._px(base_width, scale), self._px(base_height, scale)
+    
+    @staticmethod
+    def _px(value, scale):
+        """Размер в пикселях при масштабе scale (не меньше 1)"""
+        return max(1, round(value * scale))
+    
+    def image_key(self, renderer, colors=None, size=None, dpi=None):
+        """Ключ изображения (общий для кэша и реестра file_id)"""
+        # Названия цветов на картинке не рисуются, поэтому в ключ входят только HEX
+        inputs = [color_info.hex for color_info in colors] if colors is not None else None
+        # Базовый размер без DPI - вариант по умолчанию, у каждого другого размера свой ключ
+        if size is not None and size == max(BASE_SIZES[renderer]):
+            size = None
+        variant = [size, dpi] if size is not None or dpi else None
+        return self.render_cache.make_key(
+            renderer, inputs, self.colors_digest, self.encoders.spec(renderer), variant
+        )
+    
+    def _render_cached(self, renderer, colors, draw, size=None, dpi=None):
+        """Отрендерить изображение через кэш (draw(scale) возвращает PIL Image)"""
+        key = self.image_key(renderer, colors, size, dpi)
+        data = self.render_cache.get(key)
+        
+        if data is None:
+            width, height = self.image_size(renderer, size)
+            base_width, _ = BASE_SIZES[renderer]
             
-            # Сохраняем в байты
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
+            if width < base_width:
+                # Миниатюра всегда уменьшается из изображения базового размера (оно тоже
+                # кэшируется) - содержимое по ключу не зависит от состояния кэша
+                master = self._render_cached(renderer, colors, draw)
+                if master is None:
+                    return None
+                started = time.perf_counter()
+                img = self._downscale(master, width, height)
+            else:
+                started = time.perf_counter()
+                img = draw(width / base_width)
+            if img is None:
+                return None
             
-            return img_byte_arr
+            drawn = time.perf_counter()
+            data = self.encoders.encode(renderer, img, dpi=dpi)
+            if self.observe is not None:
+                self.observe(renderer, drawn - started, time.perf_counter() - drawn)
+            self.render_cache.put(key, data)
+        
+        # Байты отдаются как есть: без обертки и копий, их можно отправлять повторно
+        return data
+    
+    @staticmethod
+    def _downscale(master, width, height):
+        """Уменьшенная копия закодированного изображения"""
+        with Image.open(io.BytesIO(master)) as img:
+            return img.convert('RGB').resize((width, height), Image.Resampling.LANCZOS)
+    
+    def create_color_palette_image(self, colors, scheme_name, backend='pil', size=None, dpi=None):
+        """Создать изображение палитры (backend: 'pil' или 'numpy', size - длинная сторона в пикселях)"""
+        try:
+            # Оба способа отрисовки дают одинаковые пиксели, поэтому в ключ кэша не входят
+            return self._render_cached(
+                'color_palette', colors,
+                lambda scale: self._draw_color_palette(colors, backend, scale=scale),
+                size, dpi
+            )
         except Exception as e:
             print(f"Ошибка создания палитры: {e}")
             return None
     
-    def create_shades_palette(self, base_color):
-        """Создать палитру оттенков для одного цвета"""
+    def _draw_color_palette(self, colors, backend='pil', canvases=None, scale=1.0):
+        width = self._px(500, scale)
+        height = self._px(200, scale)
+        border = self._px(3, scale)
+        
+        if backend == 'numpy':
+            return numpy_render.render_strip(width, height, [color_info.rgb for color_info in colors], border)
+        
+        color_width = width // len(colors)
+        
+        img, draw = self._canvas(canvases, width, height)
+        
+        # Рисуем цветные прямоугольники
+        for i, color_info in enumerate(colors):
+            x0 = i * color_width
+            x1 = (i + 1) * color_width
+            draw.rectangle([x0, 0, x1, height], fill=color_info.rgb)
+        
+        # Добавляем рамку
+        draw.rectangle([0, 0, width-1, height-1], outline='black', width=border)
+        
+        return img
+    
+    def _canvas(self, canvases, width, height):
+        """Белый холст нужного размера: новый или переиспользованный из canvases {размер: (img, draw)}"""
+        if canvases is None:
+            img = Image.new('RGB', (width, height), 'white')
+            return img, ImageDraw.Draw(img)
+        
+        canvas = canvases.get((width, height))
+        if canvas is None:
+            img = Image.new('RGB', (width, height), 'white')
+            canvas = canvases[(width, height)] = (img, ImageDraw.Draw(img))
+        else:
+            canvas[1].rectangle([0, 0, width, height], fill='white')
+        return canvas
+    
+    def create_palette_batch(self, palettes, backend='pil', size=None):
+        """Отрендерить пачку палитр [цвета, ...] на одном переиспользуемом холсте (size - как у create_color_palette_image)"""
+        # Холст можно переиспользовать: _render_cached кодирует изображение сразу после отрисовки
+        canvases = {}
+        results = []
+        for colors in palettes:
+            try:
+                results.append(self._render_cached(
+                    'color_palette', colors,
+                    lambda scale: self._draw_color_palette(colors, backend, canvases, scale),
+                    size
+                ))
+            except Exception as e:
+                print(f"Ошибка создания палитры: {e}")
+                results.append(None)
+        return results
+    
+    def scheme_sheet_key(self, color_name):
+        """Ключ изображения со всеми схемами цвета"""
+        schemes = self.get_all_schemes(color_name)
+        inputs = [[color_info.hex for color_info in colors] for colors in schemes.values()]
+        return self.render_cache.make_key('scheme_sheet', inputs, self.colors_digest, self.encoders.spec('scheme_sheet'))
+    
+    def create_scheme_sheet(self, color_name):
+        """Создать одно изображение со всеми схемами цвета (по строке на схему)"""
+        try:
+            key = self.scheme_sheet_key(color_name)
+            data = self.render_cache.get(key)
+            if data is None:
+                schemes = self.get_all_schemes(color_name)
+                if not schemes:
+                    return None
+                started = time.perf_counter()
+                img = self._draw_scheme_sheet(list(schemes.values()))
+                drawn = time.perf_counter()
+                data = self.encoders.encode('scheme_sheet', img)
+                if self.observe is not None:
+                    self.observe('scheme_sheet', drawn - started, time.perf_counter() - drawn)
+                self.render_cache.put(key, data)
+            return data
+        except Exception as e:
+            print(f"Ошибка создания листа схем: {e}")
+            return None
+    
+    def _draw_scheme_sheet(self, schemes):
+        width = 500
+        row_height = 100
+        height = row_height * len(schemes)
+        
+        img = Image.new('RGB', (width, height), 'white')
+        draw = ImageDraw.Draw(img)
+        
+        for row, colors in enumerate(schemes):
+            y0 = row * row_height
+            color_width = width // len(colors)
+            for i, color_info in enumerate(colors):
+                draw.rectangle([i * color_width, y0, (i + 1) * color_width, y0 + row_height], fill=color_info.rgb)
+            # Разделитель между схемами
+            draw.line([0, y0, width, y0], fill='black', width=2)
+        
+        # Рамка
+        draw.rectangle([0, 0, width-1, height-1], outline='black', width=3)
+        
+        return img
+    
+    def create_shades_palette(self, base_color, backend='pil', size=None, dpi=None):
+        """Создать палитру оттенков для одного цвета (backend: 'pil' или 'numpy', size - длинная сторона)"""
         try:
             shades = self.get_all_shades(base_color)
             if not shades:
                 return None
             
-            width = 400
-            height = 200
-            
-            img = Image.new('RGB', (width, height), 'white')
-            draw = ImageDraw.Draw(img)
-            
-            color_width = width // len(shades)
-            
-            # Рисуем оттенки
-            for i, shade_info in enumerate(shades):
-                x0 = i * color_width
-                x1 = (i + 1) * color_width
-                draw.rectangle([x0, 0, x1, height], fill=shade_info['rgb'])
-            
-            # Рамка
-            draw.rectangle([0, 0, width-1, height-1], outline='black', width=3)
-            
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
-            
-            return img_byte_arr
+            return self._render_cached(
+                'shades_palette', shades,
+                lambda scale: self._draw_shades_palette(shades, backend, scale),
+                size, dpi
+            )
         except Exception as e:
             print(f"Ошибка создания палитры оттенков: {e}")
             return None
     
-    def create_itten_circle_image(self):
-        """Создать изображение цветового круга Иттена"""
+    def _draw_shades_palette(self, shades, backend='pil', scale=1.0):
+        width = self._px(400, scale)
+        height = self._px(200, scale)
+        border = self._px(3, scale)
+        
+        if backend == 'numpy':
+            return numpy_render.render_strip(width, height, [shade_info.rgb for shade_info in shades], border)
+        
+        img = Image.new('RGB', (width, height), 'white')
+        draw = ImageDraw.Draw(img)
+        
+        color_width = width // len(shades)
+        
+        # Рисуем оттенки
+        for i, shade_info in enumerate(shades):
+            x0 = i * color_width
+            x1 = (i + 1) * color_width
+            draw.rectangle([x0, 0, x1, height], fill=shade_info.rgb)
+        
+        # Рамка
+        draw.rectangle([0, 0, width-1, height-1], outline='black', width=border)
+        
+        return img
+    
+    def create_itten_circle_image(self, size=None, dpi=None):
+        """Создать изображение цветового круга Иттена (size - сторона в пикселях, dpi - для печати)"""
         try:
-            size = 600
-            center = size // 2
-            radius = 250
-            
-            img = Image.new('RGB', (size, size), 'white')
-            draw = ImageDraw.Draw(img)
-            
-            # Рисуем цветовой круг
-            for i, color_name in enumerate(self.main_colors):
-                color_hex = self.colors[color_name]
-                rgb = self.hex_to_rgb(color_hex)
-                
-                # Угол для сектора (12 секторов по 30 градусов)
-                start_angle = i * 30 - 15
-                end_angle = (i + 1) * 30 - 15
-                
-                # Рисуем сектор
-                draw.pieslice(
-                    [center - radius, center - radius, center + radius, center + radius],
-                    start_angle, end_angle,
-                    fill=rgb, outline='black'
-                )
-            
-            # Внутренний белый круг
-            inner_radius = radius // 3
-            draw.ellipse(
-                [center - inner_radius, center - inner_radius, 
-                 center + inner_radius, center + inner_radius],
-                fill='white', outline='black'
-            )
-            
-            # Рамка
-            draw.rectangle([0, 0, size-1, size-1], outline='black', width=3)
-            
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
-            
-            return img_byte_arr
+            return self._render_cached('itten_circle', None, self._draw_itten_circle, size, dpi)
         except Exception as e:
             print(f"Ошибка создания круга Иттена: {e}")
             return None
     
-    def create_extended_palette_image(self):
-        """Создать изображение полной палитры (60 цветов)"""
-        try:
-            width = 800
-            height = 600
-            
-            img = Image.new('RGB', (width, height), 'white')
-            draw = ImageDraw.Draw(img)
-            
-            # Создаем сетку 12x5 (12 цветов по 5 оттенков)
-            cols = 12
-            rows = 5
-            
-            color_width = width // cols
-            color_height = height // rows
-            
-            for col_idx, main_color in enumerate(self.main_colors):
-                shades = self.get_all_shades(main_color)
-                for row_idx, shade_info in enumerate(shades):
-                    x0 = col_idx * color_width
-                    y0 = row_idx * color_height
-                    x1 = x0 + color_width
-                    y1 = y0 + color_height
-                    
-                    draw.rectangle([x0, y0, x1, y1], fill=shade_info['rgb'])
-                    
-                    # Тонкая рамка для каждого цвета
-                    draw.rectangle([x0, y0, x1, y1], outline='black', width=1)
-            
-            # Внешняя рамка
-            draw.rectangle([0, 0, width-1, height-1], outline='black', width=3)
+    def _draw_itten_circle(self, scale=1.0):
+        size = self._px(600, scale)
+        center = size // 2
+        radius = self._px(250, scale)
+        line = self._px(1, scale)
+        
+        img = Image.new('RGB', (size, size), 'white')
+        draw = ImageDraw.Draw(img)
+        
+        # Рисуем цветовой круг
+        for i, color_name in enumerate(self.main_colors):
+            rgb = self.color_index[color_name].rgb
             
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
+            # Угол для сектора (12 секторов по 30 градусов)
+            start_angle = i * 30 - 15
+            end_angle = (i + 1) * 30 - 15
             
-            return img_byte_arr
+            # Рисуем сектор
+            draw.pieslice(
+                [center - radius, center - radius, center + radius, center + radius],
+                start_angle, end_angle,
+                fill=rgb, outline='black', width=line
+            )
+        
+        # Внутренний белый круг
+        inner_radius = radius // 3
+        draw.ellipse(
+            [center - inner_radius, center - inner_radius, 
+             center + inner_radius, center + inner_radius],
+            fill='white', outline='black', width=line
+        )
+        
+        # Рамка
+        draw.rectangle([0, 0, size-1, size-1], outline='black', width=self._px(3, scale))
+        
+        return img
+    
+    def create_extended_palette_image(self, backend='pil', size=None, dpi=None):
+        """Создать изображение полной палитры (60 цветов, backend: 'pil' или 'numpy', size - длинная сторона)"""
+        try:
+            return self._render_cached(
+                'extended_palette', None,
+                lambda scale: self._draw_extended_palette(backend, scale),
+                size, dpi
+            )
         except Exception as e:
             print(f"Ошибка создания полной палитры: {e}")
             return None
     
+    def _draw_extended_palette(self, backend='pil', scale=1.0):
+        width = self._px(800, scale)
+        height = self._px(600, scale)
+        border = self._px(3, scale)
+        
+        if backend == 'numpy':
+            grid = [
+                [shade_info.rgb for shade_info in self.get_all_shades(main_color)]
+                for main_color in self.main_colors
+            ]
+            return numpy_render.render_grid(width, height, grid, border)
+        
+        img = Image.new('RGB', (width, height), 'white')
+        draw = ImageDraw.Draw(img)
+        
+        # Создаем сетку 12x5 (12 цветов по 5 оттенков)
+        cols = 12
+        rows = 5
+        
+        color_width = width // cols
+        color_height = height // rows
+        
+        for col_idx, main_color in enumerate(self.main_colors):
+            shades = self.get_all_shades(main_color)
+            for row_idx, shade_info in enumerate(shades):
+                x0 = col_idx * color_width
+                y0 = row_idx * color_height
+                x1 = x0 + color_width
+                y1 = y0 + color_height
+                
+                draw.rectangle([x0, y0, x1, y1], fill=shade_info.rgb)
+                
+                # Тонкая рамка для каждого цвета: линии сетки остаются
+                # в 1 пиксель при любом размере
+                draw.rectangle([x0, y0, x1, y1], outline='black', width=1)
+        
+        # Внешняя рамка
+        draw.rectangle([0, 0, width-1, height-1], outline='black', width=border)
+        
+        return img
+    
+
     def get_all_colors_list(self):
         """Получить список всех доступных цветов"""
         return list(self.colors.keys())
@@ -0,0 +1,158 @@
+import colorsys
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Поиск ближайшего цвета палитры в пространстве CIELAB (метрика ΔE2000).
+# Кандидаты отбираются векторно по евклидову расстоянию в Lab (ΔE76),
+# точная ΔE2000 считается только для них - это масштабируется на десятки тысяч цветов.
+
+# Матрица sRGB -> XYZ и белая точка D65
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+# Сколько ближайших по ΔE76 кандидатов пересчитывается по ΔE2000
+CANDIDATES = 32
+
+# Допуск сравнения разности тонов с 180°: у противоположных тонов ошибка округления
+# (180.00000000000006) иначе переключает ветку формулы
+_HUE_EPSILON = 1e-9
+
+# Без # шестнадцатеричный цвет должен содержать цифру: слова из букв a-f
+# (facade, decade, bedded) - это текст, а не цвет
+_HEX_RE = re.compile(r'^(?:#|(?=.*\d))([0-9a-f]{6})$|^#([0-9a-f]{3})$')
+_NUMBERS_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def parse_color(text):
+    """Разобрать цвет из текста: #3A7BD5, #abc, 3a7bd5 (с цифрой), rgb(58, 123, 213), 58 123 213,
+    hsv(214, 73%, 84%). Возвращает (r, g, b) или None"""
+    text = text.strip().lower()
+
+    match = _HEX_RE.match(text)
+    if match:
+        digits = match.group(1) or ''.join(char * 2 for char in match.group(2))
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+    is_hsv = text.startswith('hsv')
+    if text.startswith(('rgb', 'hsv')):
+        text = text[3:]
+    if re.search(r'[^\d\s,.%()°-]', text):
+        return None
+
+    numbers = [float(number) for number in _NUMBERS_RE.findall(text)]
+    if len(numbers) != 3:
+        return None
+
+    if is_hsv:
+        h, s, v = numbers
+        if not (0 <= s <= 100 and 0 <= v <= 100):
+            return None
+        rgb = colorsys.hsv_to_rgb((h % 360) / 360, s / 100, v / 100)
+        return tuple(round(channel * 255) for channel in rgb)
+
+    if not all(0 <= channel <= 255 for channel in numbers):
+        return None
+    return tuple(int(round(channel)) for channel in numbers)
+
+
+def rgb_to_lab(rgb):
+    """Перевести массив цветов sRGB (..., 3) с каналами 0-255 в CIELAB (D65)"""
+    c = np.asarray(rgb, dtype=np.float64) / 255
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _WHITE_D65
+
+    epsilon, kappa = 216 / 24389, 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+    return np.stack([
+        116 * f[..., 1] - 16,
+        500 * (f[..., 0] - f[..., 1]),
+        200 * (f[..., 1] - f[..., 2]),
+    ], axis=-1)
+
+
+def delta_e_2000(lab1, lab2):
+    """Цветовое отличие ΔE2000 (CIEDE2000) между массивами Lab с совместимыми формами"""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    c_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_bar ** 7 / (c_bar ** 7 + 25 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+
+    chroma_zero = c1p * c2p == 0
+    dh = h2p - h1p
+    dh = np.where(dh > 180 + _HUE_EPSILON, dh - 360, np.where(dh < -180 - _HUE_EPSILON, dh + 360, dh))
+    dh = np.where(chroma_zero, 0, dh)
+
+    d_l = L2 - L1
+    d_c = c2p - c1p
+    d_h = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(dh / 2))
+
+    l_bar = (L1 + L2) / 2
+    cp_bar = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_bar = np.where(
+        np.abs(h1p - h2p) <= 180 + _HUE_EPSILON, h_sum / 2,
+        np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2)
+    )
+    h_bar = np.where(chroma_zero, h_sum, h_bar)
+
+    t = (1 - 0.17 * np.cos(np.radians(h_bar - 30)) + 0.24 * np.cos(np.radians(2 * h_bar))
+         + 0.32 * np.cos(np.radians(3 * h_bar + 6)) - 0.20 * np.cos(np.radians(4 * h_bar - 63)))
+    d_theta = 30 * np.exp(-((h_bar - 275) / 25) ** 2)
+    r_c = 2 * np.sqrt(cp_bar ** 7 / (cp_bar ** 7 + 25 ** 7))
+    s_l = 1 + 0.015 * (l_bar - 50) ** 2 / np.sqrt(20 + (l_bar - 50) ** 2)
+    s_c = 1 + 0.045 * cp_bar
+    s_h = 1 + 0.015 * cp_bar * t
+    r_t = -np.sin(np.radians(2 * d_theta)) * r_c
+
+    return np.sqrt(
+        (d_l / s_l) ** 2 + (d_c / s_c) ** 2 + (d_h / s_h) ** 2
+        + r_t * (d_c / s_c) * (d_h / s_h)
+    )
+
+
+class NearestColorIndex:
+    """Ближайшие цвета палитры для произвольного RGB (Lab палитры рассчитан заранее)"""
+
+    def __init__(self, names, rgbs):
+        self.names = list(names)
+        self.lab = rgb_to_lab(np.asarray(rgbs, dtype=np.uint8).reshape(-1, 3))
+        # |lab|^2 для расчета расстояний через одно матрично-векторное умножение
+        self._norms = np.einsum('ij,ij->i', self.lab, self.lab)
+        # Результаты для недавних запросов (цвета из сообщений часто повторяются)
+        self.nearest = lru_cache(maxsize=4096)(self._nearest)
+
+    @classmethod
+    def from_circle(cls, circle):
+        """Индекс по всем цветам colors.json"""
+        records = [circle.get_color_info(name) for name in circle.get_all_colors_list()]
+        return cls([record.name for record in records], [record.rgb for record in records])
+
+    def _nearest(self, rgb, k=1):
+        """k ближайших цветов: кортеж (имя, ΔE2000) по возрастанию отличия"""
+        target = rgb_to_lab(rgb)
+
+        # Отбор кандидатов по ΔE76 без сортировки всей палитры
+        candidates = min(max(k, CANDIDATES), len(self.names))
+        # |lab - target|^2 без постоянного слагаемого |target|^2
+        distances = self._norms - 2 * (self.lab @ target)
+        if candidates < len(self.names):
+            indices = np.argpartition(distances, candidates - 1)[:candidates]
+        else:
+            indices = np.arange(len(self.names))
+
+        delta = delta_e_2000(target, self.lab[indices])
+        order = np.argsort(delta, kind='stable')[:k]
+        return tuple((self.names[indices[i]], float(delta[i])) for i in order)
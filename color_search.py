@@ -0,0 +1,158 @@
+from collections import Counter
+
+# Русские названия основных и нейтральных цветов (как в описании круга Иттена)
+RUSSIAN_NAMES = {
+    'red': 'красный',
+    'red_orange': 'красно-оранжевый',
+    'orange': 'оранжевый',
+    'yellow_orange': 'желто-оранжевый',
+    'yellow': 'желтый',
+    'yellow_green': 'желто-зеленый',
+    'green': 'зеленый',
+    'green_blue': 'зелено-синий',
+    'blue': 'синий',
+    'blue_violet': 'сине-фиолетовый',
+    'violet': 'фиолетовый',
+    'red_violet': 'красно-фиолетовый',
+    'white': 'белый',
+    'light_gray': 'светло-серый',
+    'gray': 'серый',
+    'dark_gray': 'темно-серый',
+    'black': 'черный',
+}
+
+# Число результатов, которое хранится в каждом узле префиксного дерева
+TOP_K = 10
+
+
+def _trigrams(key):
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a, b, max_distance):
+    """Расстояние Левенштейна; если оно больше max_distance - возвращается max_distance + 1"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        # Вся строка уже хуже порога - дальше будет только больше
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class ColorSearchIndex:
+    """Поиск цветов по имени: точное совпадение, префиксное дерево и триграммы для опечаток
+
+    Ключи поиска - имена из colors.json и русские названия (красный_2 -> red_2).
+    Префиксы ищутся и с начала каждого слова: "orange" находит red_orange.
+    """
+
+    def __init__(self, circle):
+        self.circle = circle
+        self.names = circle.get_all_colors_list()
+        # Имена основных цветов идут раньше оттенков при равной оценке
+        self._order = {name: i for i, name in enumerate(sorted(self.names, key=lambda n: (len(n), n)))}
+
+        # Все ключи поиска: ключ -> имя цвета
+        self.keys = {}
+        for name in self.names:
+            self.keys.setdefault(name, name)
+            record = circle.get_color_info(name)
+            russian = RUSSIAN_NAMES.get(record.base)
+            if russian:
+                russian = self.normalize(russian)
+                self.keys.setdefault(russian if name == record.base else f"{russian}_{record.shade}", name)
+
+        self._trie = self._build_trie()
+        self._grams = {}
+        for key in self.keys:
+            for gram in _trigrams(key):
+                self._grams.setdefault(gram, []).append(key)
+
+    @staticmethod
+    def normalize(text):
+        """Привести запрос к виду ключей colors.json"""
+        text = text.strip().lower().replace('ё', 'е')
+        return '_'.join(text.replace('-', ' ').replace('_', ' ').split())
+
+    def _build_trie(self):
+        """Префиксное дерево: в каждом узле лучшие TOP_K имен цветов для этого префикса"""
+        # Вставляем ключ целиком и его окончания с начала каждого слова
+        # (с меньшим приоритетом, чем совпадение с начала имени)
+        entries = []
+        for key, name in self.keys.items():
+            words = key.split('_')
+            for i in range(len(words)):
+                suffix = '_'.join(words[i:])
+                if not suffix.isdigit():
+                    entries.append((suffix, (i > 0, self._order[name]), name))
+
+        trie = {}
+        for suffix, rank, name in sorted(entries, key=lambda entry: entry[1]):
+            node = trie
+            for char in suffix:
+                node = node.setdefault(char, {})
+                top = node.setdefault('', [])
+                if len(top) < TOP_K and name not in top:
+                    top.append(name)
+        return trie
+
+    def lookup(self, text):
+        """Имя цвета для точного совпадения (в т.ч. по русскому названию) или None"""
+        query = self.normalize(text)
+        record = self.circle.get_color_info(query)
+        if record:
+            return record.name
+        return self.keys.get(query)
+
+    def complete(self, text, limit=TOP_K):
+        """Имена цветов, начинающиеся с запроса (или со слова внутри имени)"""
+        node = self._trie
+        for char in self.normalize(text):
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])[:limit]
+
+    def fuzzy(self, text, limit=TOP_K):
+        """Имена цветов, отличающиеся от запроса не более чем на 1-2 правки"""
+        query = self.normalize(text)
+        if not query:
+            return []
+        max_distance = 1 if len(query) <= 4 else 2
+
+        # Кандидаты - ключи с общими триграммами; расстояние проверяем только для них
+        shared = Counter(key for gram in _trigrams(query) for key in self._grams.get(gram, ()))
+        scored = []
+        for key, _ in shared.most_common(TOP_K * 4):
+            distance = _edit_distance(query, key, max_distance)
+            if distance <= max_distance:
+                scored.append((distance, self._order[self.keys[key]], self.keys[key]))
+
+        return list(dict.fromkeys(name for _, _, name in sorted(scored)))[:limit]
+
+    def search(self, text, limit=10):
+        """Имена цветов, отсортированные по близости к запросу"""
+        if not self.normalize(text):
+            return []
+
+        exact = self.lookup(text)
+        ranked = [exact] if exact else []
+        ranked += self.complete(text, limit)
+        # Опечатки ищем, только если по префиксу ничего не нашлось
+        if not ranked:
+            ranked = self.fuzzy(text, limit)
+
+        # Убираем повторы, сохраняя порядок
+        return list(dict.fromkeys(ranked))[:limit]
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import random
+import re
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+
+from http_util import keep_alive, read_request
+
+# Локальная имитация сервера Bot API для замеров и проверок без Telegram.
+# Отвечает на основные методы правдоподобными объектами, задержку ответа
+# можно задать, чтобы сетевые эффекты (пул соединений, очередь) были видны.
+# Обновления для бота ставятся в очередь push_update() и отдаются через
+# getUpdates (long polling); часть запросов можно отклонять ответом 429.
+
+READ_TIMEOUT = 60
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    429: 'Too Many Requests',
+}
+
+# chat_id в теле запроса: JSON, form-urlencoded (так отправляет HTTPXRequest) и multipart
+_CHAT_ID_JSON_RE = re.compile(rb'"chat_id"\s*:\s*"?(-?\d+)')
+_CHAT_ID_URLENCODED_RE = re.compile(rb'(?:^|&)chat_id=(-?\d+)')
+_CHAT_ID_FORM_RE = re.compile(rb'name="chat_id"\r\n\r\n(-?\d+)')
+# Массив media у sendMediaGroup в multipart - JSON-строка в отдельном поле
+_MEDIA_FORM_RE = re.compile(rb'name="media"\r\n\r\n(.*?)\r\n--', re.DOTALL)
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+# Методы, которыми бот отвечает пользователю (ожидание ответа - wait_reply)
+REPLY_METHODS = frozenset({'sendMessage', 'editMessageText', 'sendPhoto', 'sendDocument', 'sendMediaGroup'})
+
+# Методы, на которые по умолчанию приходит 429 (у Telegram лимиты - на отправку сообщений)
+THROTTLED_METHODS = REPLY_METHODS | {'editMessageMedia'}
+
+# Предел long polling getUpdates, секунды (как у Telegram)
+MAX_POLL_TIMEOUT = 50
+
+
+class FakeBotApi:
+    """HTTP-сервер с API, совместимым с Bot API для методов, которые использует бот"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, throttle_ratio=0.0, retry_after=1,
+                 throttled_methods=THROTTLED_METHODS, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        # Доля запросов throttled_methods, отклоняемых ответом 429 с retry_after
+        self.throttle_ratio = throttle_ratio
+        self.retry_after = retry_after
+        self.throttled_methods = throttled_methods
+        self._random = random.Random(seed)
+        self._server = None
+        self._message_id = 0
+
+        # Очередь обновлений для getUpdates и ожидающие ответа бота: чат -> [future, ...]
+        self._updates = deque()
+        self._update_id = 0
+        self._updates_added = asyncio.Event()
+        self._reply_waiters = {}
+
+        # Статистика: число вызовов по методам, объем принятых тел запросов, ответы 429
+        self.calls = {}
+        self.received_bytes = 0
+        self.throttled = 0
+
+    @property
+    def base_url(self):
+        """Адрес для BOT_API_BASE_URL / Application.builder().base_url()"""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        """Начать прием соединений (port=0 - свободный порт)"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Остановить сервер"""
+        if self._server is None:
+            return
+        self._server.close()
+        # Ожидающие getUpdates отвечают сразу, а не по истечении long polling
+        self._updates_added.set()
+        await asyncio.sleep(0)
+        await self._server.wait_closed()
+        self._server = None
+
+    def stats(self):
+        """Статистика сервера"""
+        return {
+            'calls': dict(self.calls),
+            'received_bytes': self.received_bytes,
+            'throttled': self.throttled,
+            'pending_updates': len(self._updates),
+        }
+
+    def push_update(self, update):
+        """Поставить обновление в очередь getUpdates (update_id назначается по порядку)"""
+        self._update_id += 1
+        self._updates.append({**update, 'update_id': self._update_id})
+        self._updates_added.set()
+        return self._update_id
+
+    def wait_reply(self, chat_id):
+        """Future со следующим ответом бота в чат (объект сообщения из ответа метода)
+
+        Создается до push_update(), иначе быстрый ответ может прийти раньше ожидания
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._reply_waiters.setdefault(chat_id, []).append(future)
+        return future
+
+    def _resolve_reply(self, chat_id, result):
+        waiters = self._reply_waiters.get(chat_id)
+        while waiters:
+            future = waiters.pop(0)
+            if not future.done():
+                # У sendMediaGroup результат - список сообщений
+                future.set_result(result[0] if isinstance(result, list) else result)
+                break
+        if not waiters:
+            self._reply_waiters.pop(chat_id, None)
+
+    async def _get_updates(self, body):
+        params = json.loads(body) if body.startswith(b'{') else dict(parse_qsl(body.decode('utf-8')))
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        timeout = min(float(params.get('timeout', 0)), MAX_POLL_TIMEOUT)
+
+        # Обновления с id меньше offset бот уже получил
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout > 0:
+            self._updates_added.clear()
+            try:
+                await asyncio.wait_for(self._updates_added.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return [update for _, update in zip(range(limit), self._updates)]
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await asyncio.wait_for(read_request(reader), READ_TIMEOUT)
+                if request is None:
+                    break
+
+                _, path, headers, body = request
+                status, payload = await self._dispatch(path, body)
+                self._write_response(writer, status, payload, keep_alive(headers))
+                await writer.drain()
+
+                if not keep_alive(headers):
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, path, body):
+        # Путь: /bot<токен>/<метод>
+        return await self.call(path.split('?', 1)[0].rsplit('/', 1)[-1], body)
+
+    async def call(self, method, body):
+        """Ответ на вызов метода: (HTTP-статус, объект ответа Bot API)
+
+        Можно вызывать и без сервера - для замеров бота в том же процессе
+        """
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.received_bytes += len(body)
+
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': await self._get_updates(body)}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if (self.throttle_ratio and method in self.throttled_methods
+                and self._random.random() < self.throttle_ratio):
+            self.throttled += 1
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }
+
+        chat_id = self._chat_id(body)
+        result = self._result(method, chat_id, body)
+        if result is None:
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+        if method in REPLY_METHODS:
+            self._resolve_reply(chat_id, result)
+        return 200, {'ok': True, 'result': result}
+
+    @staticmethod
+    def _chat_id(body):
+        match = _CHAT_ID_URLENCODED_RE.search(body) or _CHAT_ID_JSON_RE.search(body) or _CHAT_ID_FORM_RE.search(body)
+        return int(match.group(1)) if match else 0
+
+    @staticmethod
+    def _media_count(body):
+        """Число элементов media в теле sendMediaGroup (JSON, form-urlencoded или multipart)"""
+        if body.startswith(b'{'):
+            media = json.loads(body).get('media', [])
+        else:
+            match = _MEDIA_FORM_RE.search(body)
+            if match:
+                media = match.group(1).decode('utf-8')
+            else:
+                media = dict(parse_qsl(body.decode('utf-8', 'replace'))).get('media', '[]')
+        if isinstance(media, str):
+            media = json.loads(media)
+        return len(media)
+
+    def _message(self, chat_id, **fields):
+        self._message_id += 1
+        chat = {'id': chat_id, 'type': 'private' if chat_id >= 0 else 'group', 'first_name': 'User'}
+        return {'message_id': self._message_id, 'date': int(time.time()), 'chat': chat, 'from': BOT_USER, **fields}
+
+    def _photo(self):
+        file_id = f"fake-photo-{self._message_id + 1}"
+        return [{'file_id': file_id, 'file_unique_id': file_id, 'width': 600, 'height': 600}]
+
+    def _result(self, method, chat_id, body):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            return self._message(chat_id, text='')
+        if method in ('sendPhoto', 'editMessageMedia'):
+            return self._message(chat_id, photo=self._photo())
+        if method == 'sendDocument':
+            file_id = f"fake-document-{self._message_id + 1}"
+            return self._message(chat_id, document={'file_id': file_id, 'file_unique_id': file_id})
+        if method == 'sendMediaGroup':
+            # По сообщению на каждый элемент альбома, как у Telegram
+            return [self._message(chat_id, photo=self._photo()) for _ in range(self._media_count(body))]
+        if method in ('answerCallbackQuery', 'answerInlineQuery', 'deleteMessage',
+                      'setMyCommands', 'setWebhook', 'deleteWebhook'):
+            return True
+        return None
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
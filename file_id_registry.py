@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+
+class FileIdRegistry:
+    """Реестр file_id Telegram для уже загруженных изображений (ключ изображения -> file_id)
+
+    Пока запущена фоновая запись (start), изменения сохраняются в файл раз в
+    save_interval секунд в отдельном потоке; без нее - сразу при изменении.
+    """
+
+    def __init__(self, filename=None, save_interval=5.0):
+        self.filename = filename
+        self.save_interval = save_interval
+        self._ids = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._task = None
+
+        if self.filename:
+            self.load()
+
+    def get(self, key):
+        """Получить file_id по ключу изображения"""
+        with self._lock:
+            return self._ids.get(key)
+
+    def set(self, key, file_id):
+        """Запомнить file_id для ключа изображения"""
+        with self._lock:
+            if self._ids.get(key) == file_id:
+                return
+            self._ids[key] = file_id
+        self._changed()
+
+    def forget(self, key):
+        """Удалить устаревший file_id"""
+        with self._lock:
+            if self._ids.pop(key, None) is None:
+                return
+        self._changed()
+
+    def clear(self):
+        """Забыть все file_id"""
+        with self._lock:
+            if not self._ids:
+                return
+            self._ids = {}
+        self._changed()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids)
+
+    def _changed(self):
+        # При фоновой записи файл не пишется в цикле событий
+        if self._task is not None:
+            self._dirty = True
+        else:
+            self.save()
+
+    def load(self):
+        """Загрузить реестр из файла"""
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения реестра file_id: {e}")
+            return
+
+        with self._lock:
+            self._ids = {str(k): str(v) for k, v in data.items()}
+
+    def save(self):
+        """Сохранить реестр в файл (атомарно)"""
+        if not self.filename:
+            return
+
+        with self._lock:
+            self._dirty = False
+            data = dict(self._ids)
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.filename)
+        except OSError as e:
+            print(f"Ошибка сохранения реестра file_id: {e}")
+
+    async def start(self):
+        """Запустить фоновую запись изменений"""
+        if self._task is None and self.filename:
+            self._task = asyncio.create_task(self._save_loop())
+
+    async def stop(self):
+        """Остановить фоновую запись и сохранить остаток"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        if self._dirty:
+            await asyncio.to_thread(self.save)
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            if self._dirty:
+                await asyncio.to_thread(self.save)
@@ -0,0 +1,41 @@
+# Разбор HTTP/1.1-запросов для встроенных серверов на asyncio.start_server
+# (webhook, метрики, имитация Bot API). Некорректный запрос - ValueError.
+
+
+async def read_request(reader, max_body=None):
+    """Прочитать один HTTP-запрос: (метод, путь, заголовки, тело) или None при закрытии
+
+    Имена заголовков - в нижнем регистре. Если тело длиннее max_body, оно не читается:
+    тело - None, а заголовок connection - 'close' (соединение после ответа закрывается)
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError(f"Некорректная строка запроса: {request_line!r}")
+    method, path, _ = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError(f"Некорректная длина тела: {length}")
+    if max_body is not None and length > max_body:
+        headers['connection'] = 'close'
+        return method, path, headers, None
+
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def keep_alive(headers):
+    """Оставлять ли соединение открытым после ответа"""
+    return headers.get('connection', '').lower() != 'close'
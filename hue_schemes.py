@@ -0,0 +1,94 @@
+import numpy as np
+
+# Цветовые схемы без привязки к 12 секторам круга: поворот тона в HSV
+# на точные углы с сохранением насыщенности и яркости.
+# Все функции принимают массивы цветов (..., 3) и считают их разом.
+
+# Углы поворота тона для каждой схемы (первый цвет - исходный)
+SCHEME_OFFSETS = {
+    'complementary': (0, 180),
+    'triad': (0, 120, 240),
+    'analogous': (-30, 0, 30),
+    'square': (0, 90, 180, 270),
+    'split_complementary': (0, 150, 210),
+    'rectangle': (0, 60, 180, 240),
+}
+
+# Монохроматическая схема: доля смешивания с белым (> 0) или черным (< 0),
+# от самого светлого оттенка к самому темному - как 5 оттенков в colors.json
+MONOCHROMATIC_STEPS = (0.5, 0.25, 0.0, -0.25, -0.5)
+
+
+def rgb_to_hsv(rgb):
+    """Массив RGB (..., 3) с каналами 0-255 -> HSV: тон в градусах, насыщенность и яркость 0-1"""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = rgb.max(axis=-1)
+    delta = maxc - rgb.min(axis=-1)
+    safe = np.where(delta == 0, 1, delta)
+
+    hue = np.where(
+        maxc == r, ((g - b) / safe) % 6,
+        np.where(maxc == g, (b - r) / safe + 2, (r - g) / safe + 4)
+    )
+    hue = np.where(delta == 0, 0, hue) * 60
+    saturation = np.where(maxc > 0, delta / np.where(maxc > 0, maxc, 1), 0)
+    return np.stack([hue, saturation, maxc], axis=-1)
+
+
+def hsv_to_rgb(hsv):
+    """Массив HSV (..., 3) -> RGB uint8"""
+    hsv = np.asarray(hsv, dtype=np.float64)
+    hue, saturation, value = hsv[..., 0] % 360, hsv[..., 1], hsv[..., 2]
+
+    chroma = value * saturation
+    sector = hue / 60
+    x = chroma * (1 - np.abs(sector % 2 - 1))
+    zero = np.zeros_like(chroma)
+
+    # Порядок (r, g, b) для каждого из 6 секторов тона
+    candidates = np.stack([
+        np.stack([chroma, x, zero], axis=-1),
+        np.stack([x, chroma, zero], axis=-1),
+        np.stack([zero, chroma, x], axis=-1),
+        np.stack([zero, x, chroma], axis=-1),
+        np.stack([x, zero, chroma], axis=-1),
+        np.stack([chroma, zero, x], axis=-1),
+    ])
+    index = np.minimum(sector.astype(np.int64), 5)
+    rgb = np.take_along_axis(candidates, index[np.newaxis, ..., np.newaxis], axis=0)[0]
+    rgb += (value - chroma)[..., np.newaxis]
+    return np.clip(np.rint(rgb * 255), 0, 255).astype(np.uint8)
+
+
+def generate_schemes(rgbs, scheme_type):
+    """Схема для каждого цвета: массив (N, 3) -> (N, число цветов схемы, 3), RGB uint8"""
+    rgbs = np.asarray(rgbs, dtype=np.uint8).reshape(-1, 3)
+
+    if scheme_type == 'monochromatic':
+        steps = np.asarray(MONOCHROMATIC_STEPS)[np.newaxis, :, np.newaxis]
+        colors = rgbs[:, np.newaxis, :].astype(np.float64)
+        target = np.where(steps > 0, 255.0, 0.0)
+        mixed = colors + (target - colors) * np.abs(steps)
+        return np.clip(np.rint(mixed), 0, 255).astype(np.uint8)
+
+    if scheme_type not in SCHEME_OFFSETS:
+        raise ValueError(f"Неизвестный тип схемы: {scheme_type}")
+
+    hsv = rgb_to_hsv(rgbs)
+    offsets = np.asarray(SCHEME_OFFSETS[scheme_type], dtype=np.float64)
+    rotated = np.repeat(hsv[:, np.newaxis, :], len(offsets), axis=1)
+    rotated[..., 0] = (rotated[..., 0] + offsets) % 360
+
+    result = hsv_to_rgb(rotated)
+    # Исходный цвет оставляем без округлений преобразования
+    for i, offset in enumerate(offsets):
+        if offset == 0:
+            result[:, i] = rgbs
+    return result
+
+
+def generate_all_schemes(rgbs):
+    """Все схемы для массива цветов: {тип схемы: массив (N, k, 3)}"""
+    scheme_types = list(SCHEME_OFFSETS) + ['monochromatic']
+    return {scheme_type: generate_schemes(rgbs, scheme_type) for scheme_type in scheme_types}
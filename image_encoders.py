@@ -0,0 +1,190 @@
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+# Кодирование готовых изображений. Кодировщик задается строкой "имя[:уровень]":
+#   png            - обычный RGB PNG (уровень - compress_level zlib, 0-9)
+#   png_optimize   - RGB PNG с optimize=True (медленнее, меньше)
+#   png_palette    - PNG с палитрой (P), если в изображении не больше 256 цветов
+#   webp           - WebP без потерь (уровень - усилие сжатия, 0-100)
+#   jpeg           - JPEG (уровень - качество), для фотографий
+
+DEFAULT_ENCODER = 'png_palette'
+
+# Уровень по умолчанию для каждого кодировщика
+DEFAULT_LEVELS = {
+    'png': 6,
+    'png_optimize': 9,
+    'png_palette': 9,
+    'webp': 80,
+    'jpeg': 90,
+}
+
+
+# Расширение файла для каждого кодировщика (для отправки документом)
+EXTENSIONS = {
+    'png': 'png',
+    'png_optimize': 'png',
+    'png_palette': 'png',
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+
+# params - дополнительные параметры сохранения Pillow (например, dpi)
+def _encode_png(img, level, **params):
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', compress_level=level, **params)
+    return buffer.getvalue()
+
+
+def _encode_png_optimize(img, level, **params):
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', optimize=True, compress_level=level, **params)
+    return buffer.getvalue()
+
+
+def _encode_png_palette(img, level, **params):
+    # Палитрой кодируем только без потерь: у плоских палитр цветов не больше 256
+    img = img.convert('RGB')
+    colors = img.getcolors(256)
+    if colors is None:
+        return _encode_png(img, level, **params)
+
+    # Точная палитра ровно из цветов изображения (квантование Pillow медленнее
+    # и всегда записывает полную палитру): индекс пикселя - позиция его цвета
+    # в отсортированном списке упакованных 0xRRGGBB
+    palette = np.array(sorted(rgb for _, rgb in colors), dtype=np.uint32)
+    packed = (palette[:, 0] << 16) | (palette[:, 1] << 8) | palette[:, 2]
+    pixels = np.asarray(img, dtype=np.uint32)
+    indices = np.searchsorted(packed, (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2])
+
+    paletted = Image.fromarray(indices.astype(np.uint8), 'P')
+    paletted.putpalette(palette.astype(np.uint8).tobytes())
+    buffer = io.BytesIO()
+    paletted.save(buffer, format='PNG', compress_level=level, **params)
+    return buffer.getvalue()
+
+
+def _encode_webp(img, level, **params):
+    buffer = io.BytesIO()
+    img.save(buffer, format='WEBP', lossless=True, quality=level, **params)
+    return buffer.getvalue()
+
+
+def _encode_jpeg(img, level, **params):
+    buffer = io.BytesIO()
+    img.convert('RGB').save(buffer, format='JPEG', quality=level, optimize=True, **params)
+    return buffer.getvalue()
+
+
+ENCODERS = {
+    'png': _encode_png,
+    'png_optimize': _encode_png_optimize,
+    'png_palette': _encode_png_palette,
+    'webp': _encode_webp,
+    'jpeg': _encode_jpeg,
+}
+
+
+def parse_spec(spec):
+    """Разобрать "имя[:уровень]" в (имя, уровень)"""
+    name, _, level = spec.strip().partition(':')
+    if name not in ENCODERS:
+        raise ValueError(f"Неизвестный кодировщик изображений: {name}")
+    return name, int(level) if level else DEFAULT_LEVELS[name]
+
+
+def encode(img, spec, dpi=None):
+    """Закодировать изображение кодировщиком spec (dpi записывается в метаданные)"""
+    name, level = parse_spec(spec)
+    params = {'dpi': (dpi, dpi)} if dpi else {}
+    return ENCODERS[name](img, level, **params)
+
+
+class ImageEncoders:
+    """Выбор кодировщика по типу изображения (имени рендерера)"""
+
+    def __init__(self, config=None, default=DEFAULT_ENCODER):
+        self.config = dict(config or {})
+        self.default = default
+
+        # Ошибки в настройке видны сразу при запуске, а не на первом запросе
+        for spec in [self.default, *self.config.values()]:
+            parse_spec(spec)
+
+    @classmethod
+    def from_string(cls, text, default=DEFAULT_ENCODER):
+        """Настройка из строки вида "itten_circle=webp,color_palette=png_palette:9\""""
+        config = {}
+        for item in (text or '').split(','):
+            if not item.strip():
+                continue
+            renderer, sep, spec = item.partition('=')
+            if not sep:
+                raise ValueError(f"Ожидается рендерер=кодировщик: {item}")
+            config[renderer.strip()] = spec.strip()
+        return cls(config, default=default)
+
+    def spec(self, renderer):
+        """Кодировщик для рендерера (входит в ключ кэша изображений)"""
+        return self.config.get(renderer, self.default)
+
+    def extension(self, renderer):
+        """Расширение файла изображений рендерера"""
+        return EXTENSIONS[parse_spec(self.spec(renderer))[0]]
+
+    def encode(self, renderer, img, dpi=None):
+        """Закодировать изображение рендерера"""
+        return encode(img, self.spec(renderer), dpi=dpi)
+
+
+def benchmark(images, specs, repeat=5):
+    """Размер и время кодирования: {(изображение, кодировщик): (байт, мс)}"""
+    results = {}
+    for image_name, img in images.items():
+        for spec in specs:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                data = encode(img, spec)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[(image_name, spec)] = (len(data), best * 1000)
+    return results
+
+
+def sample_images(circle, color_name='blue', scheme_type='square'):
+    """Изображения всех рендереров бота (без кодирования): {рендерер: Image}"""
+    scheme = circle.get_scheme(color_name, scheme_type)
+    return {
+        'itten_circle': circle._draw_itten_circle(),
+        'extended_palette': circle._draw_extended_palette(),
+        'color_palette': circle._draw_color_palette(scheme),
+        'shades_palette': circle._draw_shades_palette(circle.get_all_shades(color_name)),
+        'scheme_sheet': circle._draw_scheme_sheet(list(circle.get_all_schemes(color_name).values())),
+    }
+
+
+def main():
+    """Сравнение кодировщиков на изображениях бота"""
+    from color_circle import IttenColorCircle
+    from render_cache import RenderCache
+
+    parser = argparse.ArgumentParser(description="Размер и время кодирования изображений бота")
+    parser.add_argument('--encoders', default=','.join(ENCODERS), help="Кодировщики через запятую")
+    parser.add_argument('--repeat', type=int, default=5, help="Повторов на замер (берется лучший)")
+    args = parser.parse_args()
+
+    circle = IttenColorCircle(render_cache=RenderCache(max_bytes=0))
+    results = benchmark(sample_images(circle), args.encoders.split(','), args.repeat)
+    print(f"{'изображение':<18} {'кодировщик':<16} {'байт':>8} {'мс':>8}")
+    for (image_name, spec), (size, elapsed) in results.items():
+        print(f"{image_name:<18} {spec:<16} {size:>8} {elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from color_search import ColorSearchIndex
+
+# Готовый результат inline-запроса: все поля рассчитаны при загрузке,
+# на запросе остается только найти file_id по image_key
+InlineEntry = namedtuple('InlineEntry', ['id', 'color_name', 'scheme_type', 'title', 'description', 'caption', 'image_key'])
+
+SHADES = 'shades'
+
+# Дополнительные слова для выбора вида результата
+KIND_ALIASES = {
+    'complementary': 'complementary', 'комплементарная': 'complementary',
+    'triad': 'triad', 'триада': 'triad',
+    'analogous': 'analogous', 'аналоговая': 'analogous',
+    'square': 'square', 'квадрат': 'square',
+    'split': 'split_complementary', 'split_complementary': 'split_complementary',
+    'расщепленная': 'split_complementary',
+    'rectangle': 'rectangle', 'tetrad': 'rectangle', 'прямоугольная': 'rectangle', 'тетрада': 'rectangle',
+    'monochromatic': 'monochromatic', 'монохроматическая': 'monochromatic',
+    'shades': SHADES, 'оттенки': SHADES,
+}
+
+# Слово короче этого не считается началом названия схемы
+MIN_KIND_PREFIX = 3
+
+
+class InlineIndex:
+    """Заранее рассчитанные результаты inline-запросов (схемы и оттенки для каждого цвета)"""
+
+    def __init__(self, circle, search_index=None, max_colors=10):
+        self.circle = circle
+        self.search_index = search_index or ColorSearchIndex(circle)
+        self.max_colors = max_colors
+        self._entries = {name: self._build_entries(name) for name in circle.get_all_colors_list()}
+        # Кэш результатов у каждого индекса свой: lru_cache на методе держал бы ссылку
+        # на индекс в общем для класса кэше и не давал бы его освободить
+        self.search = lru_cache(maxsize=4096)(self._search)
+
+    def _build_entries(self, color_name):
+        entries = []
+        color_display = color_name.replace('_', ' ').title()
+
+        for scheme_type, scheme_colors in self.circle.get_all_schemes(color_name).items():
+            if not scheme_colors:
+                continue
+            scheme_name = self.circle.schemes[scheme_type]
+            codes = ' '.join(color_info.hex.upper() for color_info in scheme_colors)
+
+            caption = f"🎨 *Цветовая схема:* {scheme_name}\n*Базовый цвет:* {color_display}\n\n"
+            for i, color_info in enumerate(scheme_colors, 1):
+                caption += f"{i}. *{color_info.name.replace('_', ' ').title()}*: `{color_info.hex.upper()}`\n"
+
+            entries.append(InlineEntry(
+                id=f"{color_name}:{scheme_type}",
+                color_name=color_name,
+                scheme_type=scheme_type,
+                title=f"{color_display}: {scheme_name}",
+                description=codes,
+                caption=caption,
+                image_key=self.circle.image_key('color_palette', scheme_colors)
+            ))
+
+        record = self.circle.get_color_info(color_name)
+        shades = self.circle.get_all_shades(record.base)
+        if shades:
+            base_display = record.base.replace('_', ' ').title()
+            caption = f"🎨 *5 оттенков цвета {base_display}:*\n\n"
+            for i, shade_info in enumerate(shades, 1):
+                caption += f"{i}. *{shade_info.name.replace('_', ' ').title()}*: `{shade_info.hex.upper()}`\n"
+
+            entries.append(InlineEntry(
+                id=f"{color_name}:{SHADES}",
+                color_name=color_name,
+                scheme_type=SHADES,
+                title=f"{base_display}: оттенки",
+                description=' '.join(shade_info.hex.upper() for shade_info in shades),
+                caption=caption,
+                image_key=self.circle.image_key('shades_palette', shades)
+            ))
+
+        return tuple(entries)
+
+    def parse(self, text):
+        """Разделить запрос на название цвета и вид результата: ('red', 'triad')"""
+        color_words = []
+        kind = None
+        for word in text.lower().split():
+            match = None
+            if kind is None and len(word) >= MIN_KIND_PREFIX:
+                match = next((value for alias, value in KIND_ALIASES.items() if alias.startswith(word)), None)
+            if match:
+                kind = match
+            else:
+                color_words.append(word)
+        return ' '.join(color_words), kind
+
+    def _search(self, text):
+        """Результаты запроса в порядке релевантности (кортеж InlineEntry)"""
+        color_query, kind = self.parse(text)
+
+        if color_query:
+            colors = self.search_index.search(color_query, limit=self.max_colors)
+        else:
+            colors = self.circle.get_main_colors_list()
+
+        return tuple(
+            entry
+            for color_name in colors
+            for entry in self._entries.get(color_name, ())
+            if kind is None or entry.scheme_type == kind
+        )
@@ -0,0 +1,27 @@
+import mmap
+
+from telegram import InputFile
+
+# Передача изображений из кэша в Telegram без лишних копий.
+# bytes библиотека принимает как есть (InputFile хранит ссылку, httpx пишет
+# их в тело запроса напрямую). Файл-объекты InputFile читает целиком,
+# поэтому mmap с диска передается отдельным классом: httpx читает его
+# блоками по 64 КБ прямо при отправке запроса.
+
+
+class MappedInputFile(InputFile):
+    """InputFile поверх mmap: содержимое не загружается в память целиком"""
+
+    __slots__ = ()
+
+    def __init__(self, mapped, filename=None, attach=False):
+        super().__init__(b'', filename=filename, attach=attach)
+        # httpx отправляет файл-подобные объекты по частям (seek(0) + read(блок))
+        self.input_file_content = mapped
+
+
+def as_input_file(data, attach=False, filename=None):
+    """Изображение из кэша в виде, пригодном для отправки (bytes - без изменений)"""
+    if isinstance(data, mmap.mmap):
+        return MappedInputFile(data, filename=filename, attach=attach)
+    return data
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+
+from benchmark import callback_update, message_update, peak_rss, percentile
+from fake_bot_api import FakeBotApi
+
+# Нагрузочный тест бота без Telegram: синтетические пользователи проходят
+# сценарий /start -> /scheme -> выбор цвета -> выбор схемы через локальный
+# сервер Bot API (FakeBotApi, в этом же процессе). Бот получает обновления
+# через getUpdates и отвечает по HTTP, как в продакшене. Задержка каждого
+# шага - от постановки обновления в очередь до ответа бота в чат.
+#
+# Бот запускается в этом же процессе с настройками из окружения
+# (BOT_CONCURRENT_UPDATES, RATE_LIMIT, BOT_POOL_*, ...). С --external
+# запускается только сервер: бот стартует отдельно с BOT_API_BASE_URL.
+
+STEPS = ('start', 'choose_color', 'choose_scheme', 'show_scheme')
+
+# id синтетических пользователей не пересекаются между уровнями нагрузки
+USER_ID_BASE = 1_000_000
+
+
+def step_update(step, user_id, update_ids, codec, color_name, scheme_type, message):
+    """Обновление для шага сценария (message - последний ответ бота, под ним кнопки)"""
+    from callback_codec import PICK_COLOR, SHOW_SCHEME
+
+    update_id = next(update_ids)
+    if step == 'start':
+        return message_update(update_id, user_id, '/start')
+    if step == 'choose_color':
+        return message_update(update_id, user_id, '/scheme')
+    if step == 'choose_scheme':
+        return callback_update(update_id, user_id, codec.encode(PICK_COLOR, color_name), message)
+    return callback_update(update_id, user_id, codec.encode(SHOW_SCHEME, color_name, scheme_type), message)
+
+
+async def run_session(api, codec, user_id, update_ids, color_name, scheme_type, latencies, step_timeout):
+    """Один пользователь проходит сценарий: None или шаг, на который бот не ответил за step_timeout"""
+    message = None
+    for step in STEPS:
+        update = step_update(step, user_id, update_ids, codec, color_name, scheme_type, message)
+        reply = api.wait_reply(user_id)
+        start = time.perf_counter()
+        api.push_update(update)
+        try:
+            message = await asyncio.wait_for(reply, step_timeout)
+        except asyncio.TimeoutError:
+            return step
+        latencies[step].append(time.perf_counter() - start)
+    return None
+
+
+def _latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+async def run_level(api, codec, color_names, scheme_types, concurrency, sessions, first_user_id, step_timeout):
+    """Прогнать sessions сценариев, одновременно - не больше concurrency пользователей"""
+    latencies = {step: [] for step in STEPS}
+    session_latencies = []
+    timeouts = {step: 0 for step in STEPS}
+    user_numbers = iter(range(sessions))
+    update_ids = itertools.count(1)
+    throttled = api.throttled
+
+    async def virtual_user():
+        for number in user_numbers:
+            start = time.perf_counter()
+            failed_step = await run_session(
+                api, codec, first_user_id + number, update_ids,
+                color_names[number % len(color_names)], scheme_types[number % len(scheme_types)],
+                latencies, step_timeout
+            )
+            if failed_step is None:
+                session_latencies.append(time.perf_counter() - start)
+            else:
+                timeouts[failed_step] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user() for _ in range(min(concurrency, sessions))))
+    elapsed = time.perf_counter() - start
+
+    completed = len(session_latencies)
+    return {
+        'concurrency': concurrency,
+        'sessions': sessions,
+        'completed': completed,
+        'timeouts': timeouts,
+        'elapsed': elapsed,
+        'sessions_per_sec': completed / elapsed if elapsed else 0.0,
+        'updates_per_sec': sum(len(values) for values in latencies.values()) / elapsed if elapsed else 0.0,
+        'session': _latency_summary(session_latencies),
+        'steps': {step: _latency_summary(values) for step, values in latencies.items()},
+        'throttled': api.throttled - throttled,
+        'peak_rss': peak_rss(),
+    }
+
+
+async def wait_for_bot(api, timeout):
+    """Дождаться, пока бот начнет опрашивать getUpdates"""
+    deadline = time.monotonic() + timeout
+    while not api.calls.get('getUpdates'):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Бот не обратился к {api.base_url} за {timeout} с")
+        await asyncio.sleep(0.1)
+
+
+async def start_bot(base_url):
+    """Запустить бота в этом процессе против сервера base_url"""
+    os.environ['BOT_API_BASE_URL'] = base_url
+    import bot
+    from telegram import Update
+
+    application = bot.build_application('1:loadgen')
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=Update.ALL_TYPES)
+    await application.start()
+    return application
+
+
+async def stop_bot(application):
+    await application.updater.stop()
+    await application.stop()
+    await application.post_shutdown(application)
+    await application.shutdown()
+
+
+async def run(levels, sessions, step_timeout, external=False, **api_options):
+    """Нагрузка на всех уровнях одновременности: ([итог уровня, ...], статистика сервера)"""
+    from callback_codec import CallbackCodec
+    from color_circle import IttenColorCircle
+
+    circle = IttenColorCircle()
+    codec = CallbackCodec(circle)
+    color_names = list(circle.colors)
+    scheme_types = list(circle.schemes)
+
+    api = FakeBotApi(**api_options)
+    await api.start()
+    application = None
+    results = []
+    try:
+        if external:
+            print(f"Сервер Bot API: BOT_API_BASE_URL={api.base_url} - запустите бота")
+            await wait_for_bot(api, timeout=600)
+        else:
+            application = await start_bot(api.base_url)
+            await wait_for_bot(api, timeout=30)
+
+        for index, concurrency in enumerate(levels):
+            result = await run_level(
+                api, codec, color_names, scheme_types, concurrency, sessions,
+                USER_ID_BASE * (index + 1), step_timeout
+            )
+            results.append(result)
+            print_level(result)
+    finally:
+        if application is not None:
+            await stop_bot(application)
+        await api.stop()
+    return results, api.stats()
+
+
+def print_level(result):
+    session = result['session']
+    print(f"\nОдновременно {result['concurrency']}: сценариев {result['completed']}/{result['sessions']} "
+          f"за {result['elapsed']:.1f} с, {result['sessions_per_sec']:.1f} сценариев/с, "
+          f"{result['updates_per_sec']:.1f} обновлений/с, ответов 429: {result['throttled']}")
+    print(f"{'шаг':<15} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'max, мс':>9} {'таймауты':>9}")
+    for step, summary in result['steps'].items():
+        print(f"{step:<15} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} "
+              f"{summary['max_ms']:>9.1f} {result['timeouts'][step]:>9}")
+    print(f"{'сценарий':<15} {session['p50_ms']:>9.1f} {session['p95_ms']:>9.1f} {session['p99_ms']:>9.1f} "
+          f"{session['max_ms']:>9.1f}")
+
+
+def main():
+    """Нагрузочный тест из командной строки"""
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота против локального сервера Bot API")
+    parser.add_argument('--concurrency', default='10,100,1000', help="Уровни одновременности через запятую")
+    parser.add_argument('--users', type=int, default=1000, help="Сценариев пользователей на уровень")
+    parser.add_argument('--latency', type=float, default=0.05, help="Задержка ответа сервера, с")
+    parser.add_argument('--throttle', type=float, default=0.0, help="Доля отправок, получающих 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument('--step-timeout', type=float, default=60, help="Ожидание ответа бота на шаг, с")
+    parser.add_argument('--seed', type=int, default=1, help="Зерно для выбора запросов с ответом 429")
+    parser.add_argument('--port', type=int, default=0, help="Порт сервера Bot API (0 - свободный)")
+    parser.add_argument('--external', action='store_true', help="Не запускать бота: он стартует отдельно")
+    parser.add_argument('--warmup', action='store_true', help="Прогреть кэш изображений перед нагрузкой")
+    parser.add_argument('--out', default='loadgen_results.json', help="Куда сохранить результаты")
+    args = parser.parse_args()
+
+    # Бот в этом процессе: состояние в памяти, без реестра file_id на диске
+    os.environ.setdefault('USER_STATE_BACKEND', 'memory')
+    os.environ.setdefault('FILE_ID_REGISTRY', '')
+    os.environ.setdefault('RENDER_WARMUP', '1' if args.warmup else '0')
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    results, server_stats = asyncio.run(run(
+        levels, args.users, args.step_timeout, args.external,
+        port=args.port, latency=args.latency, throttle_ratio=args.throttle,
+        retry_after=args.retry_after, seed=args.seed
+    ))
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': vars(args),
+        'bot_env': {
+            name: os.getenv(name)
+            for name in ('BOT_CONCURRENT_UPDATES', 'RATE_LIMIT', 'BOT_POOL_JSON', 'BOT_POOL_MEDIA',
+                         'RENDER_POOL_MODE', 'RENDER_WORKERS')
+        },
+        'levels': results,
+        'server': server_stats,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import nullcontext
+
+from http_util import keep_alive, read_request
+
+logger = logging.getLogger(__name__)
+
+# Метрики бота в текстовом формате Prometheus.
+# Гистограммы времени этапов обработки обновлений (поиск цвета, расчет схемы,
+# рендеринг, загрузка в Telegram, всего) с меткой обработчика, время
+# отрисовки и кодирования изображений, а также значения stats() компонентов.
+# Выключенные метрики не стоят почти ничего: этапы - общий nullcontext,
+# обработчики не оборачиваются.
+
+# Границы корзин гистограмм времени, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+READ_TIMEOUT = 30
+
+_NULL_STAGE = nullcontext()
+
+# Имя обработчика, который сейчас выполняется (для меток этапов)
+_current_handler = contextvars.ContextVar('current_handler', default='-')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    """Гистограмма с метками (накопленные корзины, сумма и число наблюдений)"""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        # Наблюдения приходят и из потоков пула рендеринга
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Счетчики корзин (последняя - +Inf), сумма
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+
+        for label_values, (counts, total) in sorted(series.items()):
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Реестр метрик бота"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = Histogram(
+            'bot_stage_seconds', "Время этапа обработки обновления", ('handler', 'stage')
+        )
+        self.renders = Histogram(
+            'render_seconds', "Время отрисовки и кодирования изображения", ('renderer', 'step')
+        )
+        self._collectors = []
+
+    def stage(self, name):
+        """Контекстный менеджер: время этапа name для текущего обработчика"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self.stages, name)
+
+    def instrument(self, callback):
+        """Обернуть обработчик: полное время обработки и метка для его этапов"""
+        if not self.enabled:
+            return callback
+
+        handler = callback.__name__
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            token = _current_handler.set(handler)
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                self.stages.observe(time.perf_counter() - started, handler, 'total')
+                _current_handler.reset(token)
+
+        return wrapper
+
+    def observe_render(self, renderer, draw_seconds, encode_seconds):
+        """Время отрисовки и кодирования изображения (обработчик для IttenColorCircle.observe)"""
+        self.renders.observe(draw_seconds, renderer, 'draw')
+        self.renders.observe(encode_seconds, renderer, 'encode')
+
+    def add_collector(self, prefix, stats, labels=None):
+        """Экспортировать числовые значения stats() компонента как метрики prefix_*
+
+        Вложенные словари становятся метками: labels = {ключ: (имя метки, ...)}
+        """
+        self._collectors.append((prefix, stats, labels or {}))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = self.stages.render() + self.renders.render()
+        for prefix, stats, labels in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Metrics collector {prefix} failed: {e}")
+                continue
+            for key, value in values.items():
+                name = f"{prefix}_{key}"
+                samples = list(self._flatten(value, labels.get(key, ('key',)), []))
+                if not samples:
+                    continue
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{_format_labels(sample_labels)} {sample}" for sample_labels, sample in samples)
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def _flatten(cls, value, label_names, labels):
+        if isinstance(value, bool):
+            yield labels, int(value)
+        elif isinstance(value, (int, float)):
+            yield labels, value
+        elif isinstance(value, dict):
+            name = label_names[0] if label_names else 'key'
+            for key, item in value.items():
+                yield from cls._flatten(item, label_names[1:], labels + [(name, key)])
+
+
+class _Stage:
+    __slots__ = ('histogram', 'name', 'started')
+
+    def __init__(self, histogram, name):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, _current_handler.get(), self.name)
+        return False
+
+
+class MetricsServer:
+    """HTTP-сервер с одной страницей GET /metrics"""
+
+    def __init__(self, metrics, listen='127.0.0.1', port=9100):
+        self.metrics = metrics
+        self.listen = listen
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        """Начать прием соединений"""
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+
+    async def stop(self):
+        """Остановить сервер"""
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                # Тело запроса странице метрик не нужно
+                request = await asyncio.wait_for(read_request(reader, max_body=0), READ_TIMEOUT)
+                if request is None:
+                    break
+
+                method, path, headers, _ = request
+                if method == 'GET' and path.split('?', 1)[0] == '/metrics':
+                    status, body = '200 OK', self.metrics.render().encode('utf-8')
+                else:
+                    status, body = '404 Not Found', b'Not Found'
+
+                writer.write((
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive(headers) else 'close'}\r\n"
+                    "\r\n"
+                ).encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive(headers):
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
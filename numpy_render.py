@@ -0,0 +1,64 @@
+import numpy as np
+from PIL import Image
+
+# Отрисовка палитр через массивы NumPy.
+# Результат попиксельно совпадает с отрисовкой через ImageDraw в IttenColorCircle.
+
+
+def _draw_border(pixels, width):
+    """Черная рамка по краю изображения (как outline у ImageDraw.rectangle)"""
+    pixels[:width, :] = 0
+    pixels[-width:, :] = 0
+    pixels[:, :width] = 0
+    pixels[:, -width:] = 0
+
+
+def render_strip(width, height, rgbs, border=3):
+    """Горизонтальная полоса цветов одинаковой ширины"""
+    colors = np.asarray(rgbs, dtype=np.uint8)
+    count = len(colors)
+    color_width = width // count
+
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    # Одна строка пикселей, размноженная на всю высоту
+    filled = count * color_width
+    pixels[:, :filled] = np.repeat(colors, color_width, axis=0)[np.newaxis, :, :]
+
+    # ImageDraw.rectangle включает правую границу, поэтому последний цвет
+    # занимает на один столбец больше
+    if filled < width:
+        pixels[:, filled] = colors[-1]
+
+    _draw_border(pixels, border)
+    return Image.fromarray(pixels, 'RGB')
+
+
+def render_grid(width, height, grid, border=3):
+    """Сетка цветов: grid[столбец][строка] = (r, g, b), с тонкими линиями между ячейками"""
+    colors = np.asarray(grid, dtype=np.uint8)
+    cols, rows = colors.shape[:2]
+    color_width = width // cols
+    color_height = height // rows
+
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    filled_x = cols * color_width
+    filled_y = rows * color_height
+    cells = colors.transpose(1, 0, 2)
+    pixels[:filled_y, :filled_x] = np.repeat(np.repeat(cells, color_height, axis=0), color_width, axis=1)
+
+    # Правая и нижняя границы последних ячеек включаются в прямоугольник
+    span_x = min(filled_x + 1, width)
+    span_y = min(filled_y + 1, height)
+    if filled_x < width:
+        pixels[:filled_y, filled_x] = pixels[:filled_y, filled_x - 1]
+    if filled_y < height:
+        pixels[filled_y, :span_x] = pixels[filled_y - 1, :span_x]
+
+    # Линии сетки
+    pixels[:span_y, 0:span_x:color_width] = 0
+    pixels[0:span_y:color_height, :span_x] = 0
+
+    _draw_border(pixels, border)
+    return Image.fromarray(pixels, 'RGB')
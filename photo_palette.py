@@ -0,0 +1,148 @@
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+# Извлечение основных цветов из фотографии пользователя.
+# Стоимость ограничена: большие изображения отклоняются до декодирования,
+# JPEG декодируется сразу в уменьшенном виде (draft), а k-means работает
+# по фиксированной выборке пикселей с ограниченным числом итераций и
+# прерывается, если не уложился в бюджет времени.
+
+# Не декодируем изображения больше этого числа пикселей (защита от "бомб").
+# PNG и WebP декодируются целиком: 12 Мп в RGB - около 36 МБ на запрос
+MAX_SOURCE_PIXELS = 12_000_000
+# Сторона изображения, до которой оно уменьшается перед анализом
+ANALYSIS_SIZE = 256
+# Режимы, которые Image.reduce усредняет корректно (палитру усреднять нельзя)
+REDUCIBLE_MODES = frozenset({'L', 'LA', 'RGB', 'RGBA', 'CMYK', 'I', 'F'})
+# Сколько пикселей участвует в кластеризации
+SAMPLE_PIXELS = 20_000
+MAX_ITERATIONS = 12
+
+
+class PhotoTooLarge(Exception):
+    """Изображение превышает ограничения на размер"""
+
+
+class PhotoTimeout(Exception):
+    """Анализ изображения не уложился в бюджет времени"""
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        raise PhotoTimeout("Анализ изображения занял слишком много времени")
+
+
+async def download_limited(client, url, max_bytes):
+    """Скачать файл потоком, прервав загрузку, как только он превысит max_bytes
+
+    client - общий httpx.AsyncClient приложения (соединения переиспользуются)
+    """
+    buffer = bytearray()
+    async with client.stream('GET', url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise PhotoTooLarge(f"Файл больше {max_bytes} байт")
+    return bytes(buffer)
+
+
+def load_pixels(data, max_pixels=MAX_SOURCE_PIXELS, size=ANALYSIS_SIZE):
+    """Декодировать изображение в уменьшенный массив пикселей (N, 3) uint8"""
+    with Image.open(io.BytesIO(data)) as img:
+        # Размер известен из заголовка - проверяем до декодирования
+        if img.width * img.height > max_pixels:
+            raise PhotoTooLarge(f"Изображение {img.width}x{img.height} слишком большое")
+
+        # JPEG сразу декодируется с уменьшением в 2-8 раз (DCT scaling)
+        img.draft('RGB', (size, size))
+
+        # Целочисленное уменьшение в исходном режиме - до преобразования в RGBA,
+        # которое для полного размера заняло бы 4 байта на пиксель
+        factor = max(1, min(img.width, img.height) // size)
+        if factor > 1:
+            if img.mode in REDUCIBLE_MODES:
+                img = img.reduce(factor)
+            else:
+                # Палитра и редкие режимы: выборка пикселей без смешивания индексов
+                img = img.resize((img.width // factor, img.height // factor), Image.NEAREST)
+
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGBA')
+            # Прозрачные области считаем белыми
+            background = Image.new('RGB', img.size, 'white')
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        else:
+            img = img.convert('RGB')
+
+        # Точное уменьшение до нужного размера
+        img.thumbnail((size, size))
+
+        return np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+
+
+def _init_centers(pixels, k, rng):
+    """Начальные центры k-means++"""
+    centers = [pixels[rng.integers(len(pixels))]]
+    distances = ((pixels - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = distances.sum()
+        if total == 0:
+            break
+        centers.append(pixels[rng.choice(len(pixels), p=distances / total)])
+        distances = np.minimum(distances, ((pixels - centers[-1]) ** 2).sum(axis=1))
+    return np.array(centers)
+
+
+def dominant_colors(pixels, k=5, sample=SAMPLE_PIXELS, iterations=MAX_ITERATIONS, seed=0, deadline=None):
+    """Основные цвета (k-means по выборке пикселей): список ((r, g, b), доля) по убыванию доли
+
+    deadline - момент time.monotonic(), после которого расчет прерывается (PhotoTimeout)
+    """
+
+    rng = np.random.default_rng(seed)
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 3)
+    if len(pixels) > sample:
+        pixels = pixels[rng.choice(len(pixels), sample, replace=False)]
+
+    centers = _init_centers(pixels, k, rng)
+    for _ in range(iterations):
+        _check_deadline(deadline)
+        # Расстояния до всех центров одной операцией: (N, k)
+        distances = ((pixels[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        # Пустые кластеры оставляем на месте
+        updated = np.where(counts[:, np.newaxis] > 0, sums / np.maximum(counts, 1)[:, np.newaxis], centers)
+        if np.allclose(updated, centers, atol=0.5):
+            centers = updated
+            break
+        centers = updated
+
+    distances = ((pixels[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2)
+    counts = np.bincount(distances.argmin(axis=1), minlength=len(centers))
+
+    order = np.argsort(-counts, kind='stable')
+    return [
+        (tuple(int(round(channel)) for channel in centers[i]), counts[i] / len(pixels))
+        for i in order if counts[i] > 0
+    ]
+
+
+def extract_palette(data, k=5, max_pixels=MAX_SOURCE_PIXELS, time_budget=None):
+    """Основные цвета фотографии по ее байтам (функция для пула рендеринга)
+
+    time_budget - секунды работы воркера: отмена ожидания в цикле событий не
+    останавливает поток, поэтому лимит проверяется здесь же, между этапами
+    """
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    pixels = load_pixels(data, max_pixels=max_pixels)
+    _check_deadline(deadline)
+    return dominant_colors(pixels, k=k, deadline=deadline)
@@ -0,0 +1,344 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: меньше - раньше
+PRIORITY_URGENT = 0  # ответы на нажатия кнопок и inline-запросы (у клиента крутится индикатор)
+PRIORITY_TEXT = 1    # текст, правка и удаление сообщений
+PRIORITY_MEDIA = 2   # загрузка изображений
+
+ENDPOINT_PRIORITIES = {
+    'answerCallbackQuery': PRIORITY_URGENT,
+    'answerInlineQuery': PRIORITY_URGENT,
+    'sendPhoto': PRIORITY_MEDIA,
+    'sendDocument': PRIORITY_MEDIA,
+    'sendMediaGroup': PRIORITY_MEDIA,
+    'editMessageMedia': PRIORITY_MEDIA,
+}
+
+# Ведра чатов, которые давно полны, удаляются при таком числе отслеживаемых чатов
+PRUNE_THRESHOLD = 10_000
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        # До этого момента запросы не отправляются (ответ 429 с retry_after)
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Через сколько секунд будет доступен токен (0 - уже доступен)"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self, now):
+        """Забрать токен (вызывается после delay(now) == 0)"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until):
+        self.paused_until = max(self.paused_until, until)
+
+    def idle(self, now):
+        """Ведро полно и не на паузе - его можно забыть"""
+        self._refill(now)
+        return self.tokens >= self.burst and self.paused_until <= now
+
+
+class _Request:
+    __slots__ = ('priority', 'chat_id', 'granted', 'queued_at')
+
+    def __init__(self, priority, chat_id, granted, queued_at):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.granted = granted
+        self.queued_at = queued_at
+
+
+class _Lane:
+    """Полоса одного приоритета: очередь запросов каждого чата и очередь готовых чатов
+
+    Чат стоит либо в ready (его ведро, возможно, уже позволяет отправку), либо
+    в sleeping до момента, когда в его ведре появится токен. Поэтому запрос
+    разрешается за O(1) в среднем, сколько бы чатов ни ждало в полосе.
+    """
+
+    __slots__ = ('queues', 'ready', 'sleeping', 'size', '_order')
+
+    def __init__(self):
+        self.queues = {}
+        self.ready = deque()
+        # Куча (момент проверки, номер, chat_id); chat_id без ведра (None) сюда не попадает.
+        # Номер не дает сравнивать chat_id разных типов (число и @username)
+        self.sleeping = []
+        self.size = 0
+        self._order = itertools.count()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, request):
+        queue = self.queues.get(request.chat_id)
+        if queue is None:
+            queue = self.queues[request.chat_id] = deque()
+            self.ready.append(request.chat_id)
+        queue.append(request)
+        self.size += 1
+
+    def wake(self, now):
+        """Вернуть в ready чаты, чье время ожидания прошло"""
+        while self.sleeping and self.sleeping[0][0] <= now:
+            self.ready.append(heapq.heappop(self.sleeping)[2])
+
+    def sleep(self, chat_id, until):
+        heapq.heappush(self.sleeping, (until, next(self._order), chat_id))
+
+    def next_wake(self):
+        return self.sleeping[0][0] if self.sleeping else None
+
+    def pop_cancelled(self, queue):
+        """Убрать из начала очереди чата запросы, отмененные во время ожидания"""
+        while queue and queue[0].granted.done():
+            queue.popleft()
+            self.size -= 1
+
+    def cancel_all(self):
+        for queue in self.queues.values():
+            for request in queue:
+                request.granted.cancel()
+        self.queues.clear()
+        self.ready.clear()
+        self.sleeping.clear()
+        self.size = 0
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Планировщик исходящих запросов к Bot API
+
+    Запрос отправляется, когда есть токен в общем ведре и в ведре его чата
+    (у групп - свой, более строгий лимит). Очередь разделена на полосы
+    по приоритету: ответы на кнопки идут раньше текста, текст - раньше
+    загрузки фото. Запросы одного чата идут по порядку, чаты полосы
+    обслуживаются по кругу, и чат с пустым ведром не задерживает другие.
+
+    На 429 (RetryAfter) ставится на паузу ведро чата (или общее ведро для
+    запросов без чата), и запрос повторяется через retry_after со случайной
+    добавкой, чтобы повторы не приходили одной пачкой.
+    """
+
+    def __init__(self, global_rate=30, global_burst=30, chat_rate=1, chat_burst=3,
+                 group_rate=20 / 60, group_burst=5, max_retries=3, jitter=0.2):
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.jitter = jitter
+
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._chats = {}
+        self._lanes = [_Lane() for _ in range(PRIORITY_MEDIA + 1)]
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+
+        # Статистика
+        self.in_flight = 0
+        self.dispatched = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def initialize(self):
+        """Запустить диспетчер очереди"""
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def shutdown(self):
+        """Остановить диспетчер (запросы в очереди получают CancelledError)"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        for lane in self._lanes:
+            lane.cancel_all()
+
+    @staticmethod
+    def priority(endpoint):
+        """Приоритет запроса по методу Bot API"""
+        return ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_TEXT)
+
+    @staticmethod
+    def _chat_id(data):
+        chat_id = data.get('chat_id')
+        try:
+            return int(chat_id)
+        except (TypeError, ValueError):
+            # Строковый chat_id (@username) бывает только у каналов и групп
+            return chat_id
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        """Дождаться очереди и выполнить запрос, повторяя его после 429
+
+        rate_limit_args - число повторов для этого запроса (по умолчанию max_retries)
+        """
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        chat_id = self._chat_id(data)
+        priority = self.priority(endpoint)
+
+        for attempt in range(max_retries + 1):
+            await self._acquire(priority, chat_id)
+            self.in_flight += 1
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                retry_after = float(e.retry_after)
+                if attempt == max_retries:
+                    self.failed += 1
+                    logger.warning(f"Лимит Telegram ({endpoint}): повторы исчерпаны, retry_after={retry_after}")
+                    raise
+
+                self.retried += 1
+                delay = retry_after * (1 + random.uniform(0, self.jitter))
+                # Пауза на чат; у запросов без чата сработал общий лимит бота
+                bucket = self._bucket(chat_id, time.monotonic()) if chat_id is not None else self._global
+                bucket.pause(time.monotonic() + delay)
+                logger.info(f"Лимит Telegram ({endpoint}, чат {chat_id}): повтор через {delay:.1f} с")
+            finally:
+                self.in_flight -= 1
+
+    async def _acquire(self, priority, chat_id):
+        """Встать в очередь своей полосы и дождаться разрешения диспетчера"""
+        request = _Request(priority, chat_id, asyncio.get_running_loop().create_future(), time.monotonic())
+        self._lanes[priority].append(request)
+        self._wakeup.set()
+        await request.granted
+
+        self.dispatched += 1
+        wait = time.monotonic() - request.queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def _bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= PRUNE_THRESHOLD:
+                self._prune(now)
+            # Отрицательный id и @username - группы и каналы
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now):
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.idle(now)]:
+            del self._chats[chat_id]
+
+    def _grant_next(self, now):
+        """Разрешить самый приоритетный запрос, который можно отправить сейчас.
+        Возвращает None, если запрос разрешен, иначе - через сколько секунд проверить снова"""
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return global_delay
+
+        retry_in = None
+        for lane in self._lanes:
+            lane.wake(now)
+            while lane.ready:
+                chat_id = lane.ready.popleft()
+                queue = lane.queues[chat_id]
+                lane.pop_cancelled(queue)
+                if not queue:
+                    del lane.queues[chat_id]
+                    continue
+
+                bucket = None
+                if chat_id is not None:
+                    bucket = self._bucket(chat_id, now)
+                    delay = bucket.delay(now)
+                    if delay > 0:
+                        # Чат ждет токена вне очереди готовых, не мешая другим
+                        lane.sleep(chat_id, now + delay)
+                        continue
+
+                request = queue.popleft()
+                lane.size -= 1
+                # Следующий запрос чата - в конец круга
+                if queue:
+                    lane.ready.append(chat_id)
+                else:
+                    del lane.queues[chat_id]
+                self._global.take(now)
+                if bucket is not None:
+                    bucket.take(now)
+                request.granted.set_result(None)
+                return None
+
+            wake_at = lane.next_wake()
+            if wake_at is not None:
+                delay = wake_at - now
+                retry_in = delay if retry_in is None else min(retry_in, delay)
+        return retry_in
+
+    async def _dispatch_loop(self):
+        while True:
+            retry_in = self._grant_next(time.monotonic())
+            if retry_in is None and any(self._lanes):
+                continue
+
+            self._wakeup.clear()
+            try:
+                # Без запросов в очереди ждем нового; иначе - освобождения токена
+                await asyncio.wait_for(self._wakeup.wait(), retry_in if any(self._lanes) else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        """Статистика очереди исходящих запросов"""
+        return {
+            'queued': {
+                'urgent': len(self._lanes[PRIORITY_URGENT]),
+                'text': len(self._lanes[PRIORITY_TEXT]),
+                'media': len(self._lanes[PRIORITY_MEDIA]),
+            },
+            'in_flight': self.in_flight,
+            'dispatched': self.dispatched,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'chats': len(self._chats),
+            'avg_wait': self.total_wait / self.dispatched if self.dispatched else 0.0,
+            'max_wait': self.max_wait,
+        }
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Расширения файлов дискового кэша по сигнатуре данных (в порядке поиска при чтении)
+DISK_FORMATS = (
+    ('png', lambda data: data[:8] == b'\x89PNG\r\n\x1a\n'),
+    ('webp', lambda data: data[:4] == b'RIFF' and data[8:12] == b'WEBP'),
+    ('jpg', lambda data: data[:3] == b'\xff\xd8\xff'),
+)
+
+
+def disk_extension(data):
+    """Расширение файла для байтов изображения (по сигнатуре формата)"""
+    for extension, matches in DISK_FORMATS:
+        if matches(data):
+            return extension
+    return 'bin'
+
+
+class RenderCache:
+    """Кэш готовых изображений: LRU в памяти (лимит в байтах) + опционально диск
+
+    Изображения хранятся неизменяемыми bytes и отдаются без копирования.
+    Файлы с диска, которые не помещаются в память, отдаются как mmap
+    (только чтение) - они не загружаются в память целиком.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # Статистика попаданий
+        self.hits = 0
+        self.disk_hits = 0
+        self.mapped = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(renderer, inputs, data_digest, encoding=None, variant=None):
+        """Ключ кэша: хэш от (рендерер, входные данные, хэш colors.json, кодировщик, размер/DPI)"""
+        payload = [renderer, inputs, data_digest, encoding]
+        # Вариант по умолчанию в ключ не входит - ключи базовых изображений (и их file_id) не меняются
+        if variant is not None:
+            payload.append(variant)
+        payload = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Получить байты изображения из кэша: bytes, mmap для больших файлов на диске или None"""
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        if data is not None:
+            with self._lock:
+                self.disk_hits += 1
+                if isinstance(data, mmap.mmap):
+                    self.mapped += 1
+            self._put_memory(key, data)
+            return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def contains(self, key):
+        """Есть ли изображение в кэше (в памяти или на диске) - без учета в статистике"""
+        with self._lock:
+            if key in self._items:
+                return True
+        return self.disk_path(key) is not None
+
+    def put(self, key, data):
+        """Сохранить байты изображения в кэш"""
+        # bytes сохраняются как есть, bytearray/memoryview копируются один раз
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    def clear(self):
+        """Очистить кэш в памяти"""
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def resize(self, max_bytes):
+        """Изменить лимит памяти (при уменьшении лишние записи вытесняются)"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self):
+        """Статистика кэша"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'items': len(self._items),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'mapped': self.mapped,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _put_memory(self, key, data):
+        # Слишком большие изображения в память не кладем
+        if len(data) > self.max_bytes or not isinstance(data, bytes):
+            return
+
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+            self._items[key] = data
+            self._size += len(data)
+            self._evict()
+
+    def _evict(self):
+        # Вытесняем самые старые записи (вызывается под замком)
+        while self._size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted)
+
+    def disk_path(self, key):
+        """Путь к файлу изображения в дисковом кэше или None, если его там нет"""
+        if not self.disk_dir:
+            return None
+        for extension, _ in DISK_FORMATS:
+            path = self._disk_path(key, extension)
+            if os.path.exists(path):
+                return path
+        path = self._disk_path(key, 'bin')
+        return path if os.path.exists(path) else None
+
+    def _disk_path(self, key, extension):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.{extension}")
+
+    def _read_disk(self, key):
+        path = self.disk_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                # Что поместится в память - читаем одним блоком и поднимаем в LRU,
+                # остальное отображаем в память без чтения
+                if size <= self.max_bytes or size == 0:
+                    return f.read()
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir:
+            return
+
+        if self.disk_path(key) is not None:
+            return
+
+        # Расширение - по формату кодировщика (png, webp, jpg)
+        path = self._disk_path(key, disk_extension(data))
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Пишем во временный файл и атомарно переименовываем
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Ошибка записи кэша на диск: {e}")
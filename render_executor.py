@@ -0,0 +1,157 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from color_circle import IttenColorCircle
+from render_cache import RenderCache
+from image_encoders import ImageEncoders
+
+
+class RenderQueueFull(Exception):
+    """Очередь рендеринга переполнена"""
+
+
+# Экземпляр цветового круга внутри процесса-воркера
+_worker_circle = None
+
+def _init_worker(encoder_config, default_encoder):
+    """Инициализация процесса-воркера"""
+    global _worker_circle
+    # Кэш в памяти воркера не нужен - результат кэширует основной процесс
+    _worker_circle = IttenColorCircle(
+        render_cache=RenderCache(max_bytes=0),
+        encoders=ImageEncoders(encoder_config, default=default_encoder)
+    )
+
+def _render_in_worker(method, args):
+    """Рендеринг в процессе-воркере (возвращает байты изображения или их список)"""
+    return getattr(_worker_circle, method)(*args)
+
+
+class RenderExecutor:
+    """Пул потоков или процессов для рендеринга изображений вне цикла asyncio"""
+
+    def __init__(self, circle, mode='thread', workers=2, max_queue=32, queue_timeout=5.0):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Неизвестный режим пула рендеринга: {mode}")
+
+        self.circle = circle
+        self.mode = mode
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        if mode == 'process':
+            # Воркеры кодируют изображения так же, как основной процесс
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(circle.encoders.config, circle.encoders.default)
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='render')
+
+        # Семафор ограничивает число задач в работе и в очереди
+        self._slots = asyncio.Semaphore(max_queue)
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    async def render(self, method, *args, key=None, background=False):
+        """Вызвать метод create_* цветового круга в пуле и дождаться результата
+
+        Фоновые задачи (прогрев кэша) ждут места в очереди без ограничения по времени.
+        """
+        # Готовое изображение берем из кэша без похода в пул
+        if key is not None:
+            data = self._cached(key)
+            if data is not None:
+                return data
+
+        if self.mode == 'process':
+            data = await self._submit(_render_in_worker, method, args, background=background)
+            if data is None:
+                return None
+            if key is not None:
+                self.circle.render_cache.put(key, data)
+            return data
+
+        return await self._submit(getattr(self.circle, method), *args, background=background)
+
+    async def render_batch(self, method, *args, keys):
+        """Вызвать пакетный метод create_* (список изображений) одним заданием пула"""
+        if self.mode == 'process' or all(self.circle.render_cache.contains(key) for key in keys):
+            cached = [self._cached(key) for key in keys]
+            if all(data is not None for data in cached):
+                return cached
+
+        if self.mode == 'process':
+            results = await self._submit(_render_in_worker, method, args)
+            for key, data in zip(keys, results):
+                if data is not None:
+                    self.circle.render_cache.put(key, data)
+            return results
+
+        return await self._submit(getattr(self.circle, method), *args)
+
+    def _cached(self, key):
+        """Изображение из кэша основного процесса или None
+
+        В режиме потоков промах учитывает сам метод create_* (он тоже смотрит в кэш),
+        поэтому здесь наличие проверяется без учета в статистике - иначе каждый
+        рендеринг считался бы двумя промахами. Кэш воркеров-процессов не общий,
+        и промах считается здесь.
+        """
+        cache = self.circle.render_cache
+        if self.mode == 'thread' and not cache.contains(key):
+            return None
+        return cache.get(key)
+
+    async def run(self, func, *args):
+        """Выполнить произвольную функцию в пуле (с тем же ограничением очереди)"""
+        return await self._submit(func, *args)
+
+    async def _submit(self, func, *args, background=False):
+        """Выполнить задачу в пуле; место в очереди занято до ее фактического завершения"""
+        await self._acquire(None if background else self.queue_timeout)
+        self.pending += 1
+        self.submitted += 1
+        future = asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        future.add_done_callback(self._release)
+        # Отмена ожидания (таймаут, остановка) не останавливает поток или процесс -
+        # поэтому задача не отменяется и место освобождается только по ее завершении
+        return await asyncio.shield(future)
+
+    def _release(self, future):
+        self.pending -= 1
+        self._slots.release()
+        if not future.cancelled():
+            # Результат задачи, которую перестали ждать, никто не заберет
+            future.exception()
+
+    async def _acquire(self, timeout):
+        # Обратное давление: ждем свободного места, но не дольше timeout
+        if timeout is None:
+            await self._slots.acquire()
+            return
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RenderQueueFull(
+                f"Очередь рендеринга переполнена ({self.max_queue} задач)"
+            ) from None
+
+    def stats(self):
+        """Статистика пула"""
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'pending': self.pending,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self, wait=True):
+        """Остановить пул"""
+        self._pool.shutdown(wait=wait)
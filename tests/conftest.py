@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория, colors.json открывается по относительному пути
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from color_circle import IttenColorCircle  # noqa: E402
+
+
+def new_circle(**kwargs):
+    """Цветовой круг по colors.json репозитория (со своим кэшем, если он передан)"""
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        return IttenColorCircle(**kwargs)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope='session')
+def circle():
+    """Общий цветовой круг для тестов, которые не рендерят изображения"""
+    return new_circle()
@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+from callback_codec import (
+    ACTIONS, CALLBACK_VERSION, MAX_CALLBACK_BYTES, PICK_COLOR, SHOW_ALL, SHOW_SCHEME, SHOW_SHADES,
+    CallbackCodec, CallbackData,
+)
+
+
+@pytest.fixture(scope='module')
+def codec(circle):
+    return CallbackCodec(circle)
+
+
+def test_round_trip_every_color(circle, codec):
+    for color_name in circle.get_all_colors_list():
+        for action in (PICK_COLOR, SHOW_SHADES, SHOW_ALL):
+            data = codec.encode(action, color_name)
+            assert codec.decode(data) == CallbackData(action, color_name, None)
+
+
+def test_round_trip_every_scheme(circle, codec):
+    for color_name in ('red', 'blue_3', 'white', 'dark_gray'):
+        for scheme_type in circle.schemes:
+            data = codec.encode(SHOW_SCHEME, color_name, scheme_type)
+            assert codec.decode(data) == CallbackData(SHOW_SCHEME, color_name, scheme_type)
+
+
+def test_encoded_data_is_compact(circle, codec):
+    longest = max(
+        len(codec.encode(SHOW_SCHEME, color_name, scheme_type).encode('utf-8'))
+        for color_name in circle.get_all_colors_list()
+        for scheme_type in circle.schemes
+    )
+    assert longest <= MAX_CALLBACK_BYTES
+
+
+def test_format(codec):
+    # Основной цвет без номера - оттенок 0
+    assert codec.encode(PICK_COLOR, 'red') == f"{CALLBACK_VERSION}{PICK_COLOR}:0.0"
+    assert re.match(CallbackCodec.pattern(SHOW_SCHEME), codec.encode(SHOW_SCHEME, 'blue_3', 'triad'))
+
+
+@pytest.mark.parametrize('data', [
+    # Кнопки старого формата обрабатываются отдельными обработчиками бота
+    'color_red', 'new_scheme_blue_3', 'scheme_red_triad', 'scheme_color_red', 'shades_red', 'main_menu',
+    # Другая версия формата
+    '0c:0.0', '2s:8.3.1',
+    # Неверные данные
+    '1x:0.0', '1c:', '1c:0', '1c:a.b', '1c:99.0', '1c:0.9', '1s:0.0.99', '1c:-1.0', '',
+])
+def test_decode_rejects_foreign_data(codec, data):
+    assert codec.decode(data) is None
+
+
+@pytest.mark.parametrize('data', ['color_red', 'new_scheme_red', 'scheme_red_triad', 'shades_red'])
+def test_patterns_do_not_match_legacy_buttons(data):
+    for action in ACTIONS:
+        assert not re.match(CallbackCodec.pattern(action), data)
+
+
+def test_encode_rejects_unknown_input(codec):
+    with pytest.raises(ValueError):
+        codec.encode('z', 'red')
+    with pytest.raises(ValueError):
+        codec.encode(PICK_COLOR, 'no_such_color')
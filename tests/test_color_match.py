@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from color_match import NearestColorIndex, delta_e_2000, parse_color, rgb_to_lab
+
+# Тестовые пары CIEDE2000 из статьи Sharma, Wu, Dalal (2005), таблица 1:
+# (Lab 1, Lab 2, ΔE2000)
+SHARMA_PAIRS = [
+    ((50.0000, 2.6772, -79.7751), (50.0000, 0.0000, -82.7485), 2.0425),
+    ((50.0000, 3.1571, -77.2803), (50.0000, 0.0000, -82.7485), 2.8615),
+    ((50.0000, 2.8361, -74.0200), (50.0000, 0.0000, -82.7485), 3.4412),
+    ((50.0000, -1.3802, -84.2814), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -1.1848, -84.8006), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -0.9009, -85.5211), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, 0.0000, 0.0000), (50.0000, -1.0000, 2.0000), 2.3669),
+    ((50.0000, -1.0000, 2.0000), (50.0000, 0.0000, 0.0000), 2.3669),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0009), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0010), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0011), 7.2195),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0012), 7.2195),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0009, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0010, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0011, -2.4900), 4.7461),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 0.0000, -2.5000), 4.3065),
+    ((50.0000, 2.5000, 0.0000), (73.0000, 25.0000, -18.0000), 27.1492),
+    ((50.0000, 2.5000, 0.0000), (61.0000, -5.0000, 29.0000), 22.8977),
+    ((50.0000, 2.5000, 0.0000), (56.0000, -27.0000, -3.0000), 31.9030),
+    ((50.0000, 2.5000, 0.0000), (58.0000, 24.0000, 15.0000), 19.4535),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.1736, 0.5854), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2972, 0.0000), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 1.8634, 0.5757), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2592, 0.3350), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((63.0109, -31.0961, -5.8663), (62.8187, -29.7946, -4.0864), 1.2630),
+    ((61.2901, 3.7196, -5.3901), (61.4292, 2.2480, -4.9620), 1.8731),
+    ((35.0831, -44.1164, 3.7933), (35.0232, -40.0716, 1.5901), 1.8645),
+    ((22.7233, 20.0904, -46.6940), (23.0331, 14.9730, -42.5619), 2.0373),
+    ((36.4612, 47.8580, 18.3852), (36.2715, 50.5065, 21.2231), 1.4146),
+    ((90.8027, -2.0831, 1.4410), (91.1528, -1.6435, 0.0447), 1.4441),
+    ((90.9257, -0.5406, -0.9208), (88.6381, -0.8985, -0.7239), 1.5381),
+    ((6.7747, -0.2908, -2.4247), (5.8714, -0.0985, -2.2286), 0.6377),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+
+@pytest.mark.parametrize('lab1, lab2, expected', SHARMA_PAIRS)
+def test_delta_e_2000_sharma_pairs(lab1, lab2, expected):
+    assert float(delta_e_2000(lab1, lab2)) == pytest.approx(expected, abs=1e-4)
+    # Метрика симметрична
+    assert float(delta_e_2000(lab2, lab1)) == pytest.approx(expected, abs=1e-4)
+
+
+def test_delta_e_2000_vectorized():
+    lab1 = np.array([pair[0] for pair in SHARMA_PAIRS])
+    lab2 = np.array([pair[1] for pair in SHARMA_PAIRS])
+    expected = np.array([pair[2] for pair in SHARMA_PAIRS])
+    np.testing.assert_allclose(delta_e_2000(lab1, lab2), expected, atol=1e-4)
+
+
+def test_rgb_to_lab_reference_points():
+    np.testing.assert_allclose(rgb_to_lab((255, 255, 255)), (100, 0, 0), atol=1e-2)
+    np.testing.assert_allclose(rgb_to_lab((0, 0, 0)), (0, 0, 0), atol=1e-6)
+    np.testing.assert_allclose(rgb_to_lab((255, 0, 0)), (53.24, 80.09, 67.20), atol=1e-2)
+
+
+@pytest.mark.parametrize('text, rgb', [
+    ('#3A7BD5', (58, 123, 213)),
+    ('3a7bd5', (58, 123, 213)),
+    ('#facade', (250, 202, 222)),
+    ('#abc', (170, 187, 204)),
+    ('rgb(58, 123, 213)', (58, 123, 213)),
+    ('58 123 213', (58, 123, 213)),
+    ('58,123,213', (58, 123, 213)),
+    ('hsv(0, 100%, 100%)', (255, 0, 0)),
+    ('hsv(120°, 100%, 50%)', (0, 128, 0)),
+    ('hsv(360, 0%, 100%)', (255, 255, 255)),
+])
+def test_parse_color(text, rgb):
+    assert parse_color(text) == rgb
+
+
+@pytest.mark.parametrize('text', [
+    'red', 'facade', 'decade', 'bedded', 'FACADE', '#12345', '#ggg', '256 0 0', '1 2', '1 2 3 4', 'rgb(-1, 0, 0)', 'hsv(0, 101%, 50%)', '',
+])
+def test_parse_color_rejects(text):
+    assert parse_color(text) is None
+
+
+def test_nearest_color_index(circle):
+    index = NearestColorIndex.from_circle(circle)
+    record = circle.get_color_info('blue_3')
+    name, distance = index.nearest(tuple(record.rgb))[0]
+    assert name == 'blue_3'
+    assert distance == pytest.approx(0, abs=1e-9)
+
+    matches = index.nearest((250, 5, 5), 3)
+    assert len(matches) == 3
+    assert [delta for _, delta in matches] == sorted(delta for _, delta in matches)
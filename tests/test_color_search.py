@@ -0,0 +1,96 @@
+import pytest
+
+from color_search import TOP_K, ColorSearchIndex, _edit_distance, _trigrams
+
+
+@pytest.fixture(scope='module')
+def index(circle):
+    return ColorSearchIndex(circle)
+
+
+@pytest.mark.parametrize('text, name', [
+    ('red', 'red'),
+    (' Red-Orange ', 'red_orange'),
+    ('blue_3', 'blue_3'),
+    ('Красный', 'red'),
+    ('красный_2', 'red_2'),
+    ('синий 3', 'blue_3'),
+    ('Зелёный', 'green'),
+    ('светло-серый', 'light_gray'),
+])
+def test_lookup(index, text, name):
+    assert index.lookup(text) == name
+
+
+def test_lookup_unknown(index):
+    assert index.lookup('bleu') is None
+    assert index.lookup('') is None
+
+
+def test_complete_prefix(index):
+    assert index.complete('blu')[:2] == ['blue', 'blue_1']
+    assert index.complete('xyz') == []
+
+
+def test_complete_word_inside_name(index):
+    # Совпадение с начала имени идет раньше совпадения со второго слова
+    results = index.complete('orange')
+    assert results[0] == 'orange'
+    assert 'red_orange' in results
+    assert results.index('orange_5') < results.index('red_orange')
+
+
+def test_complete_limit(index):
+    assert len(index.complete('r', limit=3)) == 3
+    assert len(index.complete('r')) <= TOP_K
+
+
+@pytest.mark.parametrize('text, name', [
+    ('yelow', 'yellow'),
+    ('grren', 'green'),
+    ('vilet', 'violet'),
+    ('зелный', 'green'),
+])
+def test_fuzzy_typos(index, text, name):
+    assert index.fuzzy(text)[0] == name
+
+
+def test_fuzzy_distance_limit(index):
+    # Для коротких запросов допускается одна правка, перестановка букв - это две
+    assert index.fuzzy('bleu') == []
+    assert index.fuzzy('') == []
+
+
+def test_search_prefers_exact_then_prefix(index):
+    assert index.search('gray') == ['gray', 'dark_gray', 'light_gray']
+    assert index.search('ora')[0] == 'orange'
+    # Опечатки - только когда префикс ничего не нашел
+    assert index.search('yelow') == ['yellow']
+    assert index.search('   ') == []
+
+
+def test_trigrams():
+    assert _trigrams('red') == {'^re', 'red', 'ed$'}
+
+
+@pytest.mark.parametrize('a, b, distance', [
+    ('red', 'red', 0),
+    ('red', 'rad', 1),
+    ('yelow', 'yellow', 1),
+    ('grren', 'green', 1),
+    ('bleu', 'blue', 2),
+    ('', 'abc', 3),
+    ('kitten', 'sitting', 3),
+])
+def test_edit_distance(a, b, distance):
+    assert _edit_distance(a, b, max_distance=10) == distance
+
+
+@pytest.mark.parametrize('a, b', [
+    ('kitten', 'sitting'),
+    ('red', 'violet'),
+    ('a', 'abcdef'),
+])
+def test_edit_distance_is_bounded(a, b):
+    # Больше порога - всегда max_distance + 1, без точного подсчета
+    assert _edit_distance(a, b, max_distance=1) == 2
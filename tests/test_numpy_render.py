@@ -0,0 +1,48 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import new_circle
+from render_cache import RenderCache
+
+# Масштабы с дробными границами ячеек: на них расходятся округления двух способов отрисовки
+SCALES = [0.11, 0.37, 0.5, 1.0, 1.33, 2.0, 3.41]
+
+
+@pytest.fixture(scope='module')
+def drawers(circle):
+    """{рендерер: draw(backend, scale)} для всех рендереров с отрисовкой на NumPy"""
+    scheme = circle.get_scheme('blue', 'triad')
+    shades = circle.get_all_shades('blue')
+    assert scheme and shades
+    return {
+        'color_palette': lambda backend, scale: circle._draw_color_palette(scheme, backend, scale=scale),
+        'shades_palette': lambda backend, scale: circle._draw_shades_palette(shades, backend, scale),
+        'extended_palette': lambda backend, scale: circle._draw_extended_palette(backend, scale),
+    }
+
+
+@pytest.mark.parametrize('scale', SCALES)
+@pytest.mark.parametrize('renderer', ['color_palette', 'shades_palette', 'extended_palette'])
+def test_numpy_draw_matches_pil(drawers, renderer, scale):
+    pil = drawers[renderer]('pil', scale)
+    fast = drawers[renderer]('numpy', scale)
+
+    assert fast.size == pil.size
+    assert fast.mode == pil.mode
+    assert np.array_equal(np.asarray(fast), np.asarray(pil))
+
+
+@pytest.mark.parametrize('size', [None, 200, 1600])
+def test_numpy_encoded_output_matches_pil(size):
+    # Свой кэш на каждый способ: иначе второй вызов вернул бы байты первого
+    pil_circle = new_circle(render_cache=RenderCache())
+    numpy_circle = new_circle(render_cache=RenderCache())
+
+    pil = pil_circle.create_extended_palette_image('pil', size)
+    fast = numpy_circle.create_extended_palette_image('numpy', size)
+
+    decoded = [np.asarray(Image.open(io.BytesIO(data)).convert('RGB')) for data in (pil, fast)]
+    assert np.array_equal(*decoded)
@@ -0,0 +1,18 @@
+import pytest
+
+from conftest import new_circle
+from render_cache import RenderCache
+
+
+@pytest.mark.parametrize('size', [None, 300])
+def test_batch_matches_single_palettes(size):
+    circle = new_circle(render_cache=RenderCache())
+    palettes = list(circle.get_all_schemes('blue').values())
+    assert palettes
+
+    batch = circle.create_palette_batch(palettes, size=size)
+    single = [circle.create_color_palette_image(colors, '', size=size) for colors in palettes]
+
+    assert batch == single
+    # Вторые вызовы берут те же ключи кэша: размер входит в ключ
+    assert circle.render_cache.stats()['hits'] == len(palettes)
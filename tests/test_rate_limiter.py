@@ -0,0 +1,192 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+from rate_limiter import (
+    PRIORITY_MEDIA, PRIORITY_TEXT, PRIORITY_URGENT, OutboundRateLimiter, TokenBucket,
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(rate=2, burst=3, now=0.0)
+    for _ in range(3):
+        assert bucket.delay(0.0) == 0
+        bucket.take(0.0)
+    # Пустое ведро: следующий токен через 1 / rate
+    assert bucket.delay(0.0) == pytest.approx(0.5)
+    assert bucket.delay(0.5) == pytest.approx(0.0)
+    # Больше burst не накапливается
+    assert bucket.delay(100.0) == 0
+    assert bucket.tokens == 3
+    assert bucket.idle(100.0)
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=10, burst=10, now=0.0)
+    bucket.pause(5.0)
+    assert bucket.delay(1.0) == pytest.approx(4.0)
+    assert not bucket.idle(1.0)
+    # Более ранняя пауза не сокращает текущую
+    bucket.pause(2.0)
+    assert bucket.delay(1.0) == pytest.approx(4.0)
+    assert bucket.delay(5.0) == 0
+
+
+def test_priority():
+    assert OutboundRateLimiter.priority('answerCallbackQuery') == PRIORITY_URGENT
+    assert OutboundRateLimiter.priority('sendMessage') == PRIORITY_TEXT
+    assert OutboundRateLimiter.priority('sendPhoto') == PRIORITY_MEDIA
+
+
+async def _send(limiter, log, endpoint, chat_id, label=None, result=True):
+    async def callback():
+        log.append(label if label is not None else (endpoint, chat_id))
+        return result
+    return await limiter.process_request(callback, (), {}, endpoint, {'chat_id': chat_id}, None)
+
+
+def test_higher_priority_goes_first():
+    async def scenario():
+        # Общее ведро на один запрос: остальные ждут в очереди и выходят по приоритету
+        limiter = OutboundRateLimiter(global_rate=50, global_burst=1)
+        await limiter.initialize()
+        log = []
+        first = asyncio.create_task(_send(limiter, log, 'sendMessage', 1, 'first'))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(_send(limiter, log, 'sendPhoto', 2, 'media')),
+            asyncio.create_task(_send(limiter, log, 'sendMessage', 3, 'text')),
+            asyncio.create_task(_send(limiter, log, 'answerCallbackQuery', 4, 'urgent')),
+        ]
+        await asyncio.gather(first, *tasks)
+        await limiter.shutdown()
+        return log
+
+    assert run(scenario()) == ['first', 'urgent', 'text', 'media']
+
+
+def test_chat_limit_does_not_block_other_chats():
+    async def scenario():
+        limiter = OutboundRateLimiter(chat_rate=1, chat_burst=1)
+        await limiter.initialize()
+        log = []
+        tasks = [asyncio.create_task(_send(limiter, log, 'sendMessage', 1, ('busy', i))) for i in range(2)]
+        tasks += [asyncio.create_task(_send(limiter, log, 'sendMessage', chat_id, chat_id)) for chat_id in (2, 3)]
+        done, pending = await asyncio.wait(tasks, timeout=0.3)
+        queued = limiter.stats()['queued']['text']
+        await limiter.shutdown()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return log, queued
+
+    log, queued = run(scenario())
+    # Второй запрос чата 1 ждет токена, чаты 2 и 3 отправлены без ожидания
+    assert log == [('busy', 0), 2, 3]
+    assert queued == 1
+
+
+def test_requests_of_one_chat_keep_order():
+    async def scenario():
+        limiter = OutboundRateLimiter(chat_rate=200, chat_burst=2, group_rate=200, group_burst=2)
+        await limiter.initialize()
+        log = []
+        await asyncio.gather(*(
+            _send(limiter, log, 'sendMessage', chat_id, (chat_id, i))
+            for i in range(6) for chat_id in (1, -100, '@channel')
+        ))
+        await limiter.shutdown()
+        return log
+
+    log = run(scenario())
+    for chat_id in (1, -100, '@channel'):
+        assert [i for chat, i in log if chat == chat_id] == list(range(6))
+
+
+def test_retry_after_pauses_chat_and_retries():
+    async def scenario():
+        limiter = OutboundRateLimiter(jitter=0)
+        await limiter.initialize()
+        attempts = []
+
+        async def callback():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(0.2)
+            return 'sent'
+
+        result = await limiter.process_request(callback, (), {}, 'sendMessage', {'chat_id': 5}, None)
+        stats = limiter.stats()
+        await limiter.shutdown()
+        return result, attempts, stats
+
+    result, attempts, stats = run(scenario())
+    assert result == 'sent'
+    assert attempts[1] - attempts[0] >= 0.19
+    assert stats['retried'] == 1
+    assert stats['sent'] == 1
+
+
+def test_retry_after_gives_up():
+    calls = []
+    stats = {}
+
+    async def scenario():
+        limiter = OutboundRateLimiter(jitter=0)
+        await limiter.initialize()
+
+        async def callback():
+            calls.append(1)
+            raise RetryAfter(0.01)
+
+        try:
+            # rate_limit_args - число повторов для запроса
+            await limiter.process_request(callback, (), {}, 'sendMessage', {'chat_id': 5}, 2)
+        finally:
+            stats.update(limiter.stats())
+            await limiter.shutdown()
+
+    with pytest.raises(RetryAfter):
+        run(scenario())
+    assert len(calls) == 3
+    assert stats['retried'] == 2
+    assert stats['failed'] == 1
+
+
+def test_cancelled_request_leaves_queue():
+    async def scenario():
+        limiter = OutboundRateLimiter(chat_rate=10, chat_burst=1)
+        await limiter.initialize()
+        log = []
+        await _send(limiter, log, 'sendMessage', 1)
+        waiting = asyncio.create_task(_send(limiter, log, 'sendMessage', 1, 'cancelled'))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        # Другой чат отправляется, отмененный запрос не отправляется никогда
+        await _send(limiter, log, 'sendMessage', 2, 'other')
+        # Токен чата 1 за это время восстанавливается
+        await asyncio.sleep(0.15)
+        await limiter.shutdown()
+        return log
+
+    assert run(scenario()) == [('sendMessage', 1), 'other']
+
+
+def test_shutdown_cancels_queued_requests():
+    async def scenario():
+        limiter = OutboundRateLimiter(chat_rate=0.1, chat_burst=1)
+        await limiter.initialize()
+        log = []
+        await _send(limiter, log, 'sendMessage', 1)
+        waiting = asyncio.create_task(_send(limiter, log, 'sendMessage', 1))
+        await asyncio.sleep(0.01)
+        await limiter.shutdown()
+        return await asyncio.gather(waiting, return_exceptions=True)
+
+    (result,) = run(scenario())
+    assert isinstance(result, asyncio.CancelledError)
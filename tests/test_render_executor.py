@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from render_executor import RenderExecutor, RenderQueueFull
+
+
+def blocking_job(gate, started=None):
+    """Задача пула, которая держит место до открытия gate"""
+    if started is not None:
+        started.release()
+    gate.wait(5)
+    return 'done'
+
+
+def make_executor(circle, **kwargs):
+    kwargs.setdefault('workers', 4)
+    return RenderExecutor(circle, **kwargs)
+
+
+def test_queue_limits_jobs_in_flight(circle):
+    executor = make_executor(circle, max_queue=2, queue_timeout=None)
+    gate = threading.Event()
+    started = threading.Semaphore(0)
+
+    async def scenario():
+        tasks = [asyncio.create_task(executor.run(blocking_job, gate, started)) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        # Третья задача ждет места и в пул не попала
+        assert executor.pending == 2
+        assert executor.submitted == 2
+        gate.set()
+        return await asyncio.gather(*tasks)
+
+    try:
+        assert asyncio.run(scenario()) == ['done'] * 3
+    finally:
+        gate.set()
+        executor.shutdown()
+    assert executor.submitted == 3
+    assert executor.pending == 0
+
+
+def test_full_queue_rejects_after_timeout(circle):
+    executor = make_executor(circle, max_queue=1, queue_timeout=0.05)
+    gate = threading.Event()
+
+    async def scenario():
+        busy = asyncio.create_task(executor.run(blocking_job, gate))
+        await asyncio.sleep(0.05)
+        with pytest.raises(RenderQueueFull):
+            await executor.run(blocking_job, gate)
+        gate.set()
+        return await busy
+
+    try:
+        assert asyncio.run(scenario()) == 'done'
+    finally:
+        gate.set()
+        executor.shutdown()
+    assert executor.rejected == 1
+    assert executor.submitted == 1
+
+
+def test_background_render_waits_without_timeout(circle):
+    executor = make_executor(circle, max_queue=1, queue_timeout=0.01)
+    gate = threading.Event()
+
+    async def scenario():
+        busy = asyncio.create_task(executor.run(blocking_job, gate))
+        await asyncio.sleep(0.05)
+        warm = asyncio.create_task(executor.render('get_all_schemes', 'blue', background=True))
+        await asyncio.sleep(0.1)
+        assert not warm.done()
+        gate.set()
+        await busy
+        return await warm
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        gate.set()
+        executor.shutdown()
+    assert executor.rejected == 0
+
+
+def test_cancelled_wait_keeps_slot_until_job_finishes(circle):
+    executor = make_executor(circle, max_queue=1, queue_timeout=None)
+    gate = threading.Event()
+    started = threading.Semaphore(0)
+
+    async def scenario():
+        task = asyncio.create_task(executor.run(blocking_job, gate, started))
+        await asyncio.to_thread(started.acquire)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Поток еще работает - место не освобождено
+        assert executor.pending == 1
+        assert executor._slots.locked()
+
+        gate.set()
+        deadline = time.monotonic() + 2
+        while executor.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        assert executor.pending == 0
+        assert not executor._slots.locked()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        gate.set()
+        executor.shutdown()
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def chat_update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_updates_of_one_chat_keep_order():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(4)
+        log = []
+
+        async def handle(chat_id, number):
+            # Поздние обновления обрабатываются быстрее - порядок держит только очередь чата
+            await asyncio.sleep(0.01 * (5 - number))
+            log.append((chat_id, number))
+
+        await asyncio.gather(*(
+            processor.process_update(chat_update(chat_id), handle(chat_id, number))
+            for number in range(5) for chat_id in (1, 2)
+        ))
+        return log, processor.stats()
+
+    log, stats = run(scenario())
+    for chat_id in (1, 2):
+        assert [number for chat, number in log if chat == chat_id] == list(range(5))
+    assert stats['processed'] == 10
+    assert stats['chats'] == 0
+
+
+def test_busy_chat_does_not_hold_other_chats():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(2)
+        start = time.perf_counter()
+        finished = {}
+
+        async def handle(name, duration):
+            await asyncio.sleep(duration)
+            finished[name] = time.perf_counter() - start
+
+        tasks = [
+            asyncio.create_task(processor.process_update(chat_update(1), handle(f"A{number}", 0.2)))
+            for number in range(3)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(chat_update(2), handle('B', 0.01))))
+        await asyncio.gather(*tasks)
+        return finished
+
+    finished = run(scenario())
+    # Ожидающие обновления чата A не занимают общих слотов
+    assert finished['B'] < 0.1
+    assert finished['A0'] < finished['A1'] < finished['A2']
+
+
+def test_concurrency_limit():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(3)
+        active = peak = 0
+
+        async def handle():
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+        await asyncio.gather(*(processor.process_update(chat_update(chat_id), handle()) for chat_id in range(10)))
+        return peak
+
+    assert run(scenario()) == 3
+
+
+def test_cancelled_update_passes_turn():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(2)
+        log = []
+
+        async def handle(name, duration=0.0):
+            await asyncio.sleep(duration)
+            log.append(name)
+
+        first = asyncio.create_task(processor.process_update(chat_update(1), handle('first', 0.05)))
+        await asyncio.sleep(0)
+        skipped = handle('second')
+        second = asyncio.create_task(processor.process_update(chat_update(1), skipped))
+        third = asyncio.create_task(processor.process_update(chat_update(1), handle('third')))
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.gather(first, second, third, return_exceptions=True)
+        # Корутина отмененного обновления так и не запускалась
+        skipped.close()
+        return log, processor.stats()
+
+    log, stats = run(scenario())
+    assert log == ['first', 'third']
+    assert stats['chats'] == 0
+    assert stats['waiting'] == 0
+
+
+def test_rejects_non_positive_limit():
+    with pytest.raises(ValueError):
+        ChatOrderedUpdateProcessor(0)
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import pytest
+
+from user_state import MemoryStateBackend, SqliteStateBackend, UserStateStore
+
+
+class CountingBackend(MemoryStateBackend):
+    """Хранилище в памяти, которое запоминает пачки записи"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def save_many(self, rows):
+        self.batches.append(dict(rows))
+        super().save_many(rows)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_set_is_visible_before_flush():
+    backend = CountingBackend()
+    store = UserStateStore(backend, flush_interval=60)
+
+    async def scenario():
+        await store.set(1, 'base_color', 'blue')
+        return await store.get(1, 'base_color'), await store.get(2, 'base_color', 'red')
+
+    assert run(scenario()) == ('blue', 'red')
+    assert backend.batches == []
+
+
+def test_flush_writes_one_batch():
+    backend = CountingBackend()
+    store = UserStateStore(backend, flush_interval=60)
+
+    async def scenario():
+        for user_id in range(5):
+            await store.set(user_id, 'base_color', 'green')
+        await store.set(0, 'base_color', 'violet')
+
+    run(scenario())
+    assert store.flush() == 5
+    assert len(backend.batches) == 1
+    assert backend.load(0)[0] == {'base_color': 'violet'}
+
+    # Повторный сброс без изменений ничего не пишет
+    assert store.flush() == 0
+    assert len(backend.batches) == 1
+    assert store.stats()['written'] == 5
+
+
+def test_flush_keeps_changes_on_error():
+    class FailingBackend(MemoryStateBackend):
+        def save_many(self, rows):
+            raise OSError('disk full')
+
+    store = UserStateStore(FailingBackend(), flush_interval=60)
+    run(store.set(1, 'base_color', 'red'))
+    with pytest.raises(OSError):
+        store.flush()
+    assert store.stats()['pending'] == 1
+    assert run(store.get(1, 'base_color')) == 'red'
+
+
+def test_expired_session_is_ignored_and_deleted():
+    backend = CountingBackend()
+    now = time.time()
+    backend.save_many({
+        1: ({'base_color': 'blue'}, now - 120),
+        2: ({'base_color': 'green'}, now),
+    })
+    store = UserStateStore(backend, flush_interval=60, ttl=60)
+
+    assert run(store.get(1, 'base_color', 'red')) == 'red'
+    assert run(store.get(2, 'base_color', 'red')) == 'green'
+
+    store.flush()
+    assert backend.load(1) is None
+    assert backend.load(2) is not None
+    assert store.stats()['expired'] == 1
+
+
+def test_set_after_expiry_starts_new_session():
+    backend = CountingBackend()
+    backend.save_many({1: ({'base_color': 'blue', 'other': 1}, time.time() - 120)})
+    store = UserStateStore(backend, flush_interval=60, ttl=60)
+
+    run(store.set(1, 'base_color', 'green'))
+    store.flush()
+    assert backend.load(1)[0] == {'base_color': 'green'}
+
+
+def test_background_flush_and_stop():
+    backend = CountingBackend()
+    store = UserStateStore(backend, flush_interval=0.01)
+
+    async def scenario():
+        await store.start()
+        await store.set(1, 'base_color', 'blue')
+        await asyncio.sleep(0.1)
+        flushed = len(backend.batches)
+        await store.set(2, 'base_color', 'red')
+        await store.stop()
+        return flushed
+
+    assert run(scenario()) >= 1
+    # Остаток записывается при остановке
+    assert backend.load(2)[0] == {'base_color': 'red'}
+
+
+def test_sqlite_backend(tmp_path):
+    filename = str(tmp_path / 'state.sqlite3')
+    store = UserStateStore(SqliteStateBackend(filename), flush_interval=60)
+
+    async def write():
+        await store.set(7, 'base_color', 'yellow_2')
+        await store.stop()
+
+    run(write())
+
+    # Другой процесс бота видит записанное состояние
+    reader = UserStateStore(SqliteStateBackend(filename), flush_interval=60)
+    assert run(reader.get(7, 'base_color')) == 'yellow_2'
+    reader.backend.close()
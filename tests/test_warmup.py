@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from conftest import new_circle
+from render_cache import RenderCache
+from render_executor import RenderExecutor
+from warmup import enumerate_render_jobs, warm_up
+
+
+@pytest.mark.parametrize('mode', ['thread', 'process'])
+def test_warm_up_counts_one_miss_per_image(mode):
+    circle = new_circle(render_cache=RenderCache())
+    executor = RenderExecutor(circle, mode=mode, workers=2)
+    try:
+        total, rendered = asyncio.run(warm_up(executor, circle))
+    finally:
+        executor.shutdown()
+
+    assert total == rendered == len(enumerate_render_jobs(circle))
+    stats = circle.render_cache.stats()
+    assert stats['misses'] == rendered
+    assert stats['hits'] == 0
+    assert stats['items'] == total
+
+
+def test_second_warm_up_renders_nothing():
+    circle = new_circle(render_cache=RenderCache())
+    executor = RenderExecutor(circle, workers=2)
+    try:
+        asyncio.run(warm_up(executor, circle))
+        misses = circle.render_cache.stats()['misses']
+        total, rendered = asyncio.run(warm_up(executor, circle))
+    finally:
+        executor.shutdown()
+
+    assert rendered == 0
+    assert circle.render_cache.stats()['misses'] == misses
+
+
+def test_warmed_images_are_not_evicted():
+    # Лимит меньше набора: на время прогрева вытеснение отключено, затем лимит поднимается
+    circle = new_circle(render_cache=RenderCache(max_bytes=1024))
+    executor = RenderExecutor(circle, workers=2)
+    try:
+        total, _ = asyncio.run(warm_up(executor, circle))
+    finally:
+        executor.shutdown()
+
+    stats = circle.render_cache.stats()
+    assert stats['items'] == total
+    assert stats['max_bytes'] >= stats['bytes']
@@ -0,0 +1,78 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+from telegram import Bot, Update
+
+from webhook_server import SECRET_HEADER, WebhookServer
+
+SECRET = 'test-secret'
+
+# Обновление в том виде, в каком его присылает Telegram
+RECORDED_UPDATE = {
+    'update_id': 100500,
+    'message': {
+        'message_id': 7,
+        'date': 1700000000,
+        'chat': {'id': 42, 'type': 'private', 'first_name': 'Test'},
+        'from': {'id': 42, 'is_bot': False, 'first_name': 'Test'},
+        'text': '/scheme',
+        'entities': [{'offset': 0, 'length': 7, 'type': 'bot_command'}],
+    },
+}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def post_update(secret, path='/webhook', body=None):
+    application = SimpleNamespace(bot=Bot('1:test'), update_queue=asyncio.Queue())
+    server = WebhookServer(application, port=0, secret_token=SECRET)
+    await server.start()
+    port = server._server.sockets[0].getsockname()[1]
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"http://127.0.0.1:{port}{path}",
+                content=body if body is not None else json.dumps(RECORDED_UPDATE),
+                headers=headers,
+            )
+    finally:
+        await server.stop()
+
+    queued = []
+    while not application.update_queue.empty():
+        queued.append(application.update_queue.get_nowait())
+    return response.status_code, queued, server.stats()
+
+
+def test_wrong_secret_is_rejected():
+    status, queued, stats = run(post_update('wrong-secret'))
+    assert status == 403
+    assert queued == []
+    assert stats == {'received': 0, 'rejected': 1}
+
+
+def test_missing_secret_is_rejected():
+    status, queued, _ = run(post_update(None))
+    assert status == 403
+    assert queued == []
+
+
+def test_right_secret_is_accepted():
+    status, queued, stats = run(post_update(SECRET))
+    assert status == 200
+    assert stats == {'received': 1, 'rejected': 0}
+    (update,) = queued
+    assert isinstance(update, Update)
+    assert update.update_id == RECORDED_UPDATE['update_id']
+    assert update.message.text == '/scheme'
+    assert update.effective_chat.id == 42
+
+
+def test_invalid_payload_and_path():
+    assert run(post_update(SECRET, body=b'not json'))[0] == 400
+    assert run(post_update(SECRET, path='/other'))[0] == 404
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from telegram.ext import BaseUpdateProcessor
+
+# Лимит для семафора базового класса: он занимает слот до do_process_update,
+# то есть и на время ожидания очереди чата. Настоящий лимит - свой семафор
+_BASE_LIMIT = 2 ** 31 - 1
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных чатов со строгим порядком внутри одного чата"""
+
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        super().__init__(_BASE_LIMIT)
+        self.limit = max_concurrent_updates
+        # Слот берется, только когда подошла очередь чата: занятый чат не держит чужие слоты
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        # Хвост очереди чата: id чата -> future последнего поступившего обновления
+        self._chats = {}
+
+        # Статистика
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @staticmethod
+    def chat_key(update):
+        """Ключ упорядочивания: чат, а для обновлений без чата (inline-запросы) - пользователь"""
+        if update.effective_chat is not None:
+            return ('chat', update.effective_chat.id)
+        if update.effective_user is not None:
+            return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        """Обработать обновление после завершения предыдущего обновления того же чата
+
+        Обновление встает в цепочку своего чата за предыдущим и только потом
+        ждет общего слота (не больше limit одновременных обновлений).
+        """
+        key = self.chat_key(update) if hasattr(update, 'effective_chat') else None
+        queued_at = time.perf_counter()
+
+        previous = None
+        done = None
+        if key is not None:
+            previous = self._chats.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._chats[key] = done
+
+        self.waiting += 1
+        try:
+            if previous is not None:
+                # wait, а не await: отмена ожидающего не должна отменять предыдущее звено цепочки
+                await asyncio.wait((previous,))
+            await self._slots.acquire()
+        except BaseException:
+            self.waiting -= 1
+            self._leave_chat(key, done, previous)
+            raise
+
+        wait = time.perf_counter() - queued_at
+        self.waiting -= 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.in_flight += 1
+        try:
+            await coroutine
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+            self._slots.release()
+            self._leave_chat(key, done, None)
+
+    def _leave_chat(self, key, done, previous):
+        # Отмененное в ожидании обновление передает очередь, только когда дождется предыдущего
+        if done is None:
+            return
+        if previous is not None and not previous.done():
+            previous.add_done_callback(lambda _: self._leave_chat(key, done, None))
+            return
+        done.set_result(None)
+        # Хвост удаляется, когда за ним никто не встал
+        if self._chats.get(key) is done:
+            del self._chats[key]
+
+    async def initialize(self):
+        """Ресурсов для инициализации нет"""
+
+    async def shutdown(self):
+        """Ресурсов для освобождения нет"""
+
+    def stats(self):
+        """Статистика обработки обновлений"""
+        started = self.processed + self.in_flight
+        return {
+            'max_concurrent_updates': self.limit,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'chats': len(self._chats),
+            'processed': self.processed,
+            'avg_wait': self.total_wait / started if started else 0.0,
+            'max_wait': self.max_wait,
+        }
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+
+class MemoryStateBackend:
+    """Хранилище состояния пользователей в памяти процесса (для разработки и одной реплики)"""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        """Получить (данные, время обновления) или None"""
+        with self._lock:
+            row = self._rows.get(user_id)
+            return (dict(row[0]), row[1]) if row else None
+
+    def save_many(self, rows):
+        """Сохранить пачку записей {user_id: (данные, время обновления)}"""
+        with self._lock:
+            for user_id, (data, updated) in rows.items():
+                self._rows[user_id] = (dict(data), updated)
+
+    def delete_expired(self, cutoff):
+        """Удалить сессии, не обновлявшиеся с момента cutoff; вернуть их число"""
+        with self._lock:
+            expired = [user_id for user_id, (_, updated) in self._rows.items() if updated < cutoff]
+            for user_id in expired:
+                del self._rows[user_id]
+            return len(expired)
+
+    def close(self):
+        """Ресурсов для освобождения нет"""
+
+
+class SqliteStateBackend:
+    """Хранилище состояния пользователей в SQLite (общий файл для нескольких процессов бота)"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, timeout=10, check_same_thread=False)
+        with self._lock, self._conn:
+            # WAL позволяет читать, пока другой процесс пишет
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS user_state ('
+                'user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS user_state_updated ON user_state (updated)')
+
+    def load(self, user_id):
+        """Получить (данные, время обновления) или None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, updated FROM user_state WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save_many(self, rows):
+        """Сохранить пачку записей {user_id: (данные, время обновления)} одной транзакцией"""
+        params = [
+            (user_id, json.dumps(data, ensure_ascii=False), updated)
+            for user_id, (data, updated) in rows.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO user_state (user_id, data, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated = excluded.updated',
+                params
+            )
+
+    def delete_expired(self, cutoff):
+        """Удалить сессии, не обновлявшиеся с момента cutoff; вернуть их число"""
+        with self._lock, self._conn:
+            return self._conn.execute('DELETE FROM user_state WHERE updated < ?', (cutoff,)).rowcount
+
+    def close(self):
+        """Закрыть соединение с базой"""
+        with self._lock:
+            self._conn.close()
+
+
+class UserStateStore:
+    """Состояние пользователей (выбранный цвет и т.п.) с отложенной пакетной записью в хранилище"""
+
+    def __init__(self, backend, flush_interval=1.0, ttl=24 * 60 * 60):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        # Изменения, еще не записанные в хранилище: user_id -> (данные, время обновления)
+        self._pending = {}
+        # Изменения, которые записываются прямо сейчас (видны чтению до конца записи)
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+        # Статистика
+        self.flushes = 0
+        self.written = 0
+        self.expired = 0
+
+    async def get(self, user_id, key, default=None):
+        """Получить значение из сессии пользователя"""
+        data = await self._load(user_id)
+        return data.get(key, default) if data is not None else default
+
+    async def set(self, user_id, key, value):
+        """Записать значение в сессию пользователя (в хранилище попадет при следующем сбросе)"""
+        data = await self._load(user_id) or {}
+        data[key] = value
+        with self._lock:
+            self._pending[user_id] = (data, time.time())
+
+    async def _load(self, user_id):
+        with self._lock:
+            row = self._pending.get(user_id) or self._flushing.get(user_id)
+        if row is None:
+            # Запрос к хранилищу - в потоке: SQLite может ждать блокировку записи
+            # (сброс в другом потоке или процессе), цикл событий ждать не должен
+            row = await asyncio.to_thread(self.backend.load, user_id)
+        if row is None:
+            return None
+
+        data, updated = row
+        # Сессия, простоявшая дольше ttl, считается завершенной
+        if self.ttl and updated < time.time() - self.ttl:
+            return None
+        return dict(data)
+
+    def flush(self):
+        """Записать накопленные изменения одной пачкой и удалить просроченные сессии"""
+        with self._lock:
+            rows, self._pending = self._pending, {}
+            self._flushing = rows
+
+        if rows:
+            try:
+                self.backend.save_many(rows)
+            except Exception:
+                # Не теряем изменения - вернем их в очередь, если их не перезаписали
+                with self._lock:
+                    for user_id, row in rows.items():
+                        self._pending.setdefault(user_id, row)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            self.written += len(rows)
+
+        if self.ttl:
+            self.expired += self.backend.delete_expired(time.time() - self.ttl)
+        self.flushes += 1
+        return len(rows)
+
+    async def start(self):
+        """Запустить периодический сброс изменений"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановить периодический сброс, записать остаток и закрыть хранилище"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await asyncio.to_thread(self.flush)
+        self.backend.close()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Ошибка записи состояния пользователей: {e}")
+
+    def stats(self):
+        """Статистика хранилища состояния"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'backend': type(self.backend).__name__,
+            'pending': pending,
+            'flushes': self.flushes,
+            'written': self.written,
+            'expired': self.expired,
+        }
@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+from color_circle import IttenColorCircle
+from image_encoders import ImageEncoders, DEFAULT_ENCODER
+from render_cache import RenderCache
+from render_executor import RenderExecutor
+
+MANIFEST_NAME = 'manifest.json'
+
+# Запас памяти кэша сверх прогретых изображений (версии для печати, фото пользователей) -
+# доля от настроенного лимита
+CACHE_HEADROOM = 0.25
+
+
+@contextmanager
+def hold_all(cache):
+    """Не вытеснять записи кэша внутри блока, а после него поднять лимит до занятого с запасом
+
+    Иначе при наборе больше лимита LRU вытесняет только что прогретые изображения
+    """
+    limit = cache.max_bytes
+    cache.resize(math.inf)
+    try:
+        yield
+    finally:
+        cache.resize(max(limit, cache.stats()['bytes'] + int(limit * CACHE_HEADROOM)))
+
+
+def enumerate_render_jobs(circle):
+    """Все изображения, которые может запросить бот: {ключ: (метод, аргументы...)}"""
+    jobs = {
+        circle.image_key('itten_circle'): ('create_itten_circle_image',),
+        circle.image_key('extended_palette'): ('create_extended_palette_image',),
+    }
+
+    for base_color in circle.main_colors:
+        shades = circle.get_all_shades(base_color)
+        jobs[circle.image_key('shades_palette', shades)] = ('create_shades_palette', base_color)
+
+    # Схемы для всех цветов; одинаковые палитры отрисовываются один раз
+    for color_name in circle.get_all_colors_list():
+        for scheme_type, scheme_name in circle.schemes.items():
+            scheme_colors = circle.get_scheme(color_name, scheme_type)
+            if not scheme_colors:
+                continue
+            key = circle.image_key('color_palette', scheme_colors)
+            jobs.setdefault(key, ('create_color_palette_image', scheme_colors, scheme_name))
+        # Лист со всеми схемами цвета ("Все схемы сразу")
+        jobs.setdefault(circle.scheme_sheet_key(color_name), ('create_scheme_sheet', color_name))
+
+    return jobs
+
+
+async def warm_up(executor, circle):
+    """Отрендерить все изображения параллельно (результат попадает в кэш)"""
+    jobs = enumerate_render_jobs(circle)
+    # Проверка наличия не считается промахом кэша
+    missing = {key: args for key, args in jobs.items() if not circle.render_cache.contains(key)}
+
+    with hold_all(circle.render_cache):
+        await asyncio.gather(*(
+            executor.render(*args, key=key, background=True) for key, args in missing.items()
+        ))
+    return len(jobs), len(missing)
+
+
+def load_bundle(cache, bundle_dir, colors_digest):
+    """Загрузить готовый набор изображений в кэш (если он собран для тех же colors.json)"""
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Набор изображений не загружен: {e}")
+        return 0
+
+    if manifest.get('colors_digest') != colors_digest:
+        print("Набор изображений собран для другого colors.json - пропускаем")
+        return 0
+
+    loaded = 0
+    with hold_all(cache):
+        for key, filename in manifest.get('images', {}).items():
+            try:
+                with open(os.path.join(bundle_dir, filename), 'rb') as f:
+                    cache.put(key, f.read())
+                loaded += 1
+            except OSError as e:
+                print(f"Ошибка чтения {filename}: {e}")
+    return loaded
+
+
+async def build_bundle(bundle_dir, workers, encoders=None):
+    """Собрать набор всех изображений в каталог bundle_dir"""
+    # Каталог набора имеет ту же структуру, что и дисковый кэш.
+    # Кодировщики должны совпадать с настройкой бота - они входят в ключи изображений
+    circle = IttenColorCircle(render_cache=RenderCache(disk_dir=bundle_dir), encoders=encoders)
+    executor = RenderExecutor(circle, mode='process', workers=workers, max_queue=workers * 4)
+
+    try:
+        total, _ = await warm_up(executor, circle)
+    finally:
+        executor.shutdown()
+
+    images = {}
+    for key in enumerate_render_jobs(circle):
+        # Расширение файла зависит от кодировщика рендерера
+        images[key] = os.path.relpath(circle.render_cache.disk_path(key), bundle_dir)
+
+    manifest = {
+        'colors_digest': circle.colors_digest,
+        'created': int(time.time()),
+        'images': images,
+    }
+    with open(os.path.join(bundle_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return total
+
+
+def main():
+    """Сборка набора изображений из командной строки"""
+    parser = argparse.ArgumentParser(description="Предварительный рендеринг всех изображений бота")
+    parser.add_argument('--out', default='render_bundle', help="Каталог для набора изображений")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="Число процессов")
+    parser.add_argument('--encoders', default=os.getenv('IMAGE_ENCODERS'),
+                        help="Кодировщики по рендерерам, как IMAGE_ENCODERS")
+    parser.add_argument('--default-encoder', default=os.getenv('IMAGE_ENCODER_DEFAULT', DEFAULT_ENCODER),
+                        help="Кодировщик по умолчанию, как IMAGE_ENCODER_DEFAULT")
+    args = parser.parse_args()
+
+    encoders = ImageEncoders.from_string(args.encoders, default=args.default_encoder)
+    start = time.perf_counter()
+    total = asyncio.run(build_bundle(args.out, args.workers, encoders))
+    elapsed = time.perf_counter() - start
+    print(f"Готово: {total} изображений в {args.out} за {elapsed:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
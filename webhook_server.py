@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import urllib.error
+import urllib.request
+
+from telegram import Update
+
+from http_util import keep_alive, read_request
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+MAX_BODY_BYTES = 1024 * 1024
+READ_TIMEOUT = 30
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+}
+
+
+class WebhookServer:
+    """Встроенный HTTP-сервер для приема обновлений Telegram (режим webhook)"""
+
+    def __init__(self, application, listen='127.0.0.1', port=8080, url_path='webhook', secret_token=None):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.url_path = '/' + url_path.strip('/')
+        self.secret_token = secret_token
+        self._server = None
+
+        # Статистика запросов
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Начать прием соединений"""
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+
+    async def stop(self):
+        """Остановить сервер"""
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    def stats(self):
+        """Статистика сервера"""
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+        }
+
+    async def _handle_connection(self, reader, writer):
+        # Telegram держит соединение открытым (keep-alive) и шлет обновления по одному
+        try:
+            while True:
+                # Тело больше MAX_BODY_BYTES не читается - соединение после ответа закрывается
+                request = await asyncio.wait_for(read_request(reader, MAX_BODY_BYTES), READ_TIMEOUT)
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                status = await self._dispatch(method, path, headers, body)
+                self._write_response(writer, status, keep_alive(headers))
+                await writer.drain()
+
+                if not keep_alive(headers):
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError:
+            # Некорректный HTTP-запрос
+            self._write_response(writer, 400, keep_alive=False)
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, headers, body):
+        """Обработать запрос и вернуть HTTP-статус"""
+        path = path.split('?', 1)[0]
+
+        # Проверка живости для балансировщика
+        if path == '/healthz' and method == 'GET':
+            return 200
+
+        if path != self.url_path:
+            return 404
+        if method != 'POST':
+            return 405
+
+        if self.secret_token is not None:
+            received_token = headers.get(SECRET_HEADER, '')
+            if not hmac.compare_digest(received_token.encode('utf-8'), self.secret_token.encode('utf-8')):
+                self.rejected += 1
+                logger.warning("Webhook request with invalid secret token rejected")
+                return 403
+
+        if body is None:
+            self.rejected += 1
+            return 413
+
+        try:
+            data = json.loads(body.decode('utf-8'))
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            self.rejected += 1
+            logger.warning(f"Invalid webhook payload: {e}")
+            return 400
+        if update is None:
+            self.rejected += 1
+            return 400
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return 200
+
+    @staticmethod
+    def _write_response(writer, status, keep_alive):
+        body = STATUS_TEXT[status].encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+
+
+def post_updates(url, filenames, secret_token=None):
+    """Отправить записанные обновления (JSON-объект или список) на локальный webhook"""
+    sent = 0
+    for filename in filenames:
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        for update in data if isinstance(data, list) else [data]:
+            request = urllib.request.Request(
+                url,
+                data=json.dumps(update).encode('utf-8'),
+                headers={'Content-Type': 'application/json'},
+                method='POST'
+            )
+            if secret_token:
+                request.add_header(SECRET_HEADER, secret_token)
+
+            try:
+                with urllib.request.urlopen(request) as response:
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            print(f"{filename}: update {update.get('update_id')} -> {status}")
+            sent += 1
+    return sent
+
+
+def main():
+    """Отправка записанных обновлений на webhook из командной строки (для проверки без Telegram)"""
+    parser = argparse.ArgumentParser(description="Отправить записанные обновления Telegram на локальный webhook")
+    parser.add_argument('files', nargs='+', help="JSON-файлы с обновлениями")
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook', help="Адрес webhook")
+    parser.add_argument('--secret', default=None, help="Секретный токен webhook")
+    args = parser.parse_args()
+
+    sent = post_updates(args.url, args.files, args.secret)
+    print(f"Отправлено обновлений: {sent}")
+
+
+if __name__ == '__main__':
+    main()